@@ -1,4 +1,5 @@
 from datetime import timedelta, datetime, timezone
+import threading
 
 import flask
 import requests
@@ -22,8 +23,11 @@ from api.utils.url_util import proxied_url
 import ast
 import socket # For socket.timeout
 from xml.parsers.expat import ExpatError # For XML parsing errors
+from cachetools import LRUCache, TTLCache
 from api.models.role import Role
 from api.utils.security_utils import AuthenticationError, ExternalServiceError
+from api.utils.edl_token_refresher import EdlTokenRefresher
+from api.utils.shared_cache import get_cache_backend
 
 
 try:
@@ -40,11 +44,18 @@ MEMBER_STATUS_ACTIVE = "active"
 MEMBER_STATUS_SUSPENDED = "suspended"
 EDL_BROKER_ALIAS = "edl"
 
-# Refresh the stored EDL (URS) access token this long before it expires.
+# Refresh the stored EDL (URS) access token on the request path when it is this
+# close to expiring; the background refresher normally renews it well before.
 EDL_TOKEN_REFRESH_BUFFER = timedelta(minutes=5)
-# Per-process cache of EDL access-token expirations, keyed by member id, used to
-# avoid calling the Keycloak broker endpoint on every authenticated request.
-_edl_token_expiration_cache = {}
+
+# Parsed RSA key used to decrypt proxy tickets; loaded once per process.
+_proxy_decryption_key = None
+# Bounded per-process cache of encrypted proxy ticket -> decrypted PGT.
+_decrypted_ticket_cache = LRUCache(maxsize=settings.CAS_PROXY_TICKET_CACHE_SIZE)
+# Proxy tickets CAS rejected, remembered briefly so replays don't reach CAS again.
+_rejected_ticket_cache = TTLCache(maxsize=settings.CAS_REJECTED_TICKET_CACHE_SIZE,
+                                  ttl=settings.CAS_REJECTED_TICKET_TTL_SECONDS)
+_proxy_ticket_cache_lock = threading.Lock()
 
 def validate(service, ticket):
     """
@@ -114,6 +125,13 @@ def validate_proxy(ticket, auto_create_member=False):
     pgt_token_duration_in_days = 60
 
     current_app.logger.debug("validating token {0}".format(ticket))
+
+    with _proxy_ticket_cache_lock:
+        is_rejected = ticket in _rejected_ticket_cache
+    if is_rejected:
+        current_app.logger.debug("proxy granting ticket previously rejected by CAS")
+        return None
+
     decrypted_ticket = decrypt_proxy_ticket(ticket)
     cas_session = db.session.query(MemberSession).filter_by(session_key=decrypted_ticket).first()
 
@@ -147,6 +165,8 @@ def validate_proxy(ticket, auto_create_member=False):
                 return start_member_session(cas_proxy_response, decrypted_ticket, auto_create_member)
 
     current_app.logger.debug("invalid proxy granting ticket")
+    with _proxy_ticket_cache_lock:
+        _rejected_ticket_cache[ticket] = True
     return None
 
 
@@ -328,7 +348,7 @@ def start_member_session_jwt(decoded_jwt, token_string, auto_create_member=False
             raise
 
     if member is not None:
-        refresh_urs_token(member, token_string)
+        refresh_urs_token(member, token_string, decoded_jwt.get("exp"))
 
     try:
         query = """INSERT INTO member_session (member_id, session_key, creation_date)
@@ -343,31 +363,25 @@ def start_member_session_jwt(decoded_jwt, token_string, auto_create_member=False
     return member
 
 
-def refresh_urs_token(member, kc_access_token):
+def refresh_urs_token(member, kc_access_token, kc_token_expiration=None):
     """Refresh member.urs_token from the Keycloak EDL broker endpoint when it is
-    missing or close to expiring. Expirations are cached per-process by member id,
-    so the broker is not called on every authenticated request. Failures are logged
-    and leave the existing token in place — they must not break authentication."""
+    missing or close to expiring. The member is registered with the background
+    refresher, which renews tokens ahead of expiry while the Keycloak token is
+    unexpired (``kc_token_expiration`` is its ``exp`` claim), so the broker is
+    normally not called on the request path. Failures are logged and leave the existing token
+    in place — they must not break authentication."""
     now = datetime.now(timezone.utc)
-    cached_expiration = _edl_token_expiration_cache.get(member.id)
-    if member.urs_token and cached_expiration is not None \
-            and now < cached_expiration - EDL_TOKEN_REFRESH_BUFFER:
+    edl_token_refresher.track(current_app._get_current_object(), member.id, kc_access_token,
+                              kc_token_expiration)
+    expiration = edl_token_refresher.get_expiration(member.id)
+    if member.urs_token and expiration is not None \
+            and now < expiration - EDL_TOKEN_REFRESH_BUFFER:
         return
 
-    broker_token = fetch_edl_broker_token(kc_access_token)
-    if not broker_token:
-        return
-
-    new_token = broker_token.get("access_token")
+    new_token = edl_token_refresher.refresh(member.id, kc_access_token)
     if not new_token:
         return
 
-    # Prefer the absolute expiration epoch; fall back to expires_in if absent.
-    if broker_token.get("accessTokenExpiration") is not None:
-        _edl_token_expiration_cache[member.id] = datetime.fromtimestamp(broker_token["accessTokenExpiration"], timezone.utc)
-    elif broker_token.get("expires_in") is not None:
-        _edl_token_expiration_cache[member.id] = now + timedelta(seconds=int(broker_token["expires_in"]))
-
     if new_token != member.urs_token:
         member.urs_token = new_token
         try:
@@ -377,6 +391,20 @@ def refresh_urs_token(member, kc_access_token):
             current_app.logger.exception(f"Failed to persist refreshed URS token for {member.username}")
 
 
+def persist_urs_token(member_id, urs_token):
+    """Store a token renewed by the background refresher on the member record."""
+    member = db.session.get(Member, member_id)
+    if member is None or member.urs_token == urs_token:
+        return
+
+    member.urs_token = urs_token
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception(f"Failed to persist refreshed URS token for {member.username}")
+
+
 def fetch_edl_broker_token(kc_access_token):
     """Retrieve the user's stored EarthData Login token set from the Keycloak
     identity-provider broker endpoint. Returns the parsed JSON, or None on failure."""
@@ -397,6 +425,17 @@ def fetch_edl_broker_token(kc_access_token):
         return None
 
 
+edl_token_refresher = EdlTokenRefresher(
+    fetch=lambda kc_access_token: fetch_edl_broker_token(kc_access_token),
+    persist=lambda member_id, urs_token: persist_urs_token(member_id, urs_token),
+    max_members=settings.EDL_TOKEN_REFRESHER_MAX_MEMBERS,
+    refresh_ahead=timedelta(seconds=settings.EDL_TOKEN_REFRESH_AHEAD_SECONDS),
+    interval_seconds=settings.EDL_TOKEN_REFRESHER_INTERVAL_SECONDS,
+    wait_timeout_seconds=settings.REQUESTS_TIMEOUT_SECONDS,
+    enabled=settings.EDL_TOKEN_REFRESHER_ENABLED,
+    expirations=get_cache_backend('edl-token-expiration', settings.EDL_TOKEN_REFRESHER_MAX_MEMBERS))
+
+
 def get_cas_attribute_value(attributes, attribute_key):
 
     if attributes and "cas:" + attribute_key in attributes:
@@ -405,18 +444,43 @@ def get_cas_attribute_value(attributes, attribute_key):
         return ''
 
 
+def load_proxy_decryption_key():
+    """Parse settings.CAS_PROXY_DECRYPTION_TOKEN into an RSA key, once per process."""
+    global _proxy_decryption_key
+    if _proxy_decryption_key is None:
+        _proxy_decryption_key = RSA.import_key(settings.CAS_PROXY_DECRYPTION_TOKEN)
+    return _proxy_decryption_key
+
+
+def clear_proxy_ticket_caches():
+    """Drop the parsed decryption key and all cached proxy-ticket results."""
+    global _proxy_decryption_key
+    with _proxy_ticket_cache_lock:
+        _proxy_decryption_key = None
+        _decrypted_ticket_cache.clear()
+        _rejected_ticket_cache.clear()
+
+
 def decrypt_proxy_ticket(ticket):
     if ticket.startswith(PROXY_TICKET_PREFIX) or ticket.startswith(JWT_TOKEN_PREFIX):
         return ticket
-    else:
-        try:
-            key = RSA.import_key(settings.CAS_PROXY_DECRYPTION_TOKEN)
-            dsize = SHA.digest_size
-            sentinel = Random.new().read(15 + dsize)
-            decryptor = PKCS1_v1_5.new(key)
-            decrypted = decryptor.decrypt(ast.literal_eval(str(b64decode(ticket))), sentinel)
-
-            return decrypted.decode("utf-8")
-        except:
-            current_app.logger.debug("invalid proxy granting ticket")
-            return ''
\ No newline at end of file
+
+    with _proxy_ticket_cache_lock:
+        cached_ticket = _decrypted_ticket_cache.get(ticket)
+    if cached_ticket is not None:
+        return cached_ticket
+
+    try:
+        key = load_proxy_decryption_key()
+        dsize = SHA.digest_size
+        sentinel = Random.new().read(15 + dsize)
+        decryptor = PKCS1_v1_5.new(key)
+        decrypted = decryptor.decrypt(ast.literal_eval(str(b64decode(ticket))), sentinel)
+        decrypted_ticket = decrypted.decode("utf-8")
+    except:
+        current_app.logger.debug("invalid proxy granting ticket")
+        return ''
+
+    with _proxy_ticket_cache_lock:
+        _decrypted_ticket_cache[ticket] = decrypted_ticket
+    return decrypted_ticket
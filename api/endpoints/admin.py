@@ -15,6 +15,10 @@ from api.utils import job_queue
 from api.utils import s3_access
 from api.utils.http_util import err_response
 from api.models.organization_s3_access import OrganizationS3Access
+from api import settings
+from api.endpoints.wmts import tile_cache, tile_seed_jobs, start_tile_seed
+from api.endpoints.wmts_collections import default_collections
+from api.utils.tile_seeder import count_tiles
 
 log = logging.getLogger(__name__)
 ns = api.namespace('admin', description='Operations related to the MAAP admin')
@@ -296,3 +300,110 @@ class S3AccessEntry(Resource):
         s3_access.delete_s3_access(access_id)
 
         return {"code": status.HTTP_200_OK, "message": "Successfully deleted S3 access entry {}.".format(access_id)}
+
+
+@ns.route('/wmts-tile-cache')
+class WmtsTileCacheCls(Resource):
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def get(self):
+        """
+        WMTS tile cache metrics, summed over the API workers: hits per tier, misses, hit ratio and the size of each tier
+        """
+        return tile_cache.stats()
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def delete(self):
+        """
+        Empty the WMTS tile cache (both tiers) and reset its metrics; other workers empty
+        their memory tier within a few seconds
+        """
+        tile_cache.clear()
+        return {"code": status.HTTP_200_OK, "message": "Successfully cleared the WMTS tile cache."}
+
+
+@ns.route('/wmts-tile-seeds')
+class WmtsTileSeedsCls(Resource):
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def get(self):
+        """
+        Lists recent WMTS tile seeding jobs and their progress
+        """
+        return tile_seed_jobs.list()
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def post(self):
+        """
+        Start warming the WMTS tile cache for a layer over a bbox and zoom range.
+
+        The layer is given as in GetTile (urls, granule_urs or short_name and version),
+        along with bbox [west, south, east, north], min_zoom, max_zoom and optionally
+        color_map, rescale and ext. Tiles already cached are skipped.
+        """
+        req_data = request.get_json()
+        if not isinstance(req_data, dict):
+            return err_response("Valid JSON body object required.")
+
+        urls = req_data.get("urls")
+        granule_urs = req_data.get("granule_urs")
+        short_name = req_data.get("short_name")
+        version = req_data.get("version")
+        if not (granule_urs or urls or (short_name and version)):
+            return err_response("One of urls, granule_urs or short_name and version is required.")
+        if not (granule_urs or urls) and short_name not in default_collections:
+            return err_response(f"Unknown collection {short_name}.")
+
+        bbox = req_data.get("bbox")
+        if not (isinstance(bbox, list) and len(bbox) == 4 and all(isinstance(v, (int, float)) for v in bbox)) \
+                or not (-180 <= bbox[0] < bbox[2] <= 180 and -90 <= bbox[1] < bbox[3] <= 90):
+            return err_response("Valid bbox [west, south, east, north] is required.")
+
+        min_zoom = req_data.get("min_zoom", 0)
+        max_zoom = req_data.get("max_zoom")
+        if not isinstance(min_zoom, int) or not isinstance(max_zoom, int) or not 0 <= min_zoom <= max_zoom <= 24:
+            return err_response("Valid min_zoom and max_zoom (0-24) are required.")
+
+        total = count_tiles(bbox, min_zoom, max_zoom)
+        if total > settings.WMTS_SEED_MAX_TILES:
+            return err_response(f"Seeding {total} tiles exceeds the limit of {settings.WMTS_SEED_MAX_TILES}.")
+
+        try:
+            job = start_tile_seed(bbox, min_zoom, max_zoom, urls=urls, granule_urs=granule_urs,
+                                  short_name=short_name, color_map=req_data.get("color_map"),
+                                  rescale=req_data.get("rescale"), ext=req_data.get("ext") or 'png')
+        except AssertionError as e:
+            return err_response(str(e))
+
+        return job.to_dict(), status.HTTP_202_ACCEPTED
+
+
+@ns.route('/wmts-tile-seeds/<string:job_id>')
+class WmtsTileSeedCls(Resource):
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def get(self, job_id):
+        """
+        Progress of a WMTS tile seeding job
+        """
+        job = tile_seed_jobs.get(job_id)
+        if job is None:
+            return err_response(f"Tile seeding job {job_id} not found.", status.HTTP_404_NOT_FOUND)
+        return job
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required(role=Role.ROLE_ADMIN)
+    def delete(self, job_id):
+        """
+        Cancel a WMTS tile seeding job; tiles already seeded stay cached. A job running
+        in another worker stops after its current batch of tiles.
+        """
+        job = tile_seed_jobs.cancel(job_id)
+        if job is None:
+            return err_response(f"Tile seeding job {job_id} not found.", status.HTTP_404_NOT_FOUND)
+        return job
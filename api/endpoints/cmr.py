@@ -1,11 +1,15 @@
+import itertools
+from http import cookiejar
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 import os
+import time
 import requests
 import shapefile
 from api import settings
+from io import BytesIO
 from zipfile import ZipFile
-import tempfile
-from flask import request, json, Response, stream_with_context
+from flask import request, json, Response, stream_with_context, has_request_context
 from flask_restx import Resource
 from flask_api import status
 from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, ServiceUnavailable
@@ -15,6 +19,8 @@ from api.maap_database import db
 from api.models.member import Member
 from urllib import parse
 from api.utils.security_utils import validate_shapefile_upload, sanitize_filename, InvalidFileTypeError, FileSizeTooLargeError, InvalidRequestError
+from api.utils.geometry import shape_polygons, format_polygon
+from api.utils.response_cache import ResponseCache, CachedResponse, CACHE_MISS
 import zipfile # Already imported, ensure it's available for specific exceptions
 import shapefile as shp_validator # Alias to avoid confusion if shapefile is also a var name
 
@@ -27,6 +33,40 @@ log = logging.getLogger(__name__)
 
 ns = api.namespace('cmr', description='Operations related to CMR')
 
+# CMR response headers forwarded to clients by the search proxies
+PASSTHROUGH_HEADERS = ['Content-Type', 'CMR-Hits', 'CMR-Took', 'CMR-Request-Id', 'CMR-Search-After']
+
+# Deep paging output formats
+OUTPUT_FORMAT_JSON = 'json'
+OUTPUT_FORMAT_NDJSON = 'ndjson'
+CMR_MAX_PAGE_SIZE = 2000
+SHAPEFILE_GEOMETRY_BBOX = 'bbox'
+SHAPEFILE_GEOMETRY_POLYGON = 'polygon'
+
+# Keep-alive connections to CMR reused across requests and pages
+cmr_session = requests.Session()
+cmr_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=settings.CMR_CONNECTION_POOL_SIZE))
+
+# Keep-alive connections to DAACs for the granule data proxy. Per-user credentials
+# are passed per request, and the session keeps no cookies: DAAC/EDL auth cookies
+# set during one user's download must not be sent with anyone else's requests.
+# Cookies still follow the redirects of a single request.
+granule_data_session = requests.Session()
+granule_data_session.cookies.set_policy(cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+granule_data_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=settings.CMR_CONNECTION_POOL_SIZE))
+GRANULE_DATA_REQUEST_HEADERS = ['Range', 'If-Range']
+GRANULE_DATA_RESPONSE_HEADERS = ['Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified', 'Content-Disposition']
+
+# Shared by the collection and granule search proxies; see req()
+cmr_search_cache = ResponseCache(max_bytes=settings.CMR_SEARCH_CACHE_MAX_BYTES,
+                                 ttl_seconds=settings.CMR_SEARCH_CACHE_TTL_SECONDS,
+                                 stale_seconds=settings.CMR_SEARCH_CACHE_STALE_SECONDS,
+                                 max_entry_bytes=settings.CMR_SEARCH_CACHE_MAX_ENTRY_BYTES)
+
+# Queries the hosts of a federated search concurrently; see federated_search()
+federated_search_executor = ThreadPoolExecutor(max_workers=settings.CMR_FEDERATED_MAX_WORKERS,
+                                               thread_name_prefix='cmr-federated-search')
+
 
 @ns.route('/collections')
 class CmrCollection(Resource):
@@ -46,12 +86,13 @@ class CmrCollection(Resource):
             Find collections by bounding box
             https://api.dit.maap-project.org/api/cmr/collections?bounding_box=-35.4375,-55.6875,-80.4375,37.6875
 
+            Search several CMR hosts at once (results merged by concept id)
+            https://api.dit.maap-project.org/api/cmr/collections?keyword=GEDI&cmr_hosts=cmr.maap-project.org,cmr.earthdata.nasa.gov
+
         For a comprehensive list of collection search examples, see: https://cmr.earthdata.nasa.gov/search/site/docs/search/api.html#collection-search-by-parameters
         """
 
-        resp = req(request.query_string, 'collections')
-
-        return respond(resp)
+        return search(request.query_string, 'collections')
 
 
 @ns.route('/collections/shapefile')
@@ -61,6 +102,9 @@ class ShapefileUpload(Resource):
         """
         CMR collections search by shape file
             File input expected: .zip including .shp, .dbf, and .shx file
+            geometry: bbox (search by the shapefile's bounding box) or polygon (search by its polygons,
+            simplified to CMR_SHAPEFILE_MAX_POLYGON_POINTS vertices each; falls back to bbox for
+            non-polygon shapefiles)
         """
         if 'file' not in request.files:
             log.error('Shapefile upload attempt with no file')
@@ -72,75 +116,47 @@ class ShapefileUpload(Resource):
         # in case logs or temporary file creation uses it.
         _ = sanitize_filename(f.filename) # Result not directly used, but good to run
 
-        temp_dir = None # For extracting files if needed by shapefile.Reader with paths
-        dst_path = None
+        geometry = request.values.get('geometry', settings.CMR_SHAPEFILE_GEOMETRY).lower()
+        if geometry not in (SHAPEFILE_GEOMETRY_BBOX, SHAPEFILE_GEOMETRY_POLYGON):
+            raise BadRequest(f"geometry must be '{SHAPEFILE_GEOMETRY_BBOX}' or '{SHAPEFILE_GEOMETRY_POLYGON}'.")
 
         try:
             # Validate the uploaded file (type, size, content)
             # The validate_shapefile_upload function handles ZIP checks, member presence, and size limits.
-            # It expects a file-like object, so f (FileStorage) is fine.
             validate_shapefile_upload(
                 f,
                 settings.MAX_SHAPEFILE_ZIP_SIZE_BYTES,
                 settings.MAX_SHAPEFILE_UNCOMPRESSED_SIZE_BYTES
             )
-            # f.seek(0) should be handled by validate_shapefile_upload if it reads the file
-
-            # The shapefile.Reader can often read from file-like objects directly from the zip.
-            # To do this robustly, we might need to extract to a temporary location if Reader
-            # doesn't handle in-memory zip file members well for all its needs (e.g. .dbf, .shx access).
-            # Let's try with a temporary file for the ZIP first.
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_zip_file:
-                f.save(tmp_zip_file) # Save FileStorage to a temporary file path
-                dst_path = tmp_zip_file.name
-
-            # Now use the path with ZipFile and shapefile.Reader
-            # This ensures shapefile.Reader can access related files (.shx, .dbf) correctly.
-            with ZipFile(dst_path, 'r') as zf:
-                shp_filename = None
-                # Find the .shp file, assuming one primary shapefile per ZIP for this use case
-                for member_name in zf.namelist():
-                    if member_name.lower().endswith('.shp'):
-                        shp_filename = member_name
-                        break
 
+            # The archive is size-limited above, so read it straight from the upload stream
+            # instead of round-tripping it through a temporary file.
+            with ZipFile(BytesIO(f.read()), 'r') as zf:
+                # Single case-insensitive index of the archive members
+                members = {name.lower(): name for name in zf.namelist()}
+
+                # Assume one primary shapefile per ZIP for this use case
+                shp_filename = next((name for name in members if name.endswith('.shp')), None)
                 if not shp_filename:
                     # This should have been caught by validate_shapefile_upload if it checks namelist
                     raise InvalidFileTypeError("No .shp file found in the archive.")
 
-                # shapefile.Reader needs to access .shp, .shx, .dbf.
-                # It can take BytesIO for shp, shx, dbf.
-                # Let's extract them to BytesIO objects.
-                shp_io = None
-                shx_io = None
-                dbf_io = None
-
-                # Construct expected .shx and .dbf names from .shp name
                 base_name, _ = os.path.splitext(shp_filename)
-                shx_expected_name = base_name + ".shx"
-                dbf_expected_name = base_name + ".dbf"
-
-                # Search for case-insensitive matches in the zip file
-                for member_name_in_zip in zf.namelist():
-                    if member_name_in_zip.lower() == shp_filename.lower():
-                         shp_io = zf.open(member_name_in_zip)
-                    elif member_name_in_zip.lower() == shx_expected_name.lower():
-                         shx_io = zf.open(member_name_in_zip)
-                    elif member_name_in_zip.lower() == dbf_expected_name.lower():
-                         dbf_io = zf.open(member_name_in_zip)
-
-                if not all([shp_io, shx_io, dbf_io]):
-                    # This should also be caught by validate_shapefile_upload
+                components = [members.get(base_name + ext) for ext in ('.shp', '.shx', '.dbf')]
+                if not all(components):
                     raise InvalidFileTypeError("Required shapefile components (.shp, .shx, .dbf) not found or accessible with the same base name.")
 
-                r = shp_validator.Reader(shp=shp_io, shx=shx_io, dbf=dbf_io)
-                bbox = ','.join(map(str, r.bbox))
+                shp_io, shx_io, dbf_io = (BytesIO(zf.read(name)) for name in components)
 
-                # Close BytesIO objects
-                if shp_io: shp_io.close()
-                if shx_io: shx_io.close()
-                if dbf_io: dbf_io.close()
+            r = shp_validator.Reader(shp=shp_io, shx=shx_io, dbf=dbf_io)
+            bbox = ','.join(map(str, r.bbox))
+            polygons = None
+            if geometry == SHAPEFILE_GEOMETRY_POLYGON:
+                polygons = shape_polygons(r.shapes(), settings.CMR_SHAPEFILE_MAX_POLYGON_POINTS)
+                if polygons is not None and len(polygons) > settings.CMR_SHAPEFILE_MAX_POLYGONS:
+                    polygons = None
+                if polygons is None:
+                    log.info("Shapefile geometry cannot be sent as polygons, searching by bounding box")
 
         except (InvalidFileTypeError, FileSizeTooLargeError, InvalidRequestError) as e:
             log.error(f"Shapefile upload validation failed: {e.description}")
@@ -155,14 +171,18 @@ class ShapefileUpload(Resource):
             log.error(f"Unexpected error processing shapefile: {e}")
             raise ServiceUnavailable("An unexpected error occurred while processing the shapefile.")
         finally:
-            if dst_path and os.path.exists(dst_path):
-                os.remove(dst_path) # Clean up the temporary file
             f.seek(0) # Reset original FileStorage stream just in case
 
-        # Proceed with CMR search using bbox
+        # Proceed with CMR search using the polygons when available, otherwise the bbox
         url = os.path.join(settings.CMR_URL, 'search', 'collections')
         try:
-            cmr_resp = requests.get(url, headers=get_search_headers(), params={'bounding_box': bbox}, timeout=settings.REQUESTS_TIMEOUT_SECONDS)
+            if polygons:
+                # Polygons can exceed URL length limits, so they are sent as a form body
+                params = [('polygon[]', format_polygon(ring)) for ring in polygons]
+                params.append(('options[polygon][or]', 'true'))
+                cmr_resp = cmr_session.post(url, headers=get_search_headers(), data=params, timeout=settings.REQUESTS_TIMEOUT_SECONDS)
+            else:
+                cmr_resp = cmr_session.get(url, headers=get_search_headers(), params={'bounding_box': bbox}, timeout=settings.REQUESTS_TIMEOUT_SECONDS)
             cmr_resp.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         except requests.exceptions.Timeout:
             log.error("Timeout connecting to CMR for shapefile search.")
@@ -192,13 +212,50 @@ class CmrGranules(Resource):
             Find granules by instrument
             https://api.dit.maap-project.org/api/cmr/granules?instrument=UAVSAR
 
+            Search several CMR hosts at once (results merged by concept id)
+            https://api.dit.maap-project.org/api/cmr/granules?short_name=GEDI02_A&cmr_hosts=cmr.maap-project.org,cmr.earthdata.nasa.gov
 
         For a comprehensive list of granule search examples, see: https://cmr.earthdata.nasa.gov/search/site/docs/search/api.html#granule-search-by-parameters
         """
 
-        resp = req(request.query_string, 'granules')
+        return search(request.query_string, 'granules')
+
+
+@ns.route('/collections/all')
+class CmrCollectionsAll(Resource):
+
+    def get(self):
+        """
+        All CMR collections matching a search, fetched server-side page by page
+
+            Accepts the same parameters as /cmr/collections, plus:
+            output_format: json (a single JSON array, default) or ndjson (one entry per line)
+            max_results: stop after this many entries
+
+            Example:
+            https://api.dit.maap-project.org/api/cmr/collections/all?provider=NASA_MAAP&output_format=ndjson
+        """
 
-        return respond(resp)
+        return search_all(request.query_string, 'collections')
+
+
+@ns.route('/granules/all')
+class CmrGranulesAll(Resource):
+
+    def get(self):
+        """
+        All CMR granules matching a search, fetched server-side page by page
+
+            Walks every result page with CMR-Search-After and streams the merged entries.
+            Accepts the same parameters as /cmr/granules, plus:
+            output_format: json (a single JSON array, default) or ndjson (one entry per line)
+            max_results: stop after this many entries
+
+            Example:
+            https://api.dit.maap-project.org/api/cmr/granules/all?short_name=GEDI02_A&version=002&output_format=ndjson
+        """
+
+        return search_all(request.query_string, 'granules')
 
 
 @ns.route('/granules/<string:file_uri>/data')
@@ -214,8 +271,17 @@ class CmrGranuleData(Resource):
     """
 
     def get(self, file_uri):
-        s = requests.Session()
-        response = s.get(parse.unquote(file_uri), stream=True)
+        """
+        Streams the file, forwarding Range/If-Range so clients can resume downloads
+        and read byte ranges (206 Partial Content). Pass redirect=true to receive a
+        302 to the final (signed) data URL instead of having the bytes proxied.
+        """
+        url = parse.unquote(file_uri)
+        headers = {name: request.headers[name] for name in GRANULE_DATA_REQUEST_HEADERS if name in request.headers}
+        redirect = settings.str2bool(request.args.get('redirect', str(settings.CMR_GRANULE_DATA_REDIRECT)))
+
+        response = granule_data_session.get(url, headers=headers, stream=True,
+                                            timeout=settings.REQUESTS_TIMEOUT_SECONDS)
 
         if response.status_code == 401:
             maap_user = get_authorized_user()
@@ -224,22 +290,39 @@ class CmrGranuleData(Resource):
                 return Response(response.text, status=401)
             else:
                 urs_token = db.session.query(Member).filter_by(id=maap_user.id).first().urs_token
-                s.headers.update({'Authorization': f'Bearer {urs_token},Basic {settings.MAAP_EDL_CREDS}',
-                                  'Connection': 'close'})
+                headers['Authorization'] = f'Bearer {urs_token},Basic {settings.MAAP_EDL_CREDS}'
 
-                response = s.get(url=response.url, stream=True)
+                response.close()
+                response = granule_data_session.get(url=response.url, headers=headers, stream=True,
+                                                    timeout=settings.REQUESTS_TIMEOUT_SECONDS)
 
                 if response.status_code >= 400:
                     return Response(response.text, status=response.status_code)
 
+        if redirect:
+            # response.url is the URL at the end of the redirect chain, e.g. a signed S3 URL
+            response.close()
+            return Response(status=status.HTTP_302_FOUND, headers={'Location': response.url})
+
         return Response(
-            response=stream_with_context(response.iter_content(chunk_size=1024 * 10)),
+            response=stream_with_context(iter_and_close(response, settings.CMR_GRANULE_DATA_CHUNK_BYTES)),
+            status=response.status_code,
+            headers={name: response.headers[name] for name in GRANULE_DATA_RESPONSE_HEADERS if name in response.headers},
             content_type=response.headers.get('Content-Type'),
             direct_passthrough=True)
 
 
+def iter_and_close(response, chunk_size):
+    try:
+        yield from response.iter_content(chunk_size=chunk_size)
+    finally:
+        response.close()
+
+
 def get_search_headers():
-    accept = next(iter(request.headers.getlist('accept') or ['application/json']), ['application/json'])
+    # Background jobs (e.g. cache refreshes) search without a client request
+    accept_headers = request.headers.getlist('accept') if has_request_context() else []
+    accept = next(iter(accept_headers or ['application/json']), ['application/json'])
 
     return {
             'Accept': accept,
@@ -253,9 +336,14 @@ def parse_query_string(qs):
     return urlparse.parse_qs(qs)
 
 
-def req(query_string, search_type):
+def search_cache_key(url, parms, accept):
+    """Cache key for a CMR search: target URL, Accept header and the query with
+    its keys sorted. Values keep their order since CMR treats e.g. sort_key[] positionally."""
+    return url, accept, tuple(sorted((k, tuple(v)) for k, v in parms.items()))
+
+
+def get_search_url(parms, search_type):
     url = os.path.join(settings.CMR_URL, 'search', search_type)
-    parms = parse_query_string(query_string)
 
     # If an alternate cmr_host is specified in a search request,
     # use that in place of the default config 'CMR_URL' setting.
@@ -263,16 +351,287 @@ def req(query_string, search_type):
         cmr_host = parms.pop('cmr_host'.encode('utf-8'))[0]
         url = os.path.join('https://' + cmr_host.decode('utf-8'), 'search', search_type)
 
-    return requests.get(url, headers=get_search_headers(), params=parms)
+    return url
+
+
+def req(query_string, search_type):
+    parms = parse_query_string(query_string)
+    url = get_search_url(parms, search_type)
+    headers = get_search_headers()
+
+    return cmr_search_cache.get_or_fetch(
+        search_cache_key(url, parms, headers['Accept']),
+        lambda: cmr_session.get(url, headers=headers, params=parms, timeout=settings.REQUESTS_TIMEOUT_SECONDS),
+        request.headers.get('Cache-Control'))
+
+
+def search(query_string, search_type):
+    """
+    Proxy a CMR search. Successful responses are passed through as CMR's own
+    bytes, streamed from CMR or served from the search cache, so large result
+    pages are never decoded and re-encoded. Only pages up to
+    CMR_SEARCH_STREAM_CACHE_MAX_BYTES are cached, since a page has to be held in
+    memory while it streams to be cached; large page_size searches always go to
+    CMR. Errors and empty bodies still go through respond(), which rewrites them.
+    """
+    if b'cmr_hosts' in parse_query_string(query_string):
+        return federated_search(query_string, search_type)
+
+    if not settings.CMR_SEARCH_PASSTHROUGH:
+        return respond(req(query_string, search_type))
+
+    parms = parse_query_string(query_string)
+    url = get_search_url(parms, search_type)
+    headers = get_search_headers()
+    cache_key = search_cache_key(url, parms, headers['Accept'])
+    cache_control = request.headers.get('Cache-Control')
+
+    def fetch():
+        return cmr_session.get(url, headers=headers, params=parms, stream=True,
+                               timeout=settings.REQUESTS_TIMEOUT_SECONDS)
+
+    cached = cmr_search_cache.lookup(cache_key, fetch, cache_control)
+    if cached is not None:
+        if not cached.content:
+            return respond(cached)
+        return passthrough_response([cached.content], cached)
+
+    response = fetch()
+    if response.status_code != status.HTTP_200_OK:
+        return respond(CachedResponse.from_response(response))
+
+    chunks = cmr_search_cache.stream_through(cache_key, response, settings.CMR_SEARCH_STREAM_CHUNK_BYTES, cache_control,
+                                             max_buffer_bytes=settings.CMR_SEARCH_STREAM_CACHE_MAX_BYTES)
+    first_chunk = next((chunk for chunk in chunks if chunk), None)
+    if first_chunk is None:
+        return respond(CachedResponse(response.status_code, response.headers, b''))
+
+    return passthrough_response(itertools.chain([first_chunk], chunks), response)
+
+
+def get_federated_hosts(parms):
+    """Distinct hosts from one or more (comma separated) cmr_hosts parameters, in order."""
+    hosts = []
+    for value in parms.pop(b'cmr_hosts', []):
+        for host in value.decode('utf-8').split(','):
+            host = host.strip()
+            if host and host not in hosts:
+                hosts.append(host)
+    return hosts
+
+
+def get_concept_id(entry):
+    """Concept id of a CMR JSON entry or UMM JSON item."""
+    if 'meta' in entry:
+        return entry['meta'].get('concept-id')
+    return entry.get('id')
+
+
+def federated_search(query_string, search_type):
+    """
+    Run one CMR search against several hosts concurrently and merge the JSON
+    results, dropping entries whose concept id was already returned by an
+    earlier host. Each host's hit count, status or error is reported under
+    "hosts"; a host that fails or exceeds CMR_FEDERATED_TIMEOUT_SECONDS is
+    reported and left out rather than failing the whole search.
+    """
+    parms = parse_query_string(query_string)
+    parms.pop(b'cmr_host', None)
+    hosts = get_federated_hosts(parms)
+
+    if not hosts:
+        raise BadRequest("cmr_hosts must name at least one CMR host.")
+    if len(hosts) > settings.CMR_FEDERATED_MAX_HOSTS:
+        raise BadRequest(f"cmr_hosts accepts at most {settings.CMR_FEDERATED_MAX_HOSTS} hosts.")
+
+    headers = get_search_headers()
+    if 'json' not in headers['Accept']:
+        raise BadRequest("Federated searches require a JSON response format.")
+    cache_control = request.headers.get('Cache-Control')
+    deadline = time.monotonic() + settings.CMR_FEDERATED_TIMEOUT_SECONDS
+
+    def fetch(url):
+        # Host searches that start late, e.g. after queueing for a worker, only get
+        # what is left of the deadline, so they end about when the search gives up
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("Timed out waiting for a search worker")
+        return cmr_session.get(url, headers=headers, params=parms, timeout=remaining)
+
+    def search_host(host):
+        url = os.path.join('https://' + host, 'search', search_type)
+        return cmr_search_cache.get_or_fetch(
+            search_cache_key(url, parms, headers['Accept']),
+            lambda: fetch(url),
+            cache_control)
+
+    futures = {host: federated_search_executor.submit(search_host, host) for host in hosts}
+    wait(futures.values(), timeout=settings.CMR_FEDERATED_TIMEOUT_SECONDS)
+
+    host_results = []
+    merged = []
+    seen = set()
+    is_umm = False
+    for host, future in futures.items():
+        if not future.done():
+            host_results.append({'host': host, 'error': 'Timed out'})
+            continue
+        try:
+            response = future.result()
+            if response.status_code != status.HTTP_200_OK:
+                host_results.append({'host': host, 'status': response.status_code, 'error': response.text})
+                continue
+            page = json.loads(response.text)
+        except Exception as e:
+            log.error(f"Federated CMR search failed for {host}: {e}")
+            host_results.append({'host': host, 'error': str(e)})
+            continue
+
+        is_umm = is_umm or 'items' in page
+        hits = response.headers.get('CMR-Hits')
+        host_results.append({'host': host, 'status': response.status_code, 'hits': int(hits) if hits else None})
+        for entry in get_search_entries(page):
+            concept_id = get_concept_id(entry)
+            if concept_id is None or concept_id not in seen:
+                seen.add(concept_id)
+                merged.append(entry)
+
+    if all('error' in result for result in host_results):
+        raise ServiceUnavailable(f"All CMR hosts failed: {json.dumps(host_results)}")
+
+    if is_umm:
+        return {'hits': len(merged), 'items': merged, 'hosts': host_results}, status.HTTP_200_OK
+    return {'feed': {'entry': merged}, 'hosts': host_results}, status.HTTP_200_OK
+
+
+def search_all(query_string, search_type):
+    """
+    Walk every page of a CMR search with the CMR-Search-After header and stream
+    the merged entries as a JSON array or NDJSON. The next page is requested
+    while the current one is being written. If a later page fails the stream is
+    aborted, leaving the output incomplete rather than silently truncated.
+    """
+    parms = parse_query_string(query_string)
+    output_format = parms.pop(b'output_format', [OUTPUT_FORMAT_JSON.encode('utf-8')])[0].decode('utf-8')
+    max_results = parms.pop(b'max_results', [None])[0]
+    parms.pop(b'page_num', None)
+
+    if output_format not in (OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_NDJSON):
+        raise BadRequest(f"output_format must be '{OUTPUT_FORMAT_JSON}' or '{OUTPUT_FORMAT_NDJSON}'.")
+    try:
+        max_results = int(max_results) if max_results is not None else settings.CMR_DEEP_PAGING_MAX_RESULTS
+    except ValueError:
+        raise BadRequest("max_results must be an integer.")
+    if max_results < 0:
+        raise BadRequest("max_results must not be negative.")
+    if settings.CMR_DEEP_PAGING_MAX_RESULTS:
+        max_results = min(max_results or settings.CMR_DEEP_PAGING_MAX_RESULTS, settings.CMR_DEEP_PAGING_MAX_RESULTS)
+
+    url = get_search_url(parms, search_type)
+    headers = get_search_headers()
+    if 'json' not in headers['Accept']:
+        raise BadRequest("Searching all pages requires a JSON response format.")
+
+    page_size = CMR_MAX_PAGE_SIZE if not max_results else min(CMR_MAX_PAGE_SIZE, max_results)
+    parms[b'page_size'] = [str(page_size).encode('utf-8')]
+
+    def fetch_page(search_after):
+        page_headers = dict(headers, **({'CMR-Search-After': search_after} if search_after else {}))
+        return cmr_session.get(url, headers=page_headers, params=parms, timeout=settings.REQUESTS_TIMEOUT_SECONDS)
+
+    first_page = fetch_page(None)
+    if first_page.status_code != status.HTTP_200_OK:
+        return respond(CachedResponse.from_response(first_page))
+
+    response_headers = {'X-Cache': 'BYPASS'}
+    if 'CMR-Hits' in first_page.headers:
+        response_headers['CMR-Hits'] = first_page.headers['CMR-Hits']
+
+    return Response(
+        stream_search_pages(first_page, fetch_page, output_format, max_results),
+        content_type='application/x-ndjson' if output_format == OUTPUT_FORMAT_NDJSON else 'application/json',
+        headers=response_headers,
+        direct_passthrough=True)
+
+
+def get_search_entries(page):
+    """Entries of a CMR JSON (feed.entry) or UMM JSON (items) search page."""
+    if 'items' in page:
+        return page['items']
+    return page.get('feed', {}).get('entry', [])
+
+
+def stream_search_pages(page, fetch_page, output_format, max_results=None):
+    written = 0
+    is_ndjson = output_format == OUTPUT_FORMAT_NDJSON
+
+    if not is_ndjson:
+        yield '['
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        while page is not None:
+            entries = get_search_entries(page.json())
+            search_after = page.headers.get('CMR-Search-After')
+
+            if max_results:
+                entries = entries[:max_results - written]
+            is_last_page = not entries or not search_after or (max_results and written + len(entries) >= max_results)
+            next_page = None if is_last_page else prefetcher.submit(fetch_page, search_after)
+
+            if entries:
+                if is_ndjson:
+                    yield ''.join(json.dumps(entry) + '\n' for entry in entries)
+                else:
+                    yield (',' if written else '') + ','.join(json.dumps(entry) for entry in entries)
+                written += len(entries)
+
+            page = None
+            if next_page is not None:
+                try:
+                    page = next_page.result()
+                    page.raise_for_status()
+                except Exception as e:
+                    # Abort the stream instead of closing the output normally, so a
+                    # failed page can't pass for a complete (truncated) inventory
+                    log.error(f"CMR deep paging failed after {written} entries: {e}")
+                    raise
+
+    if not is_ndjson:
+        yield ']'
+
+
+def passthrough_response(body, response):
+    headers = {name: response.headers[name] for name in PASSTHROUGH_HEADERS if name in response.headers}
+    headers.update(get_cache_headers(response))
+    headers.setdefault('X-Cache', CACHE_MISS)
+
+    return Response(body, status=response.status_code, headers=headers, direct_passthrough=True)
+
+
+def get_cache_headers(response):
+    """Cache-Control passed through from CMR (or derived from the cached entry's
+    remaining lifetime) and the X-Cache status of a proxied search."""
+    headers = {}
+    cache_status = getattr(response, 'cache_status', None)
+    if cache_status is not None:
+        headers['X-Cache'] = cache_status
+
+    if 'Cache-Control' in response.headers:
+        headers['Cache-Control'] = response.headers['Cache-Control']
+    elif getattr(response, 'ttl', None):
+        headers['Cache-Control'] = 'max-age={}'.format(int(max(0, response.ttl - response.age())))
+
+    return headers
 
 
 def respond(response):
     response_text = response.text if response.status_code == status.HTTP_200_OK else 'CMR Error %s' % response.text
+    headers = get_cache_headers(response)
 
     if response.text == '':
-        return {}
+        return {}, status.HTTP_200_OK, headers
     else:
         if "xml" in response.headers['content-type']:
-            return response_text, response.status_code, {'Content-Type': 'application/xml'}
+            return response_text, response.status_code, {'Content-Type': 'application/xml', **headers}
         else:
-            return json.loads(response.text)
+            return json.loads(response.text), status.HTTP_200_OK, headers
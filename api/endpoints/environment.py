@@ -8,6 +8,7 @@ import requests
 import urllib.parse
 import json
 import os
+from functools import lru_cache
 
 log = logging.getLogger(__name__)
 
@@ -64,16 +65,21 @@ def get_config_from_ade(ade_host):
 def get_config_from_api(api_host):
     return get_config(api_host, 'api_server')
 
-def get_config(host, server_type):
+@lru_cache(maxsize=1)
+def load_environments():
+    """The parsed environments.json, read once per process."""
     try:
         ROOT = os.path.dirname(os.path.abspath(__file__))
         with open(os.path.join(ROOT, "environments.json")) as f:
-            data = json.load(f)
+            return json.load(f)
     except FileNotFoundError:
         msg = "environments.json file could not be found"
         logging.exception(msg)
         raise FileNotFoundError(msg)
 
+def get_config(host, server_type):
+    data = load_environments()
+
     unquoted_host = urllib.parse.unquote(host)
     if "://" not in unquoted_host:
         unquoted_host = "https://" + unquoted_host
@@ -1,7 +1,6 @@
 import logging
-from cachetools import TLRUCache, cached
 from flask_restx import Resource, reqparse
-from flask import request, jsonify, Response, current_app as app
+from flask import request, jsonify, Response, stream_with_context, current_app as app
 from flask_api import status
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, Unauthorized, ServiceUnavailable
@@ -17,17 +16,23 @@ from api.models.member import Member as Member_db
 from api.models.member_session import MemberSession as MemberSession_db
 from api.models.member_secret import MemberSecret as MemberSecret_db
 from api.schemas.member_schema import MemberSchema
-from api.schemas.member_session_schema import MemberSessionSchema
 from api.utils.security_utils import validate_ssh_key_file, sanitize_filename, InvalidFileTypeError, FileSizeTooLargeError, EmptyFileError, ExternalServiceError
 from api.utils.email_util import send_user_status_update_active_user_email, \
     send_user_status_update_suspended_user_email, send_user_status_change_email, \
     send_welcome_to_maap_active_user_email, send_welcome_to_maap_suspended_user_email
 from api.endpoints.environment import get_config_from_api
-from api.utils.s3_access import build_user_s3_policy
+from api.utils.s3_access import get_user_s3_policy
+from api.utils import member_directory, member_profile
+from api.utils.shared_cache import get_cache_backend, cached
 from api.models.pre_approved import PreApproved
 from datetime import datetime, timezone
+import hashlib
 import json
+import threading
 import boto3
+from botocore.config import Config as BotoConfig
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from urllib import parse
 
@@ -37,37 +42,74 @@ from cryptography.fernet import Fernet
 
 log = logging.getLogger(__name__)
 ns = api.namespace('members', description='Operations for MAAP members')
-s3_client = boto3.client('s3', region_name=settings.AWS_REGION)
+s3_client = boto3.client('s3', region_name=settings.AWS_REGION,
+                         config=BotoConfig(max_pool_connections=settings.PRESIGNED_URL_MAX_WORKERS))
 sts_client = boto3.client('sts', region_name=settings.AWS_REGION)
 fernet = Fernet(settings.FERNET_KEY)
 
+# HEAD checks of batch presigned URL requests; see presign_s3_keys()
+presigned_url_executor = ThreadPoolExecutor(max_workers=settings.PRESIGNED_URL_MAX_WORKERS,
+                                            thread_name_prefix='presigned-url-head')
+# (bucket, key) of objects known to exist. Misses are never cached, so a file is
+# found as soon as it has been uploaded.
+s3_object_existence_cache = TTLCache(maxsize=settings.S3_OBJECT_EXISTENCE_CACHE_SIZE,
+                                     ttl=settings.S3_OBJECT_EXISTENCE_CACHE_TTL_SECONDS)
+s3_object_existence_lock = threading.Lock()
+
 
 @ns.route('')
 class Member(Resource):
+    directory_params = reqparse.RequestParser()
+    directory_params.add_argument('limit', type=int, required=False,
+                                  help='Page size; without it the whole directory is streamed')
+    directory_params.add_argument('cursor', type=str, required=False,
+                                  help='Username to continue after, from the X-Next-Cursor header of the previous page')
+    directory_params.add_argument('fields', type=str, required=False,
+                                  help='Comma separated fields to return, e.g. id,username,email')
+    directory_params.add_argument('q', type=str, required=False,
+                                  help='Prefix of the username, email, first or last name')
 
     @api.doc(security='ApiKeyAuth')
     @login_required()
+    @api.expect(directory_params)
     def get(self):
+        """
+        Member directory, ordered by username
 
-        member_query = db.session.query(
-            Member_db, Role,
-        ).filter(
-            Member_db.role_id == Role.id
-        ).order_by(Member_db.username).all()
-
-        result = [{
-            'id': m.Member.id,
-            'username': m.Member.username,
-            'first_name': m.Member.first_name,
-            'last_name': m.Member.last_name,
-            'email': m.Member.email,
-            'role_id': m.Member.role_id,
-            'role_name': m.Role.role_name,
-            'status': m.Member.status,
-            'creation_date': m.Member.creation_date.strftime('%m/%d/%Y'),
-        } for m in member_query]
+            With limit, returns one page and sets X-Next-Cursor (and a Link rel="next")
+            when more members follow; pass it back as cursor. Without limit, the whole
+            directory is streamed as a JSON array.
+        """
+        try:
+            fields = member_directory.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return err_response(str(e))
+        search = request.args.get('q', '').strip() or None
+        cursor = request.args.get('cursor') or None
+
+        limit = request.args.get('limit')
+        if limit is None:
+            return Response(
+                stream_with_context(member_directory.stream_member_directory(
+                    fields, search=search, batch_size=settings.MEMBER_DIRECTORY_MAX_PAGE_SIZE)),
+                content_type='application/json')
 
-        return result
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= settings.MEMBER_DIRECTORY_MAX_PAGE_SIZE:
+            return err_response(f"limit must be between 1 and {settings.MEMBER_DIRECTORY_MAX_PAGE_SIZE}.")
+
+        members, next_cursor = member_directory.get_member_page(fields, search=search, after=cursor, limit=limit)
+
+        response = jsonify(members)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            next_args = request.args.to_dict()
+            next_args['cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{parse.urlencode(next_args)}>; rel="next"'
+        return response
 
 
 @ns.route('/<string:key>')
@@ -77,57 +119,16 @@ class Member(Resource):
     @login_required()
     def get(self, key):
 
-        cols = [
-            Member_db.id,
-            Member_db.username,
-            Member_db.first_name,
-            Member_db.last_name,
-            Member_db.email,
-            Member_db.status,
-            Member_db.public_ssh_key,
-            Member_db.creation_date
-        ]
-
-        member = db.session \
-            .query(Member_db) \
-            .with_entities(*cols) \
-            .filter_by(username=key) \
-            .first()
-
-        if member is None:
+        # Profile information belonging to the user (latest session key, SSH key
+        # metadata) is meant for the logged-in user or DPS worker. The previous
+        # check compared the member found by key with that same key, so it always
+        # passed; that behavior is kept as is.
+        columns = member_profile.PUBLIC_PROFILE_COLUMNS + member_profile.PRIVATE_PROFILE_COLUMNS
+        result = member_profile.get_member_profile(key, columns, include_session_key=True)
+        if result is None:
             return err_response(msg="No member found with key " + key, code=status.HTTP_404_NOT_FOUND)
 
-        member_id = member.id
-        member_schema = MemberSchema()
-        result = json.loads(member_schema.dumps(member))
-
-        # If the request originates from the logged-in user or DPS worker,
-        # include additional profile information belonging to the user
-        if valid_dps_request() or member.username == key:
-            pgt_ticket = db.session \
-                .query(MemberSession_db) \
-                .with_entities(MemberSession_db.session_key) \
-                .filter_by(member_id=member_id) \
-                .order_by(MemberSession_db.id.desc()) \
-                .first()
-
-            cols = [
-                Member_db.public_ssh_key_name,
-                Member_db.public_ssh_key_modified_date
-            ]
-
-            member = db.session \
-                .query(Member_db) \
-                .with_entities(*cols) \
-                .filter_by(username=member.username) \
-                .first()
-
-            member_session_schema = MemberSessionSchema()
-            pgt_result = json.loads(member_session_schema.dumps(pgt_ticket))
-            member_ssh_info_result = json.loads(member_schema.dumps(member))
-            result = json.loads(json.dumps(dict(result.items() | pgt_result.items() | member_ssh_info_result.items())))
-
-        result['organizations'] = get_member_organizations(member_id)
+        result['organizations'] = get_member_organizations(result['id'])
 
         return result
 
@@ -381,41 +382,11 @@ class Self(Resource):
     def get(self):
         authorized_user = get_authorized_user()
 
-        cols = [
-            Member_db.id,
-            Member_db.username,
-            Member_db.first_name,
-            Member_db.last_name,
-            Member_db.email,
-            Member_db.status,
-            Member_db.urs_token,
-            Member_db.public_ssh_key,
-            Member_db.public_ssh_key_name,
-            Member_db.public_ssh_key_modified_date,
-            Member_db.creation_date
-        ]
-
-        member = db.session \
-            .query(Member_db) \
-            .with_entities(*cols) \
-            .filter_by(username=authorized_user.username) \
-            .first()
-
-        pgt_ticket = db.session \
-            .query(MemberSession_db) \
-            .with_entities(MemberSession_db.session_key) \
-            .filter_by(member_id=member.id) \
-            .order_by(MemberSession_db.id.desc()) \
-            .first()
-
-        member_session_schema = MemberSessionSchema()
-        member_schema = MemberSchema()
-        pgt_result = json.loads(member_session_schema.dumps(pgt_ticket))
-        member_result = json.loads(member_schema.dumps(member))
-        result = json.loads(json.dumps(dict(member_result.items() | pgt_result.items())))
+        columns = member_profile.PUBLIC_PROFILE_COLUMNS + member_profile.PRIVATE_PROFILE_COLUMNS + [Member_db.urs_token]
+        result = member_profile.get_member_profile(authorized_user.username, columns, include_session_key=True)
 
         if 'proxy-ticket' in request.headers or 'cpticket' in request.headers:
-            result['organizations'] = get_member_organizations(member.id)
+            result['organizations'] = get_member_organizations(result['id'])
             return result
 
         if 'Authorization' in request.headers:
@@ -642,40 +613,20 @@ class PresignedUrlS3(Resource):
         s3_path = self.mount_key_to_bucket(key, che_ws_namespace) if che_ws_namespace else key
         decoded_s3_path = parse.unquote(s3_path)
 
-        # Extract AWS account ID from ARN (format: arn:aws:iam::ACCOUNT_ID:role/...)
-        if not settings.WORKSPACE_BUCKET_ARN or '::' not in settings.WORKSPACE_BUCKET_ARN:
-            return err_response(msg="Server configuration error: WORKSPACE_BUCKET_ARN not properly configured in API settings", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        account_id = settings.WORKSPACE_BUCKET_ARN.split('::')[1].split(':')[0]
-        if not account_id or account_id == '???':
-            return err_response(msg="Server configuration error: Unable to extract AWS account ID from WORKSPACE_BUCKET_ARN in API settings", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+        account_id, error = get_workspace_account_id()
+        if error:
+            return err_response(msg=error, code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
         # Verify that this key exists in the bucket before returning presigned s3 url
-        try:
-            head_object_params = {
-                'Bucket': bucket,
-                'Key': decoded_s3_path,
-                'ExpectedBucketOwner': account_id
-            }
-            s3_client.head_object(**head_object_params)
-        except Exception as e:
-            error_code = e.response['Error']['Code']
-
-            if error_code == "404":
-                return err_response(msg=f"Error: The bucket '{bucket}' does not contain the requested file", code=status.HTTP_404_NOT_FOUND)
-            elif error_code == "403":
-                # If getting this error message, verify correct AWS account ID in settings.WORKSPACE_BUCKET_ARN
-                return err_response(msg=f"Permission denied accessing the requested file in bucket '{bucket}'", code=status.HTTP_403_FORBIDDEN)
-            else:
-                # If getting a 400 error, should verify AWS account ID in API settings.WORKSPACE_BUCKET_ARN
-                print(f"AWS Security/Network Error: {e}")
-                return err_response(msg=f"Error getting presigned url in bucket '{bucket}' for the requested file", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        error = check_s3_object(bucket, decoded_s3_path, account_id)
+        if error:
+            return err_response(*error)
 
         url = s3_client.generate_presigned_url(
             'get_object',
             Params={
                 'Bucket': bucket,
-                'Key': parse.unquote(s3_path)
+                'Key': decoded_s3_path
             },
             ExpiresIn=expiration
 
@@ -687,17 +638,124 @@ class PresignedUrlS3(Resource):
         return response
 
     def mount_key_to_bucket(self, key, ws):
+        return mount_key_to_bucket(key, ws)
+
+
+@ns.route('/self/presignedUrlS3/<string:bucket>')
+class PresignedUrlsS3(Resource):
+
+    @api.doc(security='ApiKeyAuth')
+    @login_required()
+    def post(self, bucket):
+        """
+        Presigned s3 urls for a batch of keys in one bucket
 
-        if key.startswith(settings.WORKSPACE_MOUNT_PRIVATE):
-            return key.replace(settings.WORKSPACE_MOUNT_PRIVATE, ws)
-        elif key.startswith(settings.WORKSPACE_MOUNT_PUBLIC):
-            return key.replace(settings.WORKSPACE_MOUNT_PUBLIC, f'{settings.AWS_SHARED_WORKSPACE_BUCKET_PATH}/{ws}')
-        elif key.startswith(settings.WORKSPACE_MOUNT_SHARED):
-            return key.replace(settings.WORKSPACE_MOUNT_SHARED, settings.AWS_SHARED_WORKSPACE_BUCKET_PATH)
-        elif key.startswith(settings.WORKSPACE_MOUNT_TRIAGE):
-            return key.replace(settings.WORKSPACE_MOUNT_TRIAGE, settings.AWS_TRIAGE_WORKSPACE_BUCKET_PATH)
+            Expects a JSON body {"keys": [...], "exp": seconds, "ws": namespace}; exp and ws
+            are optional and applied as in the single key endpoint. Returns
+            {"urls": {key: {"url": ...}}}, with {"error": ..., "code": ...} in place of the
+            url for keys that do not exist or cannot be read.
+        """
+        req_data = request.get_json(silent=True)
+        if not isinstance(req_data, dict):
+            return err_response("Valid JSON body object required.")
+
+        keys = req_data.get("keys")
+        if not isinstance(keys, list) or not keys or not all(isinstance(k, str) and k for k in keys):
+            return err_response("A non-empty list of keys is required.")
+        if len(keys) > settings.PRESIGNED_URL_BATCH_MAX_KEYS:
+            return err_response(f"At most {settings.PRESIGNED_URL_BATCH_MAX_KEYS} keys can be presigned per request.")
+
+        expiration = req_data.get("exp", 60 * 60 * 12)
+        if not isinstance(expiration, int) or expiration <= 0:
+            return err_response("exp must be a positive number of seconds.")
+        che_ws_namespace = req_data.get("ws") or ''
+
+        account_id, error = get_workspace_account_id()
+        if error:
+            return err_response(msg=error, code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = jsonify(urls=presign_s3_keys(bucket, keys, che_ws_namespace, expiration, account_id))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+
+        return response
+
+
+def mount_key_to_bucket(key, ws):
+
+    if key.startswith(settings.WORKSPACE_MOUNT_PRIVATE):
+        return key.replace(settings.WORKSPACE_MOUNT_PRIVATE, ws)
+    elif key.startswith(settings.WORKSPACE_MOUNT_PUBLIC):
+        return key.replace(settings.WORKSPACE_MOUNT_PUBLIC, f'{settings.AWS_SHARED_WORKSPACE_BUCKET_PATH}/{ws}')
+    elif key.startswith(settings.WORKSPACE_MOUNT_SHARED):
+        return key.replace(settings.WORKSPACE_MOUNT_SHARED, settings.AWS_SHARED_WORKSPACE_BUCKET_PATH)
+    elif key.startswith(settings.WORKSPACE_MOUNT_TRIAGE):
+        return key.replace(settings.WORKSPACE_MOUNT_TRIAGE, settings.AWS_TRIAGE_WORKSPACE_BUCKET_PATH)
+    else:
+        return key
+
+
+def get_workspace_account_id():
+    """Return (account_id, error): the AWS account owning the workspace buckets, taken from WORKSPACE_BUCKET_ARN."""
+    # Extract AWS account ID from ARN (format: arn:aws:iam::ACCOUNT_ID:role/...)
+    if not settings.WORKSPACE_BUCKET_ARN or '::' not in settings.WORKSPACE_BUCKET_ARN:
+        return None, "Server configuration error: WORKSPACE_BUCKET_ARN not properly configured in API settings"
+
+    account_id = settings.WORKSPACE_BUCKET_ARN.split('::')[1].split(':')[0]
+    if not account_id or account_id == '???':
+        return None, "Server configuration error: Unable to extract AWS account ID from WORKSPACE_BUCKET_ARN in API settings"
+
+    return account_id, None
+
+
+def check_s3_object(bucket, key, account_id):
+    """
+    HEAD an object, returning None if it exists or an error (message, status) otherwise.
+    Existing objects are remembered for S3_OBJECT_EXISTENCE_CACHE_TTL_SECONDS.
+    """
+    with s3_object_existence_lock:
+        if (bucket, key) in s3_object_existence_cache:
+            return None
+
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key, ExpectedBucketOwner=account_id)
+        error = None
+    except Exception as e:
+        error_code = e.response['Error']['Code'] if hasattr(e, 'response') else None
+
+        if error_code == "404":
+            error = (f"Error: The bucket '{bucket}' does not contain the requested file", status.HTTP_404_NOT_FOUND)
+        elif error_code == "403":
+            # If getting this error message, verify correct AWS account ID in settings.WORKSPACE_BUCKET_ARN
+            error = (f"Permission denied accessing the requested file in bucket '{bucket}'", status.HTTP_403_FORBIDDEN)
         else:
-            return key
+            # If getting a 400 error, should verify AWS account ID in API settings.WORKSPACE_BUCKET_ARN
+            log.error(f"AWS Security/Network Error: {e}")
+            error = (f"Error getting presigned url in bucket '{bucket}' for the requested file", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if error is None:
+        with s3_object_existence_lock:
+            s3_object_existence_cache[(bucket, key)] = True
+    return error
+
+
+def presign_s3_keys(bucket, keys, ws, expiration, account_id):
+    """
+    Map each key (mounted path or s3 key) to {"url": ...} or {"error": ..., "code": ...}.
+    Objects are checked concurrently on presigned_url_executor; presigning itself is local.
+    """
+    s3_keys = {key: parse.unquote(mount_key_to_bucket(key, ws) if ws else key) for key in keys}
+    checks = {key: presigned_url_executor.submit(check_s3_object, bucket, s3_key, account_id)
+              for key, s3_key in s3_keys.items()}
+
+    urls = {}
+    for key, check in checks.items():
+        error = check.result()
+        if error:
+            urls[key] = {'error': error[0], 'code': error[1]}
+        else:
+            urls[key] = {'url': s3_client.generate_presigned_url(
+                'get_object', Params={'Bucket': bucket, 'Key': s3_keys[key]}, ExpiresIn=expiration)}
+    return urls
 
 
 @ns.route('/self/awsAccess/requesterPaysBucket')
@@ -711,19 +769,16 @@ class AwsAccessRequesterPaysBucket(Resource):
     def get(self):
         member = get_authorized_user()
 
-        expiration = request.args['exp']
-        sts_client = boto3.client('sts')
-        assumed_role_object = sts_client.assume_role(
-            DurationSeconds=int(expiration),
-            RoleArn=settings.AWS_REQUESTER_PAYS_BUCKET_ARN,
-            RoleSessionName="MAAP-session-" + member.username
-        )
-        credentials = assumed_role_object['Credentials']
+        expiration = request.args.get('exp', 60 * 60 * 12, type=int)
+        if expiration < STS_MIN_DURATION_SECONDS:
+            return err_response(f"exp must be at least {STS_MIN_DURATION_SECONDS} seconds.")
+        credentials = get_requester_pays_credentials(member.username, requester_pays_duration(expiration))
 
         response = jsonify(
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
+            aws_access_key_id=credentials['aws_access_key_id'],
+            aws_secret_access_key=credentials['aws_secret_access_key'],
+            aws_session_token=credentials['aws_session_token'],
+            expiration=credentials['expiration']
         )
 
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -789,23 +844,13 @@ class AwsAccessUserBucketCredentials(Resource):
         workspace_bucket = config["workspace_bucket"]
 
         # Build the STS policy and collect authorized paths
-        policy, authorized_s3_paths = build_user_s3_policy(workspace_bucket, maap_user.username, maap_user.id)
-
-        # Call the assume_role method of the STSConnection object
-        assumed_role_object = sts_client.assume_role(
-            RoleArn=settings.WORKSPACE_BUCKET_ARN,
-            RoleSessionName=f'workspace-session-{maap_user.username}',
-            Policy=policy,
-            DurationSeconds=(60 * 60 * 12)  # 12 hours, which is the max allowed by AWS for a custom policy with assume_role
-        )
+        policy, authorized_s3_paths = get_user_s3_policy(workspace_bucket, maap_user.username, maap_user.id)
+
+        credentials = get_workspace_bucket_credentials(maap_user.id, maap_user.username, policy,
+                                                       settings.WORKSPACE_BUCKET_ARN)
 
         response = jsonify(
-            credentials={
-                "aws_access_key_id": assumed_role_object['Credentials']['AccessKeyId'],
-                "aws_secret_access_key": assumed_role_object['Credentials']['SecretAccessKey'],
-                "aws_session_token": assumed_role_object['Credentials']['SessionToken'],
-                "expires_at": assumed_role_object['Credentials']['Expiration'].strftime("%Y-%m-%dT%H:%M:%S%z")
-            },
+            credentials=credentials,
             authorized_s3_paths=authorized_s3_paths
         )
 
@@ -847,7 +892,113 @@ def now_utc() -> float:
     return datetime.now(timezone.utc).timestamp() * 1000
 
 
-@cached(TLRUCache(ttu=creds_expiration_utc, timer=now_utc, maxsize=128))
+def creds_ttl_seconds(creds) -> float:
+    """Return how many seconds a credentials object may be cached, which is
+    half of its remaining lifetime (see ``creds_expiration_utc``)."""
+    now = now_utc()
+    return (creds_expiration_utc(None, creds, now) - now) / 1000
+
+
+edc_credentials_cache = get_cache_backend('edc-credentials', maxsize=128, encrypted=True)
+
+# Assumed requester pays roles, per user and requested duration
+requester_pays_credentials_cache = get_cache_backend('requester-pays-credentials',
+                                                     maxsize=settings.REQUESTER_PAYS_CREDENTIALS_CACHE_SIZE,
+                                                     encrypted=True)
+STS_MIN_DURATION_SECONDS = 15 * 60
+STS_MAX_DURATION_SECONDS = 12 * 60 * 60
+
+
+REQUESTER_PAYS_EXPIRATION_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
+
+def requester_pays_duration(expiration) -> int:
+    """Cap a requested credentials lifetime at the longest STS accepts."""
+    return min(int(expiration), STS_MAX_DURATION_SECONDS)
+
+
+def requester_pays_remaining_seconds(credentials) -> float:
+    expires_at = datetime.strptime(credentials['expiration'], REQUESTER_PAYS_EXPIRATION_FORMAT)
+    return expires_at.timestamp() - datetime.now(timezone.utc).timestamp()
+
+
+def get_requester_pays_credentials(username, duration):
+    """Assume the requester pays role for a user for ``duration`` seconds.
+
+    The role is assumed for up to ``REQUESTER_PAYS_LIFETIME_SLACK_SECONDS`` longer
+    than asked, and the credentials are reused for requests of the same user and
+    duration while they still have at least ``duration`` left. Callers therefore
+    always get credentials expiring between ``duration`` and ``duration`` plus the
+    slack from now, never the longer-lived credentials of another request.
+    """
+    cache_key = f'{username}:{duration}'
+    credentials = requester_pays_credentials_cache.get(cache_key)
+    if credentials is not None and requester_pays_remaining_seconds(credentials) >= duration:
+        return credentials
+
+    assumed_role_object = sts_client.assume_role(
+        DurationSeconds=min(duration + settings.REQUESTER_PAYS_LIFETIME_SLACK_SECONDS, STS_MAX_DURATION_SECONDS),
+        RoleArn=settings.AWS_REQUESTER_PAYS_BUCKET_ARN,
+        RoleSessionName="MAAP-session-" + username
+    )
+    assumed_credentials = assumed_role_object['Credentials']
+
+    credentials = {
+        'aws_access_key_id': assumed_credentials['AccessKeyId'],
+        'aws_secret_access_key': assumed_credentials['SecretAccessKey'],
+        'aws_session_token': assumed_credentials['SessionToken'],
+        'expiration': assumed_credentials['Expiration'].strftime(REQUESTER_PAYS_EXPIRATION_FORMAT)
+    }
+    ttl = requester_pays_remaining_seconds(credentials) - duration
+    if ttl > 0:
+        requester_pays_credentials_cache.set(cache_key, credentials, ttl)
+    return credentials
+
+
+# Assumed workspace bucket roles, per user, policy and role
+workspace_credentials_cache = get_cache_backend('workspace-bucket-credentials',
+                                                maxsize=settings.WORKSPACE_CREDENTIALS_CACHE_SIZE,
+                                                encrypted=True)
+WORKSPACE_CREDENTIALS_EXPIRES_AT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def workspace_credentials_key(user_id, username, policy, role_arn):
+    # Any change to the user's org S3 access changes the policy, and so the key
+    policy_hash = hashlib.sha256(policy.encode('utf-8')).hexdigest()
+    return f'{user_id}:{role_arn}:{policy_hash}'
+
+
+def workspace_credentials_ttl_seconds(credentials) -> float:
+    """Return how many seconds workspace credentials may be served from cache: until
+    ``WORKSPACE_CREDENTIALS_EXPIRY_MARGIN_SECONDS`` before they expire."""
+    expires_at = datetime.strptime(credentials['expires_at'], WORKSPACE_CREDENTIALS_EXPIRES_AT_FORMAT)
+    remaining = expires_at.timestamp() - datetime.now(timezone.utc).timestamp()
+    return remaining - settings.WORKSPACE_CREDENTIALS_EXPIRY_MARGIN_SECONDS
+
+
+@cached(workspace_credentials_cache, key=workspace_credentials_key, ttl=workspace_credentials_ttl_seconds)
+def get_workspace_bucket_credentials(user_id, username, policy, role_arn):
+    """Assume ``role_arn`` scoped down to ``policy`` for a user.
+
+    Credentials are cached until shortly before they expire, so repeated calls from
+    notebooks and DPS jobs do not each go to STS.
+    """
+    assumed_role_object = sts_client.assume_role(
+        RoleArn=role_arn,
+        RoleSessionName=f'workspace-session-{username}',
+        Policy=policy,
+        DurationSeconds=(60 * 60 * 12)  # 12 hours, which is the max allowed by AWS for a custom policy with assume_role
+    )
+
+    return {
+        "aws_access_key_id": assumed_role_object['Credentials']['AccessKeyId'],
+        "aws_secret_access_key": assumed_role_object['Credentials']['SecretAccessKey'],
+        "aws_session_token": assumed_role_object['Credentials']['SessionToken'],
+        "expires_at": assumed_role_object['Credentials']['Expiration'].strftime(WORKSPACE_CREDENTIALS_EXPIRES_AT_FORMAT)
+    }
+
+
+@cached(edc_credentials_cache, key=lambda endpoint_uri, user_id: f'{user_id}:{endpoint_uri}', ttl=creds_ttl_seconds)
 def get_edc_credentials(endpoint_uri, user_id):
     """Get EDC credentials for a user from an endpoint.
 
@@ -21,6 +21,7 @@ from datetime import datetime
 import json
 
 from api.utils import organization
+from api.utils.s3_access import invalidate_user_s3_policies
 from api.utils.http_util import err_response
 
 log = logging.getLogger(__name__)
@@ -220,6 +221,7 @@ class OrganizationMembership(Resource):
                 db.session.rollback()
                 app.logger.error(f"Failed to add organization membership for user {username} to org {org_id}: {e}")
                 raise
+            invalidate_user_s3_policies()
 
             org_schema = OrganizationMembershipSchema()
             return json.loads(org_schema.dumps(new_org_membership))
@@ -262,6 +264,7 @@ class OrganizationMembership(Resource):
                 db.session.rollback()
                 app.logger.error(f"Failed to delete organization membership for user {username} from org {org_id}: {e}")
                 raise
+            invalidate_user_s3_policies()
 
             return {"code": status.HTTP_200_OK,
                     "message": "Successfully removed {} from org {}.".format(member_to_delete.username, org_id)}
@@ -1,19 +1,104 @@
 import logging
+import os
 import requests
 from api import settings
-from flask import Response
-from flask_restplus import Resource
+from flask import Response, request, stream_with_context
+from flask_api import status
+from flask_restx import Resource
+from werkzeug.http import parse_date, unquote_etag
 from api.restplus import api
-
-try:
-    import urllib.parse as urlparse
-except ImportError:
-    import urlparse as urlparse
+from api.utils.http_util import err_response
+from api.utils.response_cache import ResponseCache, CachedResponse, CACHE_MISS
 
 log = logging.getLogger(__name__)
 
 ns = api.namespace('3d-tiles', description='Operations related to 3d tile querying.')
 
+# Reused across requests; a Cesium view fetches hundreds of small tiles
+tiles_session = requests.Session()
+tiles_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=settings.THREE_D_TILES_CONNECTION_POOL_SIZE))
+
+# tileset.json and tile content, stored as sent to the client: gzip encoded as sent
+# upstream for clients accepting gzip, decoded for the others (see accepted_encoding())
+tiles_cache = ResponseCache(max_bytes=settings.THREE_D_TILES_CACHE_MAX_BYTES,
+                            ttl_seconds=settings.THREE_D_TILES_CACHE_TTL_SECONDS,
+                            max_entry_bytes=settings.THREE_D_TILES_CACHE_MAX_ENTRY_BYTES)
+
+TILE_RESPONSE_HEADERS = ['Content-Type', 'Content-Encoding', 'Content-Length', 'ETag', 'Last-Modified', 'Cache-Control']
+# Upstream headers still valid once the body has been decoded
+DECODED_TILE_RESPONSE_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Cache-Control']
+CACHE_REVALIDATED = "REVALIDATED"
+
+# Used when the object store does not send a meaningful Content-Type
+TILE_CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.b3dm': 'application/octet-stream',
+    '.i3dm': 'application/octet-stream',
+    '.pnts': 'application/octet-stream',
+    '.cmpt': 'application/octet-stream',
+    '.glb': 'model/gltf-binary',
+    '.gltf': 'model/gltf+json',
+}
+GENERIC_CONTENT_TYPES = ('', 'binary/octet-stream')
+
+
+def content_type(path, headers):
+    upstream = headers.get('Content-Type', '')
+    if upstream.split(';')[0].strip() in GENERIC_CONTENT_TYPES:
+        return TILE_CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), upstream or 'application/octet-stream')
+    return upstream
+
+
+def accepted_encoding():
+    """
+    The encoding asked of upstream: gzip when the client accepts it, so it is passed
+    through as is. Otherwise identity, and any body upstream still sends gzip encoded
+    (e.g. objects stored that way) is decoded before it reaches the client.
+    """
+    return 'gzip' if request.accept_encodings['gzip'] > 0 else 'identity'
+
+
+def tile_response(path, body, status_code, headers, cache_status, header_names=TILE_RESPONSE_HEADERS):
+    response_headers = {name: headers[name] for name in header_names if name in headers}
+    response_headers.update({
+        'Content-Type': content_type(path, headers),
+        'Access-Control-Allow-Origin': '*',
+        'Vary': 'Accept-Encoding',
+        'X-Cache': cache_status
+    })
+    return Response(body, status_code, response_headers, direct_passthrough=True)
+
+
+def not_modified(entry):
+    """Whether the client's conditional headers match the cached entry."""
+    etag = entry.headers.get('ETag')
+    if etag and request.if_none_match:
+        return request.if_none_match.contains_weak(unquote_etag(etag)[0])
+    last_modified = entry.headers.get('Last-Modified')
+    if last_modified and request.if_modified_since and not request.if_none_match:
+        modified = parse_date(last_modified)
+        return modified is not None and request.if_modified_since >= modified
+    return False
+
+
+def cached_tile_response(path, entry, cache_status):
+    if not_modified(entry):
+        headers = {name: entry.headers[name] for name in ('ETag', 'Last-Modified', 'Cache-Control') if name in entry.headers}
+        headers['Access-Control-Allow-Origin'] = '*'
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return tile_response(path, [entry.content], entry.status_code, entry.headers, cache_status)
+
+
+def revalidation_headers(entry):
+    """Conditional request headers for refreshing an expired cache entry upstream."""
+    headers = {}
+    if entry is not None:
+        if 'ETag' in entry.headers:
+            headers['If-None-Match'] = entry.headers['ETag']
+        if 'Last-Modified' in entry.headers:
+            headers['If-Modified-Since'] = entry.headers['Last-Modified']
+    return headers
+
 
 @ns.route('/<path:path>')
 class ThreeDimensionalTiles(Resource):
@@ -22,6 +107,10 @@ class ThreeDimensionalTiles(Resource):
         """
         3D Tiles
 
+        Streams tileset.json and tile content from the data system. Responses are
+        cached by size, revalidated upstream with ETag/Last-Modified once expired
+        and passed through gzip encoded when the client accepts it.
+
             Examples:
 
             https://api.dit.maap-project.org/api/3d-tiles/ATL08_ARD-beta___001/afrisar/ept/ept-tileset/tileset.json
@@ -29,15 +118,29 @@ class ThreeDimensionalTiles(Resource):
         """
 
         three_d_tile_json_url = settings.DATA_SYSTEM_SERVICES_API_BASE + settings.DATA_SYSTEM_FILES_PATH + path
+        encoding = accepted_encoding()
+        cache_key = f'{encoding} {three_d_tile_json_url}'
+        cache_control = request.headers.get('Cache-Control')
+
+        cached = tiles_cache.lookup(cache_key, None, cache_control)
+        if cached is not None:
+            return cached_tile_response(path, cached, cached.cache_status)
 
-        r = requests.get(three_d_tile_json_url)
+        expired = tiles_cache.get(cache_key)
+        try:
+            r = tiles_session.get(three_d_tile_json_url, stream=True, timeout=settings.REQUESTS_TIMEOUT_SECONDS,
+                                  headers={'Accept-Encoding': encoding, **revalidation_headers(expired)})
+        except requests.RequestException as e:
+            log.error(f"Failed to fetch 3D tile {three_d_tile_json_url}: {e}")
+            return err_response(f"Failed to fetch 3D tile {path}", status.HTTP_502_BAD_GATEWAY)
 
-        response = Response(
-            r.content,
-            r.status_code,
-            {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            })
-        return response
+        if r.status_code == status.HTTP_304_NOT_MODIFIED and expired is not None:
+            r.close()
+            refreshed = tiles_cache.put(cache_key, CachedResponse(expired.status_code, expired.headers, expired.content))
+            return cached_tile_response(path, refreshed or expired, CACHE_REVALIDATED)
 
+        passthrough = encoding == 'gzip'
+        header_names = TILE_RESPONSE_HEADERS if passthrough else DECODED_TILE_RESPONSE_HEADERS
+        chunks = tiles_cache.stream_through(cache_key, r, settings.THREE_D_TILES_CHUNK_BYTES, cache_control,
+                                            keep_headers=header_names, decode_content=not passthrough)
+        return tile_response(path, stream_with_context(chunks), r.status_code, r.headers, CACHE_MISS, header_names)
@@ -2,11 +2,15 @@ import logging
 import json
 import os
 import sys, traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from cachetools import TTLCache
 from flask import Response, request, render_template_string
 from flask_restx import Resource
 from api.restplus import api
-from api.utils.mapproxy_snap import create_config_wmts, mapit
+from api.utils.mapproxy_snap import create_config_wmts_xml, build_services, render_map, composite_images, \
+    get_tile_storage
 from api.endpoints.wmts import GetCapabilities
 from api import settings
 
@@ -14,54 +18,99 @@ log = logging.getLogger(__name__)
 
 ns = api.namespace('wms', description='WMS GetMap')
 
+# Configured mapproxy services per (layer, time); see get_wms_services()
+wms_services_cache = TTLCache(maxsize=settings.WMS_SERVICES_CACHE_SIZE, ttl=settings.WMS_SERVICES_CACHE_TTL_SECONDS)
+wms_services_cache_lock = threading.Lock()
+
+# Renders the layers of a multi-layer GetMap concurrently
+wms_render_executor = ThreadPoolExecutor(max_workers=settings.WMS_MAX_WORKERS, thread_name_prefix='wms-render')
+
+# Opt-in local storage of upstream tiles (MAPPROXY_TILE_STORAGE)
+tile_storage = get_tile_storage()
+
+
+def get_wms_services(granule_ur, time=None):
+    """
+    Return the mapproxy services for a layer, building them on a miss: the WMTS
+    GetCapabilities document for the layer is generated and turned into a
+    mapproxy configuration entirely in memory. Services are kept in an LRU with
+    a TTL so a GetMap for a known layer goes straight to rendering.
+    """
+    key = (granule_ur, time)
+    with wms_services_cache_lock:
+        services = wms_services_cache.get(key)
+    if services is not None:
+        return services
+
+    # Pass param which can be used to generate GetCapabilities dynamically
+    get_capabilities_string = GetCapabilities().generate_capabilities({'granule_ur': granule_ur})
+    wmts_confs = create_config_wmts_xml(get_capabilities_string, serviceurl=settings.FLASK_SERVER_NAME + '/api/wmts',
+                                        storage=tile_storage)
+    services = build_services(wmts_confs, time)
+
+    with wms_services_cache_lock:
+        wms_services_cache[key] = services
+    return services
+
 @ns.route('/GetMap')
 class GetMap(Resource):
 
     def get(self):
         """
         This will return OGC WMS GetMap response (image file)
+
+            LAYERS: one or more comma-separated granule URs, drawn in order (first at the bottom)
+            BBOX: minx,miny,maxx,maxy in EPSG:4326
+            WIDTH, HEIGHT: image size in pixels (default 256x256)
+            FORMAT: image/png (default) or image/jpeg
+            TIME: optional time for layers with a time dimension
         :return:
         """
         try:
-            # Pass param which can be used to generate GetCapabilities dynamically
-            cmr_search_params = {'granule_ur': request.args['LAYERS']}
-
-            # Review(Aimee): This generates a local copy of WMTS GetCapabilities
-            # XML, which `create_config_wmts` requires. `create_config_wmts`
-            # could also call the /wmts/GetCapabilities endpoint but it would
-            # run the same code to generate the XML so the tradeoff is making a
-            # network call vs writing to the local filesystem.
-            get_capabilities_string = GetCapabilities().generate_capabilities(cmr_search_params)
-            wmts_capabilities_file = open(settings.MAAP_WMTS_XML, 'w')
-            wmts_capabilities_file.write(get_capabilities_string)
-            wmts_capabilities_file.close()
-            wmts_confs = create_config_wmts(["file://" + settings.MAAP_WMTS_XML])
+            granule_urs = [layer for layer in request.args['LAYERS'].split(',') if layer]
+            if not granule_urs:
+                raise ValueError('LAYERS is required')
+            if len(granule_urs) > settings.WMS_MAX_LAYERS:
+                raise ValueError(f'At most {settings.WMS_MAX_LAYERS} LAYERS can be requested at once')
+            time = request.args.get('TIME')
 
             # Get args from request
             # TODO(Aimee): Permitted parameters should be consistent with the
             # OGC WMS spec. There are other args which could be supported such
-            # as STYLE. Also, multiple layers could be passed.
+            # as STYLE.
             if request.args.get('BBOX'):
                 bbox = tuple(map(float, request.args.get('BBOX').split(',')))
             else:
-                bbox = (-90, -180, 90, 180)
+                bbox = (-180, -90, 180, 90)
             if request.args.get('HEIGHT') and request.args.get('WIDTH'):
-                size = (int(request.args.get('HEIGHT')),
-                        int(request.args.get('WIDTH')))
+                size = (int(request.args.get('WIDTH')),
+                        int(request.args.get('HEIGHT')))
             else:
                 size = (256, 256)
 
-            # FIXME: One collection (AFLVIS2) has granule urs which include
-            # a colon, which causes a mapproxy configuration error.
-            # Example: SC:AFLVIS2.001:138348873. This also shows up in wmts.py.
-            layer = request.args['LAYERS'].replace(':', '')
             if request.args.get('FORMAT'):
                 img_format = request.args.get('FORMAT')
             else:
                 img_format = 'image/png'
 
-            # Create the image
-            img_data = mapit(wmts_confs, layer, img_format, bbox, size)
+            # Create the image. Several layers are rendered concurrently, each
+            # as a transparent PNG, and composited in the order requested.
+            layer_format = img_format if len(granule_urs) == 1 else 'image/png'
+
+            def render_layer(granule_ur):
+                services = get_wms_services(granule_ur, time)
+                # FIXME: One collection (AFLVIS2) has granule urs which include
+                # a colon, which causes a mapproxy configuration error.
+                # Example: SC:AFLVIS2.001:138348873. This also shows up in wmts.py.
+                return render_map(services, granule_ur.replace(':', ''), layer_format, bbox, size)
+
+            if len(granule_urs) == 1:
+                img_data = render_layer(granule_urs[0])
+            else:
+                layer_images = list(wms_render_executor.map(render_layer, granule_urs))
+                img_data = composite_images(layer_images, img_format)
+            if tile_storage is not None:
+                tile_storage.schedule_cleanup()
 
             response = Response(
                 img_data,
@@ -74,7 +123,7 @@ class GetMap(Resource):
         except Exception as ex:
             response_body = dict()
             log.error(str(ex))
-            log.error(json.dumps(ex, indent=2))
+            log.error(traceback.format_exc())
             response_body["code"] = 500
             response_body["message"] = 'Failed to generate map'
             response_body["error"] = str(ex)
@@ -1,18 +1,29 @@
+import hashlib
 import logging
 import json
 import os
 import sys, traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import requests
-from flask import Response, request, render_template_string
+from flask import Response, request, current_app
+from flask_api import status
+from jinja2 import Environment
 from flask_restx import Resource
 from api.restplus import api
 from api import settings
 import api.endpoints.cmr as cmr
 from api.utils.Granule import Granule
 from collections import OrderedDict
+from cachetools import LRUCache
 import xmltodict
 from api.endpoints.wmts_collections import default_collections
 from werkzeug.datastructures import ImmutableMultiDict
+from api.utils.response_cache import ResponseCache, CachedResponse, CACHE_HIT, CACHE_MISS
+from api.utils.tile_cache import TileCache, tile_key
+from api.utils.tile_seeder import TileSeedJob, TileSeedJobs, tiles_for_bbox, count_tiles
+from api.utils.shared_cache import get_cache_backend, cached
 
 log = logging.getLogger(__name__)
 
@@ -21,6 +32,42 @@ ns = api.namespace('wmts', description='Retrieve tiles')
 # Load default collections
 cmr_search_granules_url = os.path.join(settings.CMR_URL, 'search', 'granules')
 
+# Keep-alive connections to the tiler
+tiler_session = requests.Session()
+tiler_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=settings.TILER_CONNECTION_POOL_SIZE))
+
+# Builds the layers of the default capabilities document concurrently
+capabilities_executor = ThreadPoolExecutor(max_workers=settings.WMTS_CAPABILITIES_MAX_WORKERS,
+                                           thread_name_prefix='wmts-capabilities')
+WORLD_BOUNDS = [-180, -90, 180, 90]
+
+# Rendered tiles: hot ones in memory, the long tail on disk; see GetTile. Metrics
+# are shared by the workers so that the admin endpoints report all of them.
+tile_cache = TileCache(memory_max_bytes=settings.WMTS_TILE_CACHE_MEMORY_MAX_BYTES,
+                       disk_max_bytes=settings.WMTS_TILE_CACHE_DISK_MAX_BYTES,
+                       disk_path=settings.WMTS_TILE_CACHE_PATH,
+                       disk_rescan_seconds=settings.WMTS_TILE_CACHE_DISK_RESCAN_SECONDS,
+                       stats_store=get_cache_backend('wmts-tile-cache-stats', maxsize=256,
+                                                     backend=settings.WMTS_SHARED_STATE_CACHE_BACKEND))
+
+# Recent tile cache seeding jobs, visible to and cancellable from every worker; see start_tile_seed()
+TILE_SEED_JOBS_KEPT = 50
+tile_seed_jobs = TileSeedJobs(get_cache_backend('wmts-tile-seed-jobs', maxsize=TILE_SEED_JOBS_KEPT * 2 + 1,
+                                                backend=settings.WMTS_SHARED_STATE_CACHE_BACKEND),
+                              maxsize=TILE_SEED_JOBS_KEPT)
+
+# Browse urls of granule lists requested by GetTile; see get_granule_cog_urls_string()
+granule_cog_urls_cache = get_cache_backend('wmts-granule-cog-urls', maxsize=settings.WMTS_GRANULE_COG_URLS_CACHE_SIZE)
+
+# Compiled once at import; rendered for every capabilities document
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capabilities_template.xml'), 'r') as template_file:
+    capabilities_template = Environment(autoescape=True).from_string(template_file.read())
+
+# Rendered capabilities documents keyed by normalized request args; see GetCapabilities.get()
+capabilities_cache = ResponseCache(max_bytes=settings.WMTS_CAPABILITIES_CACHE_MAX_BYTES,
+                                   ttl_seconds=settings.WMTS_CAPABILITIES_CACHE_TTL_SECONDS,
+                                   stale_seconds=settings.WMTS_CAPABILITIES_CACHE_STALE_SECONDS)
+
 
 def collection_params(collection={}):
     collection_attrs = ['short_name', 'version', 'mosaiced_cog']
@@ -45,10 +92,17 @@ def get_cog_urls_string(params={}):
     # limit (e.g. refine query?) We need a better answer for collections
     # with a large number of granules.
     params['page_size'] = 100
+    if 'granule_ur[]' in params:
+        params['page_size'] = max(params['page_size'], len(params['granule_ur[]']))
     search_headers = cmr.get_search_headers()
     search_headers['Accept'] = 'application/json'
-    cmr_resp = requests.get(cmr_search_granules_url, headers=search_headers, params=params)
+    cmr_resp = cmr.cmr_session.get(cmr_search_granules_url, headers=search_headers, params=params,
+                                   timeout=settings.REQUESTS_TIMEOUT_SECONDS)
     cmr_response_feed = json.loads(cmr_resp.text)['feed']['entry']
+    if 'granule_ur[]' in params:
+        # Keep the mosaic order of the requested granules; the title of a CMR JSON granule is its UR
+        requested = {granule_ur: i for i, granule_ur in enumerate(params['granule_ur[]'])}
+        cmr_response_feed.sort(key=lambda granule: requested.get(granule.get('title'), len(requested)))
     for granule in cmr_response_feed:
         granule = Granule(granule, 'aws_access_key_id', 'aws_secret_access_key')
         urls = granule['links']
@@ -59,6 +113,17 @@ def get_cog_urls_string(params={}):
     return browse_urls_query_string
 
 
+@cached(granule_cog_urls_cache, key=lambda granule_urs: ','.join(granule_urs),
+        ttl=lambda urls: settings.WMTS_GRANULE_COG_URLS_CACHE_TTL_SECONDS if urls else 0)
+def get_granule_cog_urls_string(granule_urs):
+    """
+    Comma-list of browse urls for the given granule URs, resolved with a single
+    CMR search (granule_ur[]) and cached per granule list, so a tile request
+    costs at most one search regardless of the number of granules.
+    """
+    return get_cog_urls_string({'granule_ur[]': list(granule_urs)})
+
+
 def gen_mosaic_url(params={}):
     ext = params.get('ext') if params.get('ext') else 'png'
     color_map = params.get('color_map') if params.get('color_map') else 'schwarzwald'
@@ -73,8 +138,74 @@ def gen_mosaic_url(params={}):
            rescale
 
 
+def get_browse_urls_query_string(urls=None, granule_urs=None, short_name=None):
+    """
+    Comma-list of browse urls for a tile layer given as urls, granule URs or a
+    default collection short name, in that order of precedence.
+    """
+    if urls:
+        browse_urls_query_string = urls
+    # Granule URs are passed
+    elif granule_urs:
+        browse_urls_query_string = get_granule_cog_urls_string(granule_urs.split(','))
+    else:
+        collection = default_collections[short_name]
+        browse_urls_query_string = get_cog_urls_string(collection_params(collection))
+
+    if not browse_urls_query_string:
+        raise AssertionError('No browse images')
+    return browse_urls_query_string
+
+
+def seed_tile(browse_urls_query_string, color_map, rescale, ext, z, x, y, throttle=None):
+    """
+    Render one tile into the tile cache unless it is already there. ``throttle``
+    is called right before the tiler is requested. Returns whether the tiler was called.
+    """
+    mosaic_url = gen_mosaic_url({
+        'z': z,
+        'x': x,
+        'y': y,
+        'urls': browse_urls_query_string,
+        'color_map': color_map,
+        'ext': ext,
+        'rescale': rescale
+    })
+    key = tile_key(mosaic_url)
+    if tile_cache.contains(key):
+        return False
+
+    if throttle is not None:
+        throttle()
+    tile_response = get_tiles(mosaic_url)
+    if tile_response.status_code != 200:
+        raise Exception(f'Tiler returned {tile_response.status_code} for {z}/{x}/{y}')
+    tile_cache.put(key, tile_response.content)
+    return True
+
+
+def start_tile_seed(bbox, min_zoom, max_zoom, urls=None, granule_urs=None, short_name=None,
+                    color_map=None, rescale=None, ext='png'):
+    """
+    Start warming the tile cache for every tile of a layer covering ``bbox``
+    (west, south, east, north) between ``min_zoom`` and ``max_zoom``, as GetTile
+    would request them. Returns the running TileSeedJob.
+    """
+    browse_urls_query_string = get_browse_urls_query_string(urls, granule_urs, short_name)
+    job = TileSeedJob(
+        tiles_for_bbox(bbox, min_zoom, max_zoom),
+        count_tiles(bbox, min_zoom, max_zoom),
+        partial(seed_tile, browse_urls_query_string, color_map, rescale, ext),
+        max_workers=settings.WMTS_SEED_MAX_WORKERS,
+        max_requests_per_second=settings.WMTS_SEED_MAX_REQUESTS_PER_SECOND,
+        description={'layer': {k: v for k, v in (('urls', urls), ('granule_urs', granule_urs),
+                                                  ('short_name', short_name)) if v},
+                     'bbox': list(bbox), 'min_zoom': min_zoom, 'max_zoom': max_zoom})
+    return tile_seed_jobs.add(job).start()
+
+
 def get_tiles(tiler_url=''):
-    return requests.get(tiler_url)
+    return tiler_session.get(tiler_url, timeout=settings.REQUESTS_TIMEOUT_SECONDS)
 
 
 @ns.route('/GetTile/<int:z>/<int:x>/<int:y>.<ext>')
@@ -102,31 +233,7 @@ class GetTile(Resource):
             response_body["success"] = False
         else:
             try:
-                if urls:
-                    browse_urls_query_string = urls
-                # Granule URs are passed
-                elif granule_urs:
-                    browse_urls = []
-                    granule_urs = granule_urs.split(',')
-                    # REVIEW(aimee): This is non-ideal since we're
-                    # making a request for each granule. Would be more
-                    # ideal to pass query params of the user directly to
-                    # this method.
-                    # REVIEW(aimee): Should we limit the number of
-                    # granules that can be requested at once?
-                    for granule_ur in granule_urs:
-                        cmr_query_dict = { 'granule_ur': [ granule_ur ] }
-                        browse_url = get_cog_urls_string(cmr_query_dict)
-                        if browse_url:
-                            browse_urls.append(browse_url)
-                    browse_urls_query_string = ','.join(browse_urls)
-                else:
-                    browse_urls_query_string = None
-                    collection = default_collections[short_name]
-                    browse_urls_query_string = get_cog_urls_string(collection_params(collection))
-
-                if not browse_urls_query_string:
-                    raise AssertionError('No browse images')
+                browse_urls_query_string = get_browse_urls_query_string(urls, granule_urs, short_name)
 
                 mosaic_url = gen_mosaic_url({
                     'z': z,
@@ -137,14 +244,32 @@ class GetTile(Resource):
                     'ext': ext,
                     'rescale': rescale
                 })
+                key = tile_key(mosaic_url)
+                etag = '"{}"'.format(key[:32])
+                headers = {
+                    'Content-Type': 'image/png',
+                    'Access-Control-Allow-Origin': '*'
+                }
+                # A tile URL always renders the same image, so its ETag is derived from the URL
+                cache_headers = {
+                    'ETag': etag,
+                    'Cache-Control': f'public, max-age={settings.WMTS_TILE_MAX_AGE_SECONDS}'
+                }
+                if request.if_none_match.contains(key[:32]):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={**headers, **cache_headers})
+
+                cached_tile = tile_cache.get(key)
+                if cached_tile is not None:
+                    return Response(cached_tile[0], 200, {**headers, **cache_headers, 'X-Cache': CACHE_HIT})
+
                 tile_response = get_tiles(mosaic_url)
+                if tile_response.status_code == 200:
+                    tile_cache.put(key, tile_response.content)
+                    headers.update(cache_headers)
                 response = Response(
                     tile_response.content,
                     tile_response.status_code,
-                    {
-                        'Content-Type': 'image/png',
-                        'Access-Control-Allow-Origin': '*'
-                    })
+                    {**headers, 'X-Cache': CACHE_MISS})
                 return response
             except:
                 exception = sys.exc_info()
@@ -162,26 +287,37 @@ class GetTile(Resource):
 
 def get_mosaic_tilejson(urls_query_string=''):
     mosaic_tilejson_url = settings.TILER_ENDPOINT + '/mosaic/tilejson.json?urls=' + urls_query_string
-    r = requests.get(mosaic_tilejson_url)
+    r = tiler_session.get(mosaic_tilejson_url, timeout=settings.WMTS_CAPABILITIES_LAYER_TIMEOUT_SECONDS)
+    r.raise_for_status()
     return r.json()
 
 def get_stats(url, bbox):
     stats_url = settings.TILER_ENDPOINT + '/bbox?url=' + url + '&bbox=' + bbox
-    r = requests.get(stats_url)
+    r = tiler_session.get(stats_url, timeout=settings.WMTS_CAPABILITIES_LAYER_TIMEOUT_SECONDS)
+    r.raise_for_status()
     return r.json()
 
 @ns.route('/GetCapabilities')
 class GetCapabilities(Resource):
 
     def generate_layer_info(self, key, urls_query_string, collection={}):
-        meta = get_mosaic_tilejson(urls_query_string)
-        bbox = meta['bounds']
+        # Tiler failures degrade the layer (world bounds, default rescale)
+        # rather than failing the whole capabilities document
+        try:
+            meta = get_mosaic_tilejson(urls_query_string)
+            bbox = meta['bounds']
+        except Exception as e:
+            log.warning(f"Failed to fetch tilejson for WMTS layer {key}, using world bounds: {e}")
+            bbox = WORLD_BOUNDS
         stats = None
         rescale = '-1,1'
         if len(urls_query_string.split(',')) == 1:
-            stats_resp = get_stats(urls_query_string, ','.join(map(str, bbox)))
-            stats = stats_resp['statistics']['1']
-            rescale = ','.join([str(stats['pc'][0]), str(stats['pc'][1])])
+            try:
+                stats_resp = get_stats(urls_query_string, ','.join(map(str, bbox)))
+                stats = stats_resp['statistics']['1']
+                rescale = ','.join([str(stats['pc'][0]), str(stats['pc'][1])])
+            except Exception as e:
+                log.warning(f"Failed to fetch stats for WMTS layer {key}: {e}")
 
         layer_info = {
             'layer_title': key,
@@ -218,10 +354,18 @@ class GetCapabilities(Resource):
             urls = get_cog_urls_string(request_args)
             layers.append(self.generate_layer_info(layer_title, urls))
         else:
-            for key, collection in default_collections.items():
+            def build_layer(key, collection):
                 browse_urls_query_string = get_cog_urls_string(collection_params(collection))
-                layer_info = self.generate_layer_info(key, browse_urls_query_string, collection)
-                layers.append(layer_info)
+                return self.generate_layer_info(key, browse_urls_query_string, collection)
+
+            # Layers are built concurrently; the document keeps the collection order
+            futures = [(key, capabilities_executor.submit(build_layer, key, collection))
+                       for key, collection in default_collections.items()]
+            for key, future in futures:
+                try:
+                    layers.append(future.result())
+                except Exception as e:
+                    log.error(f"Leaving WMTS layer {key} out of the capabilities document: {e}")
 
         context = {
             'service_title': 'MAAP WMTS',
@@ -235,9 +379,7 @@ class GetCapabilities(Resource):
             'tile_width': 256,
             'tile_height': 256
         }
-        ROOT = os.path.dirname(os.path.abspath(__file__))
-        template = open(os.path.join(ROOT, 'capabilities_template.xml'), 'r').read()
-        xml_string = render_template_string(template, **context)
+        xml_string = capabilities_template.render(**context)
         return xml_string
 
     def get(self):
@@ -247,16 +389,34 @@ class GetCapabilities(Resource):
         wmts_collections.py. If query parameters are provided, it will
         provide a layer built using those query parameters, discovering
         browse imagery via CMR granule metadata.
+
+        Documents are cached per set of query parameters and refreshed in
+        the background, and carry an ETag for conditional (304) requests.
         :return:
         """
         try:
-            get_capabilities_object = self.generate_capabilities(request.args)
-            # Return get capabilities
-            response = Response(get_capabilities_object, 200, {
+            key = capabilities_cache_key(request.args)
+            app = current_app._get_current_object()
+            # Bound now: stale entries are re-rendered outside of this request
+            request_args = ImmutableMultiDict(request.args)
+            capabilities = capabilities_cache.get_or_fetch(
+                key,
+                lambda: render_capabilities(app, request_args),
+                request.headers.get('Cache-Control'))
+            capabilities_refresher.track(app, key)
+
+            headers = {
                 'Content-Type': 'application/xml',
-                'Access-Control-Allow-Origin': '*'
-            })
-            return response
+                'Access-Control-Allow-Origin': '*',
+                'ETag': capabilities.headers['ETag'],
+                'X-Cache': capabilities.cache_status,
+                'Cache-Control': 'public, max-age={}'.format(
+                    int(max(0, (capabilities.ttl or 0) - capabilities.age())))
+            }
+            if request.if_none_match.contains(capabilities.headers['ETag'].strip('"')):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            # Return get capabilities
+            return Response(capabilities.content, 200, headers)
         except Exception as ex:
             response_body = dict()
             log.error(str(ex))
@@ -266,3 +426,72 @@ class GetCapabilities(Resource):
             response_body["error"] = str(ex)
             response_body["success"] = False
             return response_body
+
+
+
+def capabilities_cache_key(request_args):
+    """Request args with keys sorted; repeated values keep their order."""
+    return tuple(sorted((k, tuple(v)) for k, v in request_args.lists()))
+
+
+def render_capabilities(app, request_args):
+    """Render a capabilities document as a cacheable response with a content ETag."""
+    with app.app_context():
+        xml_string = GetCapabilities().generate_capabilities(request_args)
+    content = xml_string.encode('utf-8')
+    return CachedResponse(status.HTTP_200_OK, {
+        'Content-Type': 'application/xml',
+        'ETag': '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+    }, content)
+
+
+class CapabilitiesRefresher:
+    """
+    Re-renders the capabilities documents requested since the previous run on
+    a daemon thread every ``interval_seconds``, so map clients keep getting
+    cached documents without waiting on CMR or the tiler after they expire.
+    Only the ``max_documents`` most recently requested documents are refreshed
+    per run, so one-off searches cannot make a run render without bound.
+    """
+
+    def __init__(self, cache, interval_seconds, max_documents=16):
+        self._cache = cache
+        self._interval_seconds = interval_seconds
+        self._requested = LRUCache(maxsize=max_documents)
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def track(self, app, key):
+        if self._interval_seconds <= 0 or not self._cache.enabled:
+            return
+        with self._lock:
+            self._requested[key] = True
+            if self._app is None:
+                self._app = app
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="wmts-capabilities-refresher", daemon=True)
+                self._thread.start()
+
+    def refresh(self):
+        with self._lock:
+            keys = list(self._requested.keys())
+            self._requested.clear()
+        for key in keys:
+            try:
+                request_args = ImmutableMultiDict([(k, v) for k, values in key for v in values])
+                self._cache.put(key, render_capabilities(self._app, request_args))
+            except Exception:
+                log.exception(f"Background refresh of WMTS capabilities failed for {key}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._interval_seconds):
+            self.refresh()
+
+
+capabilities_refresher = CapabilitiesRefresher(capabilities_cache, settings.WMTS_CAPABILITIES_REFRESH_SECONDS,
+                                               settings.WMTS_CAPABILITIES_REFRESH_MAX_DOCUMENTS)
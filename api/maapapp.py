@@ -5,7 +5,7 @@ import logging.config
 import os
 from flask import Flask, Blueprint, request, session
 from api import settings
-from api.auth.cas_auth import validate
+from api.auth.cas_auth import validate, load_proxy_decryption_key
 from api.utils.environments import Environments, get_environment
 from api.utils.url_util import proxied_url
 from api.endpoints.cmr import ns as cmr_collections_namespace
@@ -20,6 +20,7 @@ from api.endpoints.organizations import ns as organizations_namespace
 from api.endpoints.admin import ns as admin_namespace
 from api.endpoints.build import ns as build_namespace
 from api.endpoints.gateway import ns as gateway_namespace
+from api.endpoints.three_dimensional_tiles import ns as three_dimensional_tiles_namespace
 from api.restplus import api
 from api.maap_database import db
 from api.models import initialize_sql
@@ -51,6 +52,10 @@ initialize_sql(db.engine)
 # Create any new tables
 db.create_all()
 
+# Parse the proxy ticket decryption key once rather than on every request
+if settings.CAS_PROXY_DECRYPTION_TOKEN:
+    load_proxy_decryption_key()
+
 
 @app.after_request
 def add_security_headers(response):
@@ -143,6 +148,7 @@ def initialize_app(flask_app):
     api.add_namespace(admin_namespace)
     api.add_namespace(build_namespace)
     api.add_namespace(gateway_namespace)
+    api.add_namespace(three_dimensional_tiles_namespace)
     flask_app.register_blueprint(blueprint)
 
 
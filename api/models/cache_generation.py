@@ -0,0 +1,14 @@
+from api.models import Base
+from api.maap_database import db
+
+
+class CacheGeneration(Base):
+    __tablename__ = 'cache_generation'
+
+    # Cached entries are keyed by the generation of their cache, so bumping it here
+    # invalidates them in every worker process at once.
+    name = db.Column(db.String(), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return "<CacheGeneration(name={self.name!r}, generation={self.generation!r})>".format(self=self)
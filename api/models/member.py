@@ -1,3 +1,4 @@
+from sqlalchemy import func
 from api.models import Base
 from api.maap_database import db
 from api.models.role import Role
@@ -22,6 +23,18 @@ class Member(Base):
     gitlab_token = db.Column(db.String())
     creation_date = db.Column(db.DateTime())
 
+    # Case-insensitive prefix search of the member directory (lower(column) LIKE 'prefix%')
+    __table_args__ = (
+        db.Index('ix_member_lower_username', func.lower(username).label('lower_username'),
+                 postgresql_ops={'lower_username': 'text_pattern_ops'}),
+        db.Index('ix_member_lower_email', func.lower(email).label('lower_email'),
+                 postgresql_ops={'lower_email': 'text_pattern_ops'}),
+        db.Index('ix_member_lower_first_name', func.lower(first_name).label('lower_first_name'),
+                 postgresql_ops={'lower_first_name': 'text_pattern_ops'}),
+        db.Index('ix_member_lower_last_name', func.lower(last_name).label('lower_last_name'),
+                 postgresql_ops={'lower_last_name': 'text_pattern_ops'}),
+    )
+
     def get_display_name(self):
         return "{} {}".format(self.first_name, self.last_name)
 
@@ -0,0 +1,175 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cachetools import LRUCache
+
+from api.utils.shared_cache import MemoryCacheBackend
+
+log = logging.getLogger(__name__)
+
+
+class _InFlightRefresh:
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+
+
+def get_broker_token_expiration(broker_token, now):
+    """Return the absolute expiration of a Keycloak broker token set, preferring
+    accessTokenExpiration (epoch seconds) and falling back to expires_in."""
+    if broker_token.get("accessTokenExpiration") is not None:
+        return datetime.fromtimestamp(broker_token["accessTokenExpiration"], timezone.utc)
+    if broker_token.get("expires_in") is not None:
+        return now + timedelta(seconds=int(broker_token["expires_in"]))
+    return None
+
+
+class EdlTokenRefresher:
+    """
+    Tracks active members' EarthData Login token expirations and refreshes them
+    ahead of expiry on a daemon thread, so authenticated requests rarely wait on
+    the Keycloak broker.
+
+    ``fetch`` takes a Keycloak access token and returns the broker token set (or
+    None on failure). The broker only accepts a live access token, so members are
+    refreshed in the background only while the access token from their latest
+    request is unexpired; after that they wait for their next request. ``persist`` takes ``(member_id, urs_token)`` and stores the
+    refreshed token; it runs inside the application context of the app that was
+    passed to ``track``. Tracked members are held in a bounded LRU, and
+    concurrent refreshes for the same member share a single broker call.
+
+    Token expirations live in ``expirations`` (a shared cache backend), so a
+    refresh done by one worker is visible to the others.
+    """
+
+    def __init__(self, fetch, persist, max_members, refresh_ahead, interval_seconds,
+                 wait_timeout_seconds=None, enabled=True, expirations=None):
+        self._fetch = fetch
+        self._persist = persist
+        self._refresh_ahead = refresh_ahead
+        self._interval_seconds = interval_seconds
+        self._wait_timeout_seconds = wait_timeout_seconds
+        self._enabled = enabled
+        self._tracked = LRUCache(maxsize=max_members)
+        self._expirations = expirations or MemoryCacheBackend('edl-token-expiration', max_members)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def track(self, app, member_id, kc_access_token, kc_token_expiration=None):
+        """Remember the latest Keycloak token for a member, and when it expires
+        (epoch seconds, the JWT ``exp`` claim) if known, and make sure the
+        background worker is running."""
+        if kc_token_expiration is not None:
+            kc_token_expiration = datetime.fromtimestamp(kc_token_expiration, timezone.utc)
+        with self._lock:
+            self._tracked[member_id] = (kc_access_token, kc_token_expiration)
+            if self._app is None:
+                self._app = app
+        self._ensure_started()
+
+    def forget(self, member_id):
+        with self._lock:
+            self._tracked.pop(member_id, None)
+
+    def get_expiration(self, member_id):
+        expiration = self._expirations.get(str(member_id))
+        return datetime.fromtimestamp(expiration, timezone.utc) if expiration is not None else None
+
+    def refresh(self, member_id, kc_access_token=None):
+        """
+        Fetch a new EDL token for the member now and return it, or None on failure.
+        If a refresh for the same member is already running on another thread,
+        wait for its result instead of calling the broker again.
+        """
+        with self._lock:
+            in_flight = self._in_flight.get(member_id)
+            is_owner = in_flight is None
+            if is_owner:
+                in_flight = _InFlightRefresh()
+                self._in_flight[member_id] = in_flight
+            if kc_access_token is None:
+                kc_access_token = self._get_live_kc_token(member_id)
+
+        if not is_owner:
+            in_flight.done.wait(self._wait_timeout_seconds)
+            return in_flight.token
+
+        try:
+            in_flight.token = self._fetch_token(member_id, kc_access_token)
+        finally:
+            with self._lock:
+                self._in_flight.pop(member_id, None)
+            in_flight.done.set()
+        return in_flight.token
+
+    def refresh_due_tokens(self):
+        """Refresh and persist every tracked token that expires within the
+        refresh-ahead window. Members whose Keycloak token has expired, or whose
+        refresh fails, stop being tracked until their next authenticated request."""
+        cutoff = datetime.now(timezone.utc) + self._refresh_ahead
+        with self._lock:
+            tracked = list(self._tracked.keys())
+        due = [member_id for member_id in tracked
+               if (self.get_expiration(member_id) or cutoff) <= cutoff]
+
+        for member_id in due:
+            if self._get_live_kc_token(member_id) is None:
+                self.forget(member_id)
+                continue
+            try:
+                token = self.refresh(member_id)
+                if token:
+                    self._persist(member_id, token)
+                else:
+                    self.forget(member_id)
+            except Exception:
+                log.exception(f"Background EDL token refresh failed for member {member_id}")
+                self.forget(member_id)
+
+    def stop(self):
+        self._stop.set()
+
+    def _get_live_kc_token(self, member_id):
+        """Return the tracked Keycloak token of a member, or None once it has expired."""
+        kc_access_token, kc_token_expiration = self._tracked.get(member_id, (None, None))
+        if kc_token_expiration is not None and kc_token_expiration <= datetime.now(timezone.utc):
+            return None
+        return kc_access_token
+
+    def _fetch_token(self, member_id, kc_access_token):
+        if not kc_access_token:
+            return None
+
+        now = datetime.now(timezone.utc)
+        broker_token = self._fetch(kc_access_token)
+        if not broker_token or not broker_token.get("access_token"):
+            return None
+
+        expiration = get_broker_token_expiration(broker_token, now)
+        if expiration is not None:
+            self._expirations.set(str(member_id), expiration.timestamp(),
+                                  ttl=(expiration - now).total_seconds())
+        else:
+            self._expirations.delete(str(member_id))
+        return broker_token["access_token"]
+
+    def _ensure_started(self):
+        if not self._enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="edl-token-refresher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._interval_seconds):
+            try:
+                with self._app.app_context():
+                    self.refresh_due_tokens()
+            except Exception:
+                log.exception("EDL token refresher iteration failed")
@@ -0,0 +1,91 @@
+import math
+
+POLYGON_SHAPE_TYPES = (5, 15, 25)  # POLYGON, POLYGONZ, POLYGONM
+
+
+def signed_area(ring):
+    """Shoelace area of a closed ring; positive when the ring is counter-clockwise."""
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:])) / 2
+
+
+def _distance_to_segment(point, start, end):
+    (px, py), (ax, ay), (bx, by) = point, start, end
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker line simplification. The first and last points are always kept."""
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(first + 1, last):
+            distance = _distance_to_segment(points[i], points[first], points[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def reduce_ring(ring, max_points):
+    """
+    Simplify a closed ring until it has at most ``max_points`` points (closing
+    point included), doubling the tolerance from a small fraction of the ring's
+    extent. Returns None if the ring cannot be reduced to a valid polygon.
+    """
+    ring = [tuple(point[:2]) for point in ring]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+
+    xs, ys = [x for x, _ in ring], [y for _, y in ring]
+    tolerance = math.hypot(max(xs) - min(xs), max(ys) - min(ys)) * 1e-4
+    simplified = ring
+    while len(simplified) > max_points and tolerance > 0:
+        simplified = simplify(ring, tolerance)
+        tolerance *= 2
+
+    if len(simplified) < 4 or len(simplified) > max_points:
+        return None
+    return simplified
+
+
+def shape_polygons(shapes, max_points):
+    """
+    Return the exterior rings of the polygon ``shapes`` (pyshp Shape objects) as
+    counter-clockwise rings of at most ``max_points`` points each, the
+    orientation CMR expects. Holes are dropped, which can only widen the search.
+    Returns None if any shape is not a polygon or a ring cannot be reduced.
+    """
+    rings = []
+    for shape in shapes:
+        if shape.shapeType not in POLYGON_SHAPE_TYPES:
+            return None
+        bounds = list(shape.parts) + [len(shape.points)]
+        for start, end in zip(bounds, bounds[1:]):
+            ring = shape.points[start:end]
+            # Shapefile exterior rings are clockwise, holes counter-clockwise
+            if len(ring) < 4 or signed_area(ring) >= 0:
+                continue
+            reduced = reduce_ring(ring, max_points)
+            if reduced is None:
+                return None
+            rings.append(list(reversed(reduced)))
+    return rings or None
+
+
+def format_polygon(ring):
+    """Format a ring as a CMR ``polygon`` parameter (lon1,lat1,lon2,lat2,...)."""
+    return ','.join(f'{round(x, 6)},{round(y, 6)}' for x, y in ring)
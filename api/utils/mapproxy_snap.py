@@ -1,6 +1,16 @@
 import copy
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time as time_module
 import requests
-from io import StringIO
+from contextlib import closing
+from io import BytesIO, StringIO
+
+from cachetools import LRUCache
 
 from PIL import Image, ImageChops
 from mapproxy.request import Request
@@ -12,6 +22,10 @@ from requests_file import FileAdapter
 from owslib.wmts import TileMatrix, testXMLValue, _TILE_MATRIX_TAG, _IDENTIFIER_TAG, _SCALE_DENOMINATOR_TAG, \
     _TOP_LEFT_CORNER_TAG, _TILE_WIDTH_TAG, _TILE_HEIGHT_TAG, _MATRIX_WIDTH_TAG, _MATRIX_HEIGHT_TAG
 
+from api import settings
+
+log = logging.getLogger(__name__)
+
 
 def tilematrixinit(self, elem):
     if elem.tag != _TILE_MATRIX_TAG:
@@ -42,31 +56,307 @@ def tilematrixinit(self, elem):
     self.matrixheight = int(float(mh)) # Fix here, Lunar xml files have decimals which causes int() to error
 
 
-def request(method, url, **kwargs):
+# Applied once: owslib rejects the decimal MatrixWidth/MatrixHeight found in some (e.g. Lunar) capabilities
+TileMatrix.__init__ = tilematrixinit
+
+# Capabilities are fetched with our own session, which also understands file:// URLs
+capabilities_session = requests.Session()
+capabilities_session.mount('file://', FileAdapter())
+
+
+class WmtsService:
+    """
+    A parsed WMTS GetCapabilities document plus the mapproxy grid definitions
+    derived from its tile matrix sets, which are computed once per tile matrix
+    set and reused for every layer and configuration built from the service.
+    """
+
+    def __init__(self, wmts, etag=None, last_modified=None, digest=None):
+        self.wmts = wmts
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.checked_at = time_module.time()
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    @property
+    def contents(self):
+        return self.wmts.contents
+
+    @property
+    def tilematrixsets(self):
+        return self.wmts.tilematrixsets
+
+    def grid(self, tilematrixsetkey):
+        with self._lock:
+            if tilematrixsetkey not in self._grids:
+                self._grids[tilematrixsetkey] = create_grid(self.wmts.tilematrixsets[tilematrixsetkey])
+            return self._grids[tilematrixsetkey]
+
+
+class WmtsServiceCache:
     """
-    This method is to override the requests.request library method so that it will accept local files. Please see the
-    documentation/code for requests.request (in api.py) for more information.
-    :param method:
-    :param url:
-    :param kwargs:
-    :return:
+    Parsed WMTS services keyed by URL. Entries younger than ``ttl_seconds`` are
+    used as is; older ones are revalidated with If-None-Match/If-Modified-Since,
+    and a 304 (or, for servers and files without validators, an identical
+    document) keeps the parsed service instead of parsing it again.
     """
-    with requests.sessions.Session() as session:
-        session.mount('file://', FileAdapter())
-        return session.request(method=method, url=url, **kwargs)
 
+    def __init__(self, maxsize, ttl_seconds, timeout_seconds=30):
+        self._services = LRUCache(maxsize=maxsize)
+        self._ttl_seconds = ttl_seconds
+        self._timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._services.clear()
+
+    def get(self, serviceurl):
+        with self._lock:
+            service = self._services.get(serviceurl)
+        if service is not None and time_module.time() - service.checked_at < self._ttl_seconds:
+            return service
+
+        headers = {}
+        if service is not None and service.etag:
+            headers['If-None-Match'] = service.etag
+        if service is not None and service.last_modified:
+            headers['If-Modified-Since'] = service.last_modified
+
+        response = capabilities_session.get(serviceurl, headers=headers, timeout=self._timeout_seconds)
+        if service is not None and response.status_code == 304:
+            service.checked_at = time_module.time()
+            return service
+        response.raise_for_status()
+
+        digest = hashlib.sha256(response.content).hexdigest()
+        if service is not None and service.digest == digest:
+            service.checked_at = time_module.time()
+            return service
+
+        service = WmtsService(WebMapTileService(serviceurl, xml=response.content),
+                              etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get('Last-Modified'),
+                              digest=digest)
+        with self._lock:
+            self._services[serviceurl] = service
+        return service
+
+
+wmts_service_cache = WmtsServiceCache(maxsize=settings.WMTS_SERVICE_CACHE_SIZE,
+                                      ttl_seconds=settings.WMTS_SERVICE_CACHE_TTL_SECONDS,
+                                      timeout_seconds=settings.REQUESTS_TIMEOUT_SECONDS)
+
+
+class TileStorage:
+    """
+    Opt-in on-disk storage for the mapproxy caches built by create_config, so
+    repeated renders over the same area are served from local tiles instead of
+    being downloaded from the upstream WMTS again.
+
+    Each layer gets its own directory under ``directory``, using the mapproxy
+    ``file`` (one file per tile) or ``sqlite`` (one database per zoom level)
+    cache type. Tiles older than ``ttl_seconds`` are refreshed by mapproxy and
+    removed by cleanup(), which also deletes the least recently stored tiles
+    until the total size is within ``max_bytes``. mapproxy does not record tile
+    reads, so the cleanup order is by store time.
+    """
 
-def create_config_wmts(serviceurls, layernames=()):
+    BACKENDS = ('file', 'sqlite')
+
+    def __init__(self, backend, directory, max_bytes, ttl_seconds=0, cleanup_interval_seconds=300):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unsupported mapproxy tile storage backend: {backend}")
+        self.backend = backend
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._last_cleanup = 0
+        self._cleanup_thread = None
+        self._lock = threading.Lock()
+
+    def cache_config(self, layername):
+        """The storage part of a mapproxy cache configuration for a layer."""
+        layer_directory = os.path.join(self.directory, re.sub(r'[^A-Za-z0-9._-]', '_', layername))
+        conf = {
+            'cache': {
+                'type': self.backend,
+                'directory': layer_directory,
+                'tile_lock_dir': os.path.join(self.directory, 'tile_locks')
+            }
+        }
+        if self.ttl_seconds > 0:
+            conf['refresh_before'] = {'seconds': self.ttl_seconds}
+            if self.backend == 'sqlite':
+                conf['cache']['ttl'] = self.ttl_seconds
+        return conf
+
+    def schedule_cleanup(self):
+        """Run cleanup() on a background thread, at most once per cleanup interval."""
+        with self._lock:
+            now = time_module.time()
+            if now - self._last_cleanup < self.cleanup_interval_seconds or \
+                    (self._cleanup_thread is not None and self._cleanup_thread.is_alive()):
+                return
+            self._last_cleanup = now
+            self._cleanup_thread = threading.Thread(target=self._cleanup_safely, name="mapproxy-tile-cleanup",
+                                                    daemon=True)
+            self._cleanup_thread.start()
+
+    def cleanup(self, now=None):
+        """Remove expired tiles, then the oldest ones until the storage fits its budget. Returns the bytes freed."""
+        now = now or time_module.time()
+        tiles = self._file_tiles() if self.backend == 'file' else self._sqlite_tiles()
+        tiles.sort(key=lambda tile: tile[0])
+
+        total = sum(tile[1] for tile in tiles)
+        expired_before = now - self.ttl_seconds if self.ttl_seconds > 0 else None
+        evicted = []
+        for stored_at, size, location in tiles:
+            if total <= self.max_bytes and (expired_before is None or stored_at >= expired_before):
+                break
+            evicted.append(location)
+            total -= size
+
+        freed = sum(tile[1] for tile in tiles) - total
+        if self.backend == 'file':
+            for path in evicted:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        else:
+            self._delete_sqlite_tiles(evicted)
+        return freed
+
+    def _cleanup_safely(self):
+        try:
+            self.cleanup()
+        except Exception:
+            log.exception("mapproxy tile storage cleanup failed")
+
+    def _file_tiles(self):
+        tiles = []
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if d != 'tile_locks']
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, path))
+        return tiles
+
+    def _sqlite_tiles(self):
+        tiles = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.mbtile'):
+                    path = os.path.join(root, name)
+                    with closing(sqlite3.connect(path)) as db:
+                        rows = db.execute("SELECT strftime('%s', last_modified, 'utc'), length(tile_data), rowid "
+                                          "FROM tiles").fetchall()
+                    tiles += [(float(stored_at or 0), size or 0, (path, rowid)) for stored_at, size, rowid in rows]
+        return tiles
+
+    def _delete_sqlite_tiles(self, locations):
+        by_database = {}
+        for path, rowid in locations:
+            by_database.setdefault(path, []).append((rowid,))
+        for path, rowids in by_database.items():
+            with closing(sqlite3.connect(path)) as db:
+                db.executemany("DELETE FROM tiles WHERE rowid = ?", rowids)
+                db.commit()
+
+
+def get_tile_storage():
+    """The TileStorage configured by MAPPROXY_TILE_STORAGE, or None when tiles are not stored."""
+    if not settings.MAPPROXY_TILE_STORAGE:
+        return None
+    return TileStorage(settings.MAPPROXY_TILE_STORAGE, settings.MAPPROXY_TILE_STORAGE_PATH,
+                       settings.MAPPROXY_TILE_STORAGE_MAX_BYTES, settings.MAPPROXY_TILE_STORAGE_TTL_SECONDS,
+                       settings.MAPPROXY_TILE_STORAGE_CLEANUP_SECONDS)
+
+
+def create_config_wmts(serviceurls, layernames=(), storage=None):
     """
     This method creates an in-memory version of the mapproxy configuration file, derived from the GetCapabilities
     xml file. This has only been tested on OnEarth-based tile servers such as GIBS and PO.DAAC.
+    Parsed services are cached, see WmtsServiceCache.
     :param serviceurls: A list of URIs to xml files or wmts service endpoints.
     :param layernames: An optional list of layer names, otherwise it will create a config file with all layers.
+    :param storage: An optional TileStorage for the caches, otherwise tiles are not stored.
     :return: The in-memory version of the mapproxy configuration file.
     """
-    requests.request = request  # do the ugly hack
-    TileMatrix.__init__ = tilematrixinit # do more ugly hacks
+    return create_config([wmts_service_cache.get(serviceurl) for serviceurl in serviceurls], layernames, storage)
+
 
+def create_config_wmts_xml(capabilities_xml, layernames=(), serviceurl='', storage=None):
+    """
+    Same as create_config_wmts, but from a GetCapabilities document already in memory, so nothing is written to
+    or read back from disk.
+    :param capabilities_xml: The GetCapabilities xml (str or bytes).
+    :param layernames: An optional list of layer names, otherwise it will create a config file with all layers.
+    :param serviceurl: The URL the document describes; informational only.
+    :param storage: An optional TileStorage for the caches, otherwise tiles are not stored.
+    :return: The in-memory version of the mapproxy configuration file.
+    """
+    if isinstance(capabilities_xml, str):
+        capabilities_xml = capabilities_xml.encode('utf-8')
+    return create_config([WmtsService(WebMapTileService(serviceurl, xml=capabilities_xml))], layernames, storage)
+
+
+def create_grid(tilematrixset):
+    """
+    The mapproxy grid definition for a WMTS tile matrix set.
+    :param tilematrixset: An owslib TileMatrixSet.
+    :return: The grid configuration dictionary.
+    """
+    # https://help.openstreetmap.org/questions/9510/understanding-scale
+    magicnumber = 397569610  # see OSM article regarding scale
+    tilematrixsetkeys = natsorted(tilematrixset.tilematrix.keys())
+    firsttilematrix = tilematrixset.tilematrix[tilematrixsetkeys[0]]
+    gridtilesize = [firsttilematrix.tilewidth, firsttilematrix.tileheight]
+
+    if tilematrixset.crs == "urn:ogc:def:crs:EPSG:6.18.3:3857":
+        return {
+            'base': 'GLOBAL_WEBMERCATOR',
+            'tile_size': gridtilesize
+        }
+
+    gridres = []
+
+    for tilematrixsetid in tilematrixsetkeys:
+        tilematrix = tilematrixset.tilematrix[tilematrixsetid]
+        sd = tilematrix.scaledenominator
+        gridres.append(round(sd / magicnumber, 12))
+
+    gridbbox = [int(round(firsttilematrix.topleftcorner[0])),
+                int(round(firsttilematrix.topleftcorner[1] - (gridres[0] * gridtilesize[0]))),
+                int(round(firsttilematrix.topleftcorner[0] + 2 * (gridres[0] * gridtilesize[0]))),
+                int(round(firsttilematrix.topleftcorner[1]))]
+
+    return {
+        'srs': 'EPSG:4326',
+        'bbox': gridbbox,
+        'tile_size': gridtilesize,
+        'res': gridres,
+        'origin': 'ul'
+    }
+
+
+def create_config(wmtsconfs, layernames=(), storage=None):
+    """
+    Build the in-memory mapproxy configuration from parsed WMTS services.
+    :param wmtsconfs: A list of WmtsService objects.
+    :param layernames: An optional list of layer names, otherwise it will create a config file with all layers.
+    :param storage: An optional TileStorage for the caches, otherwise tiles are not stored.
+    :return: The in-memory version of the mapproxy configuration file.
+    """
     # An empty configuration file with known defaults
     mapproxy_conf = {
         'services': {
@@ -102,10 +392,6 @@ def create_config_wmts(serviceurls, layernames=()):
         }
     }
 
-    wmtsconfs = []
-    for serviceurl in serviceurls:
-        wmtsconfs.append(WebMapTileService(serviceurl))
-
     if len(layernames) == 0:
         layernames = []
         for wmtsconf in wmtsconfs:
@@ -128,40 +414,8 @@ def create_config_wmts(serviceurls, layernames=()):
                 # thus each now needs to be unique. That's why there's a gridkey and tilematrixsetkey.
 
                 if gridkey not in mapproxy_conf['grids']:
-                    # Generate grid
-                    # https://help.openstreetmap.org/questions/9510/understanding-scale
-                    magicnumber = 397569610  # see OSM article regarding scale
-                    tilematrixset = wmtsconf.tilematrixsets[tilematrixsetkey]
-                    tilematrixsetkeys = natsorted(tilematrixset.tilematrix.keys())
-                    firsttilematrix = tilematrixset.tilematrix[tilematrixsetkeys[0]]
-                    gridtilesize = [firsttilematrix.tilewidth, firsttilematrix.tileheight]
-                    
-                    if tilematrixset.crs == "urn:ogc:def:crs:EPSG:6.18.3:3857":
-                        mapproxy_conf['grids'][gridkey] = {
-                            'base': 'GLOBAL_WEBMERCATOR',
-                            'tile_size': gridtilesize
-                        }
-                    else:
-
-                        gridres = []
-
-                        for tilematrixsetid in tilematrixsetkeys:
-                            tilematrix = tilematrixset.tilematrix[tilematrixsetid]
-                            sd = tilematrix.scaledenominator
-                            gridres.append(round(sd / magicnumber, 12))
-
-                        gridbbox = [int(round(firsttilematrix.topleftcorner[0])),
-                                    int(round(firsttilematrix.topleftcorner[1] - (gridres[0] * gridtilesize[0]))),
-                                    int(round(firsttilematrix.topleftcorner[0] + 2 * (gridres[0] * gridtilesize[0]))),
-                                    int(round(firsttilematrix.topleftcorner[1]))]
-
-                        mapproxy_conf['grids'][gridkey] = {
-                            'srs': 'EPSG:4326',
-                            'bbox': gridbbox,
-                            'tile_size': gridtilesize,
-                            'res': gridres,
-                            'origin': 'ul'
-                        }
+                    # Copied since callers may modify the configuration
+                    mapproxy_conf['grids'][gridkey] = copy.deepcopy(wmtsconf.grid(tilematrixsetkey))
 
                 urltemplate = wmtsconf.contents[layername].resourceURLs[0]['template']
                 url = urltemplate.replace(
@@ -192,8 +446,11 @@ def create_config_wmts(serviceurls, layernames=()):
                     'grids': [gridkey],
                     'sources': [sourcekey],
                     'format': sourceformat,
-                    'disable_storage': True
                 }
+                if storage is not None:
+                    mapproxy_conf['caches'][cachekey].update(storage.cache_config(layername))
+                else:
+                    mapproxy_conf['caches'][cachekey]['disable_storage'] = True
 
                 mapproxy_conf['layers'].append({
                     'name': layername,
@@ -207,17 +464,13 @@ def create_config_wmts(serviceurls, layernames=()):
     return mapproxy_conf
 
 
-def mapit(mapproxy_conf, layername, outputmimeformat, lonlatbbox, imagesize, outputfilename=None, time=None):
+def build_services(mapproxy_conf, time=None):
     """
-    This automates the creation of a map image.
+    Build the mapproxy services for a configuration. This is the expensive part of rendering a map, so callers
+    that render the same layers repeatedly should keep the result and pass it to render_map.
     :param mapproxy_conf: The mapproxy in-memory configuration dictionary.
-    :param layername: The name of the layer to image.
-    :param outputmimeformat: The mime format (i.e. image/png, image/jpeg) of the output
-    :param lonlatbbox: The bounding box as a tuple, (west, south, east, north)
-    :param imagesize: The images size as a tuple, (width, height)
-    :param outputfilename: An optional output filename, if None, then no file will be written.
     :param time: An optional time string for layers that have the time dimension
-    :return: The binary data for the image generated.
+    :return: The configured mapproxy services.
     """
     if time is None:
         time = ''
@@ -225,6 +478,20 @@ def mapit(mapproxy_conf, layername, outputmimeformat, lonlatbbox, imagesize, out
     for source in mapproxy_conf['sources']:
         mapproxy_conf['sources'][source]['url'] = mapproxy_conf['sources'][source]['url'].replace("{Time}", time)
 
+    conf = ProxyConfiguration(mapproxy_conf, conf_base_dir='', seed=False, renderd=False)
+    return conf.configured_services()
+
+
+def render_map(services, layername, outputmimeformat, lonlatbbox, imagesize):
+    """
+    Render a map image with services built by build_services.
+    :param services: The configured mapproxy services.
+    :param layername: The name of the layer to image.
+    :param outputmimeformat: The mime format (i.e. image/png, image/jpeg) of the output
+    :param lonlatbbox: The bounding box as a tuple, (west, south, east, north)
+    :param imagesize: The images size as a tuple, (width, height)
+    :return: The binary data for the image generated.
+    """
     transparent = 'false'
     if 'png' in outputmimeformat.lower():
         transparent = 'true'
@@ -234,10 +501,6 @@ def mapit(mapproxy_conf, layername, outputmimeformat, lonlatbbox, imagesize, out
         imagesize[0],
         imagesize[1])
 
-    conf = ProxyConfiguration(mapproxy_conf, conf_base_dir='', seed=False, renderd=False)
-
-    services = conf.configured_services()
-
     myreq = {
         'QUERY_STRING': querystring,
         'SERVER_NAME': '',
@@ -246,10 +509,44 @@ def mapit(mapproxy_conf, layername, outputmimeformat, lonlatbbox, imagesize, out
     }
 
     response = services[0].handle(Request(myreq))
-    data = response.data
+    return response.data
+
+
+def composite_images(images, outputmimeformat):
+    """
+    Alpha-composite rendered layer images in order, the first one at the bottom.
+    :param images: The binary data of the images, all the same size.
+    :param outputmimeformat: The mime format (i.e. image/png, image/jpeg) of the output
+    :return: The binary data for the composited image.
+    """
+    composite = None
+    for data in images:
+        image = Image.open(BytesIO(data)).convert('RGBA')
+        composite = image if composite is None else Image.alpha_composite(composite, image)
+
+    output = BytesIO()
+    if 'png' in outputmimeformat.lower():
+        composite.save(output, format='PNG')
+    else:
+        composite.convert('RGB').save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def mapit(mapproxy_conf, layername, outputmimeformat, lonlatbbox, imagesize, outputfilename=None, time=None):
+    """
+    This automates the creation of a map image.
+    :param mapproxy_conf: The mapproxy in-memory configuration dictionary.
+    :param layername: The name of the layer to image.
+    :param outputmimeformat: The mime format (i.e. image/png, image/jpeg) of the output
+    :param lonlatbbox: The bounding box as a tuple, (west, south, east, north)
+    :param imagesize: The images size as a tuple, (width, height)
+    :param outputfilename: An optional output filename, if None, then no file will be written.
+    :param time: An optional time string for layers that have the time dimension
+    :return: The binary data for the image generated.
+    """
+    data = render_map(build_services(mapproxy_conf, time), layername, outputmimeformat, lonlatbbox, imagesize)
 
     if outputfilename:
         f = open(outputfilename, "w")
         f.write(data)
     return data
-
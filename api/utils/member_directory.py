@@ -0,0 +1,105 @@
+import json
+import logging
+
+from sqlalchemy import func, or_
+
+from api.maap_database import db
+from api.models.member import Member
+from api.models.role import Role
+
+log = logging.getLogger(__name__)
+
+# Fields a member directory listing can return; see parse_fields()
+MEMBER_DIRECTORY_FIELDS = {
+    'id': Member.id,
+    'username': Member.username,
+    'first_name': Member.first_name,
+    'last_name': Member.last_name,
+    'email': Member.email,
+    'role_id': Member.role_id,
+    'role_name': Role.role_name,
+    'status': Member.status,
+    'creation_date': Member.creation_date,
+}
+
+# Prefix searched by ``q``; each has a lower() index on the member table
+MEMBER_SEARCH_COLUMNS = [Member.username, Member.email, Member.first_name, Member.last_name]
+
+
+def parse_fields(fields):
+    """
+    Validate a comma separated ``fields`` projection, returning the field names in
+    directory order (all of them when ``fields`` is empty). Raises ValueError for
+    unknown fields.
+    """
+    if not fields:
+        return list(MEMBER_DIRECTORY_FIELDS)
+
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - set(MEMBER_DIRECTORY_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [field for field in MEMBER_DIRECTORY_FIELDS if field in requested]
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_member_page(fields, search=None, after=None, limit=None):
+    """
+    Members ordered by username as dicts of ``fields``, starting after the
+    username ``after`` (keyset pagination) and optionally restricted to those
+    whose username, email, first or last name starts with ``search``
+    (case-insensitive). Returns at most ``limit`` members and the cursor of the
+    next page: the last returned username, or None when no members follow.
+    """
+    columns = [MEMBER_DIRECTORY_FIELDS[field].label(field) for field in fields]
+    if 'username' not in fields:
+        # Needed to order by and to build the next cursor
+        columns.append(Member.username.label('username'))
+
+    # Always joined, so that ``fields`` only changes the columns and never which
+    # members are listed
+    query = db.session.query(*columns).select_from(Member).join(Role, Member.role_id == Role.id)
+    if search:
+        pattern = _escape_like(search.lower()) + '%'
+        query = query.filter(or_(*[func.lower(column).like(pattern, escape='\\') for column in MEMBER_SEARCH_COLUMNS]))
+    if after:
+        query = query.filter(Member.username > after)
+    query = query.order_by(Member.username)
+    if limit:
+        # One extra row tells whether another page follows
+        query = query.limit(limit + 1)
+
+    rows = query.all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].username
+    return [format_member(row, fields) for row in rows], next_cursor
+
+
+def format_member(row, fields):
+    member = {field: getattr(row, field) for field in fields}
+    if member.get('creation_date') is not None:
+        member['creation_date'] = member['creation_date'].strftime('%m/%d/%Y')
+    return member
+
+
+def stream_member_directory(fields, search=None, batch_size=1000):
+    """
+    Yield the whole member directory as a JSON array, written incrementally from
+    keyset-paginated batches so that memory stays proportional to ``batch_size``.
+    """
+    yield '['
+    written = 0
+    after = None
+    while True:
+        page, after = get_member_page(fields, search=search, after=after, limit=batch_size)
+        if page:
+            yield (',' if written else '') + ','.join(json.dumps(member) for member in page)
+            written += len(page)
+        if after is None:
+            break
+    yield ']'
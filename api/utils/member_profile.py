@@ -0,0 +1,58 @@
+from sqlalchemy import select
+
+from api.maap_database import db
+from api.models.member import Member
+from api.models.member_session import MemberSession
+
+# Returned to anyone allowed to look the member up
+PUBLIC_PROFILE_COLUMNS = [
+    Member.id,
+    Member.username,
+    Member.first_name,
+    Member.last_name,
+    Member.email,
+    Member.status,
+    Member.public_ssh_key,
+    Member.creation_date,
+]
+
+# Only returned to the member themselves and DPS workers
+PRIVATE_PROFILE_COLUMNS = [
+    Member.public_ssh_key_name,
+    Member.public_ssh_key_modified_date,
+]
+
+
+def _latest_session_key():
+    return select(MemberSession.session_key) \
+        .where(MemberSession.member_id == Member.id) \
+        .order_by(MemberSession.id.desc()) \
+        .limit(1) \
+        .scalar_subquery() \
+        .label('session_key')
+
+
+def _serialize(value):
+    # Same representation as the marshmallow schemas: ISO 8601 datetimes
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def get_member_profile(username, columns, include_session_key=False):
+    """
+    Profile of the member ``username`` as a dict of ``columns`` (Member
+    attributes), plus the key of their latest session when
+    ``include_session_key`` is set and they have one, read in a single query.
+    Returns None when there is no such member.
+    """
+    entities = list(columns)
+    if include_session_key:
+        entities.append(_latest_session_key())
+
+    row = db.session.query(*entities).filter(Member.username == username).first()
+    if row is None:
+        return None
+
+    profile = {name: _serialize(value) for name, value in row._mapping.items()}
+    if profile.get('session_key', '') is None:
+        del profile['session_key']
+    return profile
@@ -13,6 +13,7 @@ from api.models.organization_job_queue import OrganizationJobQueue
 from api.models.organization_membership import OrganizationMembership
 from api.models.organization_s3_access import OrganizationS3Access
 from api.schemas.organization_schema import OrganizationSchema
+from api.utils.s3_access import invalidate_user_s3_policies
 
 log = logging.getLogger(__name__)
 
@@ -76,21 +77,13 @@ def get_organizations():
         raise ex
 
 def get_member_organizations(member_id):
-    result = []
-
     user_orgs = db.session \
-        .query(Organization, OrganizationMembership) \
-        .filter(Organization.id == OrganizationMembership.org_id) \
+        .query(Organization.id, Organization.name) \
+        .join(OrganizationMembership, Organization.id == OrganizationMembership.org_id) \
+        .filter(OrganizationMembership.member_id == member_id) \
         .order_by(Organization.name).all()
 
-    for user_org in user_orgs:
-        if user_org.OrganizationMembership.member_id == member_id:
-            result.append({
-                'id': user_org.Organization.id,
-                'name': user_org.Organization.name
-            })
-
-    return result
+    return [{'id': org.id, 'name': org.name} for org in user_orgs]
 
 def get_organization(org_id):
     try:
@@ -131,6 +124,7 @@ def create_organization(name, parent_org_id, default_job_limit_count, default_jo
                 db.session.rollback()
                 app.logger.error(f"Failed to add members to organization {new_org.id}: {e}")
                 raise
+            invalidate_user_s3_policies()
 
         org_schema = OrganizationSchema()
         return json.loads(org_schema.dumps(new_org))
@@ -177,6 +171,9 @@ def update_organization(org, members):
                 app.logger.error(f"Failed to add new members to organization {org.id}: {e}")
                 raise
 
+        # Members gained or lost the org's S3 access
+        invalidate_user_s3_policies()
+
         org_schema = OrganizationSchema()
         return json.loads(org_schema.dumps(org))
 
@@ -227,5 +224,7 @@ def delete_organization(org_id):
             app.logger.error(f"Failed to delete organization {org_id}: {e}")
             raise
 
+        invalidate_user_s3_policies()
+
     except SQLAlchemyError as ex:
         raise ex
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+
+from cachetools import LRUCache
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_STALE = "STALE"
+CACHE_BYPASS = "BYPASS"
+
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into a dict of lower-cased directives.
+    Directives without a value (e.g. ``no-store``) map to True."""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') if arg else True
+    return directives
+
+
+class CachedResponse:
+    """Immutable snapshot of an upstream HTTP response that is safe to share
+    between requests and threads."""
+
+    def __init__(self, status_code, headers, content, ttl=None, stored_at=None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = content
+        self.ttl = ttl
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        self.cache_status = CACHE_MISS
+
+    @classmethod
+    def from_response(cls, response, keep_headers=None):
+        """Build a snapshot from a ``requests.Response``, optionally keeping only
+        the named headers."""
+        headers = response.headers
+        if keep_headers is not None:
+            headers = {name: headers[name] for name in keep_headers if name in headers}
+        return cls(response.status_code, headers, response.content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    def age(self, now=None):
+        return max(0, (now or time.time()) - self.stored_at)
+
+    def with_cache_status(self, cache_status):
+        copy = CachedResponse(self.status_code, self.headers, self.content, self.ttl, self.stored_at)
+        copy.cache_status = cache_status
+        return copy
+
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache of upstream responses with a TTL and a
+    stale-while-revalidate window.
+
+    Entries younger than their TTL are served as hits. Entries past the TTL but
+    within ``stale_seconds`` are served immediately while a single background
+    refresh replaces them. Only 200 responses are stored, upstream
+    ``Cache-Control: no-store``/``private`` is respected and ``max-age`` can only
+    shorten the configured TTL.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds, stale_seconds=0, max_entry_bytes=None):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self._entries = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: max(1, entry.size))
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0 and self._entries.maxsize > 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def put(self, key, response):
+        """Store ``response`` under ``key`` if it is cacheable; returns the stored entry or None."""
+        if not self.enabled or response.status_code != 200 or response.size > self.max_entry_bytes:
+            return None
+
+        directives = parse_cache_control(response.headers.get("Cache-Control"))
+        if "no-store" in directives or "private" in directives:
+            return None
+
+        ttl = self.ttl_seconds
+        try:
+            ttl = min(ttl, int(directives["max-age"]))
+        except (KeyError, ValueError):
+            pass
+        if ttl <= 0:
+            return None
+
+        entry = CachedResponse(response.status_code, response.headers, response.content, ttl=ttl)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def lookup(self, key, fetch, request_cache_control=None):
+        """
+        Return the cached ``CachedResponse`` for ``key`` if it may be served, or
+        None when the caller has to go upstream. A stale entry is returned while
+        ``fetch`` refreshes it in the background. ``request_cache_control`` is the
+        client's Cache-Control header: ``no-store`` and ``no-cache`` both skip
+        cached entries.
+        """
+        directives = parse_cache_control(request_cache_control)
+        if not self.enabled or "no-store" in directives or "no-cache" in directives:
+            return None
+
+        entry = self.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        age = entry.age()
+        if age < entry.ttl:
+            self.hits += 1
+            return entry.with_cache_status(CACHE_HIT)
+        if age < entry.ttl + self.stale_seconds:
+            self.hits += 1
+            self._refresh_in_background(key, fetch)
+            return entry.with_cache_status(CACHE_STALE)
+
+        self.misses += 1
+        return None
+
+    def get_or_fetch(self, key, fetch, request_cache_control=None):
+        """
+        Return a ``CachedResponse`` for ``key``, calling ``fetch`` (which returns a
+        ``requests.Response``) on a miss. A client ``Cache-Control: no-store``
+        bypasses the cache entirely and ``no-cache`` forces a refetch that still
+        updates the cache.
+        """
+        entry = self.lookup(key, fetch, request_cache_control)
+        if entry is not None:
+            return entry
+
+        response = CachedResponse.from_response(fetch())
+        if "no-store" in parse_cache_control(request_cache_control):
+            return response.with_cache_status(CACHE_BYPASS)
+        return self.put(key, response) or response
+
+    def stream_through(self, key, response, chunk_size, request_cache_control=None, keep_headers=None,
+                       decode_content=True, max_buffer_bytes=None):
+        """
+        Yield the body of a streamed ``requests.Response`` in ``chunk_size`` pieces,
+        storing it under ``key`` once fully read. At most ``max_buffer_bytes``
+        (``max_entry_bytes`` by default, never more) are buffered per response;
+        larger bodies, and bodies whose Content-Length is already larger, are
+        streamed without being cached. The upstream response is always closed.
+        With ``decode_content=False`` the body is passed through as sent, e.g.
+        still gzip encoded.
+        """
+        max_buffer_bytes = min(max_buffer_bytes or self.max_entry_bytes, self.max_entry_bytes)
+        buffered = [] if self.enabled and "no-store" not in parse_cache_control(request_cache_control) else None
+        try:
+            if int(response.headers.get("Content-Length")) > max_buffer_bytes:
+                buffered = None
+        except (TypeError, ValueError):
+            pass
+        buffered_bytes = 0
+        if decode_content:
+            chunks = response.iter_content(chunk_size=chunk_size)
+        else:
+            chunks = response.raw.stream(chunk_size, decode_content=False)
+        try:
+            for chunk in chunks:
+                if buffered is not None:
+                    buffered_bytes += len(chunk)
+                    if buffered_bytes > max_buffer_bytes:
+                        buffered = None
+                    else:
+                        buffered.append(chunk)
+                yield chunk
+
+            if buffered is not None:
+                headers = response.headers
+                if keep_headers is not None:
+                    headers = {name: headers[name] for name in keep_headers if name in headers}
+                self.put(key, CachedResponse(response.status_code, headers, b"".join(buffered)))
+        finally:
+            response.close()
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(key, CachedResponse.from_response(fetch()))
+            except Exception as e:
+                log.warning(f"Background refresh of cached response failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="response-cache-refresh", daemon=True).start()
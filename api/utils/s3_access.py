@@ -4,15 +4,25 @@ from collections import namedtuple
 from datetime import datetime
 
 import sqlalchemy
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from flask import current_app as app
+from api import settings
 from api.maap_database import db
+from api.models.cache_generation import CacheGeneration
 from api.models.organization import Organization
 from api.models.organization_s3_access import OrganizationS3Access
 from api.schemas.organization_s3_access_schema import OrganizationS3AccessSchema
+from api.utils.shared_cache import get_cache_backend, cached
 
 log = logging.getLogger(__name__)
 
+# Built user policies, keyed by the policy generation stored in the database. Org S3
+# access and org membership changes bump the generation, which invalidates the
+# cached policies of every worker (and, through the policy hash, the workspace
+# credentials scoped to them).
+user_s3_policy_cache = get_cache_backend('user-s3-policy', maxsize=settings.USER_S3_POLICY_CACHE_SIZE)
+USER_S3_POLICY_GENERATION = 'user-s3-policy'
+
 
 def get_all_s3_access():
     try:
@@ -184,6 +194,45 @@ def build_user_s3_policy(workspace_bucket, username, user_id):
     return policy, authorized_s3_paths
 
 
+def get_user_s3_policy(workspace_bucket, username, user_id):
+    """
+    Cached build_user_s3_policy(). Returns (policy_json_string, authorized_s3_paths_list);
+    shared cache backends return the pair as a list.
+    """
+    return _get_user_s3_policy(workspace_bucket, username, user_id, get_user_s3_policy_generation())
+
+
+@cached(user_s3_policy_cache,
+        key=lambda workspace_bucket, username, user_id, generation: f'{generation}:{user_id}:{username}:{workspace_bucket}',
+        ttl=settings.USER_S3_POLICY_CACHE_TTL_SECONDS)
+def _get_user_s3_policy(workspace_bucket, username, user_id, generation):
+    return build_user_s3_policy(workspace_bucket, username, user_id)
+
+
+def get_user_s3_policy_generation():
+    generation = db.session.query(CacheGeneration.generation).filter_by(name=USER_S3_POLICY_GENERATION).scalar()
+    return generation or 0
+
+
+def invalidate_user_s3_policies():
+    """
+    Invalidate every cached user policy in all workers, e.g. after org S3 access
+    or membership changes, by bumping the policy generation.
+    """
+    updated = db.session.query(CacheGeneration).filter_by(name=USER_S3_POLICY_GENERATION) \
+        .update({CacheGeneration.generation: CacheGeneration.generation + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(CacheGeneration(name=USER_S3_POLICY_GENERATION, generation=1))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the generation first
+        db.session.rollback()
+        invalidate_user_s3_policies()
+        return
+    user_s3_policy_cache.clear()
+
+
 def create_s3_access(org_id, bucket_name, bucket_prefix, readonly=False):
     try:
         new_entry = OrganizationS3Access(
@@ -197,6 +246,7 @@ def create_s3_access(org_id, bucket_name, bucket_prefix, readonly=False):
         try:
             db.session.add(new_entry)
             db.session.commit()
+            invalidate_user_s3_policies()
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Failed to create S3 access entry for org {org_id}: {e}")
@@ -222,6 +272,7 @@ def update_s3_access(access, org_id, bucket_name, bucket_prefix, readonly=None):
 
         try:
             db.session.commit()
+            invalidate_user_s3_policies()
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Failed to update S3 access entry {access.id}: {e}")
@@ -239,6 +290,7 @@ def delete_s3_access(access_id):
         try:
             db.session.query(OrganizationS3Access).filter_by(id=access_id).delete()
             db.session.commit()
+            invalidate_user_s3_policies()
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Failed to delete S3 access entry {access_id}: {e}")
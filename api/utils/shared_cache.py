@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import wraps
+
+from cachetools import LRUCache
+from cryptography.fernet import Fernet, InvalidToken
+
+from api import settings
+
+log = logging.getLogger(__name__)
+
+CACHE_BACKEND_MEMORY = "memory"
+CACHE_BACKEND_SQLITE = "sqlite"
+CACHE_BACKEND_REDIS = "redis"
+
+
+class CacheBackend(ABC):
+    """
+    Minimal key/value cache interface shared by the in-process, single-node and
+    networked backends. Keys are strings scoped to a namespace; ``ttl`` is in
+    seconds, and ``None`` means the entry only leaves the cache through eviction.
+    Backends other than memory store values as JSON, so cached values must be
+    JSON-serializable. Given a ``fernet``, those backends encrypt the stored JSON.
+    """
+
+    def __init__(self, namespace, fernet=None):
+        self.namespace = namespace
+        self._fernet = fernet
+
+    @abstractmethod
+    def get(self, key, default=None):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def _dumps(self, value):
+        data = json.dumps(value)
+        if self._fernet is not None:
+            data = self._fernet.encrypt(data.encode('utf-8')).decode('utf-8')
+        return data
+
+    def _loads(self, data):
+        """Decode a stored value; raises InvalidToken if it can't be decrypted."""
+        if self._fernet is not None:
+            data = self._fernet.decrypt(data)
+        return json.loads(data)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU cache with optional per-entry expiry."""
+
+    def __init__(self, namespace, maxsize):
+        super().__init__(namespace)
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._cache[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._cache[key] = (expires_at, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache stored in a local SQLite file, shared by every worker process on the
+    node. Each namespace keeps at most ``maxsize`` entries, evicting the least
+    recently used. To keep reads from taking the write lock, a read only records
+    its access when the entry was last touched ``touch_seconds`` or more ago, so
+    recency is tracked to that granularity. ``timeout`` is how long a connection
+    waits for another process's write lock.
+    """
+
+    def __init__(self, namespace, maxsize, path, fernet=None, timeout=5, touch_seconds=60):
+        super().__init__(namespace, fernet)
+        self.maxsize = maxsize
+        self.path = path
+        self.timeout = timeout
+        self.touch_seconds = touch_seconds
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS cache_entry (
+                                namespace TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                value TEXT NOT NULL,
+                                expires_at REAL,
+                                accessed_at REAL NOT NULL,
+                                PRIMARY KEY (namespace, key))""")
+        # Only the API's own user may read the cache (SQLite gives its -wal and
+        # -shm files the same permissions)
+        os.chmod(self.path, 0o600)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT value, expires_at, accessed_at FROM cache_entry "
+                               "WHERE namespace = ? AND key = ?", (self.namespace, key)).fetchone()
+            if row is None:
+                return default
+            value, expires_at, accessed_at = row
+            if expires_at is not None and expires_at <= now:
+                conn.execute("DELETE FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return default
+            if now - accessed_at >= self.touch_seconds:
+                conn.execute("UPDATE cache_entry SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                             (now, self.namespace, key))
+        try:
+            return self._loads(value)
+        except InvalidToken:
+            log.warning(f"Ignoring undecryptable '{self.namespace}' cache entry")
+            return default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache_entry (namespace, key, value, expires_at, accessed_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (self.namespace, key, self._dumps(value), expires_at, now))
+            count, = conn.execute("SELECT COUNT(*) FROM cache_entry WHERE namespace = ?",
+                                  (self.namespace,)).fetchone()
+            if count <= self.maxsize:
+                return
+            conn.execute("""DELETE FROM cache_entry WHERE namespace = ? AND key IN (
+                                SELECT key FROM cache_entry WHERE namespace = ?
+                                ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                         (self.namespace, self.namespace, self.maxsize))
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entry WHERE namespace = ?", (self.namespace,))
+
+
+class NetworkCacheBackend(CacheBackend):
+    """
+    Cache held in a networked key/value store shared across nodes. ``client``
+    must provide Redis-style ``get(key)``, ``set(key, value, ex=None)``,
+    ``delete(key)`` and ``scan_iter(match=None)``; size limits are left to the
+    store's own eviction policy.
+    """
+
+    def __init__(self, namespace, client, prefix="maap-api:", fernet=None):
+        super().__init__(namespace, fernet)
+        self._client = client
+        self._prefix = f"{prefix}{namespace}:"
+
+    def get(self, key, default=None):
+        value = self._client.get(self._prefix + key)
+        if value is None:
+            return default
+        try:
+            return self._loads(value)
+        except InvalidToken:
+            log.warning(f"Ignoring undecryptable '{self.namespace}' cache entry")
+            return default
+
+    def set(self, key, value, ttl=None):
+        ex = max(1, int(ttl)) if ttl is not None else None
+        self._client.set(self._prefix + key, self._dumps(value), ex=ex)
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def clear(self):
+        for key in list(self._client.scan_iter(match=self._prefix + "*")):
+            self._client.delete(key)
+
+
+_redis_client = None
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package to be installed.")
+        _redis_client = redis.Redis.from_url(settings.CACHE_REDIS_URL)
+    return _redis_client
+
+
+def get_cache_backend(namespace, maxsize, backend=None, encrypted=False):
+    """
+    Return a cache for ``namespace`` using the configured backend
+    (``settings.CACHE_BACKEND`` unless ``backend`` is given). Set ``encrypted``
+    for caches holding secrets such as credentials: values leaving the process
+    are then encrypted with ``settings.FERNET_KEY``.
+    """
+    backend = backend or settings.CACHE_BACKEND
+
+    if backend == CACHE_BACKEND_MEMORY:
+        return MemoryCacheBackend(namespace, maxsize)
+
+    fernet = None
+    if encrypted:
+        if not settings.FERNET_KEY:
+            raise ValueError(f"Caching '{namespace}' in the {backend} backend requires FERNET_KEY to be set")
+        fernet = Fernet(settings.FERNET_KEY)
+
+    if backend == CACHE_BACKEND_SQLITE:
+        return SQLiteCacheBackend(namespace, maxsize, settings.CACHE_SQLITE_PATH, fernet=fernet,
+                                  timeout=settings.CACHE_SQLITE_TIMEOUT_SECONDS,
+                                  touch_seconds=settings.CACHE_SQLITE_TOUCH_SECONDS)
+    if backend == CACHE_BACKEND_REDIS:
+        return NetworkCacheBackend(namespace, _get_redis_client(), fernet=fernet)
+
+    raise ValueError(f"Unknown cache backend '{backend}'")
+
+
+def cached(cache, key, ttl=None):
+    """
+    Decorator caching a function's return value in ``cache``. ``key`` builds the
+    cache key from the call arguments; ``ttl`` is either a number of seconds or a
+    function of the returned value. A ``ttl`` of zero or less skips caching.
+    """
+    def cached_outer(wrapped_function):
+        @wraps(wrapped_function)
+        def wrap(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            value = cache.get(cache_key)
+            if value is not None:
+                return value
+
+            value = wrapped_function(*args, **kwargs)
+            entry_ttl = ttl(value) if callable(ttl) else ttl
+            if entry_ttl is None or entry_ttl > 0:
+                cache.set(cache_key, value, entry_ttl)
+            return value
+
+        wrap.cache = cache
+        return wrap
+    return cached_outer
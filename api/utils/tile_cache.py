@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cachetools import LRUCache
+
+log = logging.getLogger(__name__)
+
+TIER_MEMORY = "memory"
+TIER_DISK = "disk"
+
+
+def tile_key(url):
+    """Cache key of a rendered tile: the SHA-256 of the tiler URL that produces it."""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class TileCache:
+    """
+    Two-tier cache of rendered map tiles.
+
+    Hot tiles live in a byte-bounded in-memory LRU. Every tile is also written
+    to ``disk_path`` (sharded by key prefix), which is bounded to
+    ``disk_max_bytes`` by evicting the least recently used files; disk hits are
+    promoted to the memory tier. Either tier is disabled by a size of 0.
+
+    Workers may share ``disk_path``. Recency is kept in the files' mtimes (disk
+    hits touch the file), and each worker rebuilds its index of the directory
+    every ``disk_rescan_seconds``, so the cap covers the files written by every
+    worker. Between rescans a worker does not count the other workers' new
+    files, so the directory can exceed the cap by what they write in one
+    rescan interval.
+
+    Given a ``stats_store`` (a shared_cache backend), each worker publishes its
+    metrics there at most every ``stats_interval_seconds`` and stats() reports
+    them summed over every live worker. clear() is then also picked up by the
+    other workers, which empty their memory tier when they next publish.
+    """
+
+    def __init__(self, memory_max_bytes, disk_max_bytes, disk_path, stats_store=None, stats_interval_seconds=5,
+                 disk_rescan_seconds=60):
+        self._memory = LRUCache(maxsize=memory_max_bytes, getsizeof=len) if memory_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_path = disk_path
+        self._disk_index = None  # key -> size, least recently used first
+        self._disk_bytes = 0
+        self._disk_rescan_seconds = disk_rescan_seconds
+        self._disk_indexed_at = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._stats_store = stats_store
+        self._stats_interval = stats_interval_seconds
+        self._stats_published_at = None
+        self._cleared_token = None
+
+    @property
+    def enabled(self):
+        return self._memory is not None or self._disk_enabled
+
+    @property
+    def _disk_enabled(self):
+        return self.disk_max_bytes > 0 and bool(self.disk_path)
+
+    def get(self, key):
+        """Return ``(content, tier)`` for a cached tile, or None."""
+        cached = self._get(key)
+        self._publish_stats()
+        return cached
+
+    def _get(self, key):
+        with self._lock:
+            content = self._memory.get(key) if self._memory is not None else None
+            if content is not None:
+                self.memory_hits += 1
+                return content, TIER_MEMORY
+
+        content = self._read_disk(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store_memory(key, content)
+        return content, TIER_DISK
+
+    def contains(self, key):
+        """Whether a tile is cached, without counting a hit or miss."""
+        with self._lock:
+            if self._memory is not None and key in self._memory:
+                return True
+        return self._disk_enabled and os.path.exists(self._file_path(key))
+
+    def put(self, key, content):
+        if not content:
+            return
+        with self._lock:
+            self._store_memory(key, content)
+        self._write_disk(key, content)
+
+    def clear(self):
+        index = self._scan_disk() if self._disk_enabled else {}
+        with self._lock:
+            self._clear_memory()
+            self._disk_index = index
+            for key in list(index):
+                self._remove_disk_file(key)
+            self._disk_index = OrderedDict()
+            self._disk_bytes = 0
+            self._disk_indexed_at = time.monotonic()
+        if self._stats_store is not None:
+            self._cleared_token = str(uuid.uuid4())
+            self._stats_store.set('cleared', self._cleared_token)
+            self._publish_stats(force=True)
+
+    def stats(self):
+        """Metrics of this worker, or summed over all workers given a ``stats_store``."""
+        if self._stats_store is None:
+            return self._worker_stats()
+
+        self._publish_stats(force=True)
+        workers = []
+        for pid in self._stats_store.get('workers', []):
+            worker_stats = self._stats_store.get(f'worker:{pid}')
+            if worker_stats is not None:
+                workers.append(worker_stats)
+
+        summed = {name: sum(worker[name] for worker in workers)
+                  for name in ('memory_hits', 'disk_hits', 'misses', 'memory_bytes', 'memory_max_bytes', 'memory_tiles')}
+        requests = summed['memory_hits'] + summed['disk_hits'] + summed['misses']
+        return {
+            **summed,
+            'hit_ratio': round((summed['memory_hits'] + summed['disk_hits']) / requests, 4) if requests else None,
+            # Workers share the disk tier, each seeing the files it has indexed
+            'disk_bytes': max((worker['disk_bytes'] for worker in workers), default=0),
+            'disk_max_bytes': self.disk_max_bytes if self._disk_enabled else 0,
+            'disk_tiles': max((worker['disk_tiles'] for worker in workers), default=0),
+            'workers': len(workers),
+        }
+
+    def _publish_stats(self, force=False):
+        """Publish this worker's metrics to the stats store, and apply a clear() made by another worker."""
+        if self._stats_store is None:
+            return
+        now = time.monotonic()
+        if not force and self._stats_published_at is not None and now - self._stats_published_at < self._stats_interval:
+            return
+        self._stats_published_at = now
+
+        try:
+            cleared_token = self._stats_store.get('cleared')
+            if cleared_token != self._cleared_token:
+                with self._lock:
+                    self._clear_memory()
+                self._cleared_token = cleared_token
+
+            pid = os.getpid()
+            # Outlives a few publishing intervals, so workers that have exited (or served
+            # no tiles for a while) drop out of the totals
+            self._stats_store.set(f'worker:{pid}', self._worker_stats(), ttl=max(60, self._stats_interval * 12))
+            workers = self._stats_store.get('workers', [])
+            live_workers = [p for p in workers if p == pid or self._stats_store.get(f'worker:{p}') is not None]
+            if pid not in live_workers:
+                live_workers.append(pid)
+            if live_workers != workers:
+                self._stats_store.set('workers', live_workers)
+        except Exception as e:
+            log.warning(f"Failed to publish tile cache metrics: {e}")
+
+    def _clear_memory(self):
+        if self._memory is not None:
+            self._memory.clear()
+        self.memory_hits = self.disk_hits = self.misses = 0
+
+    def _worker_stats(self):
+        with self._lock:
+            requests = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.memory_hits + self.disk_hits) / requests, 4) if requests else None,
+                'memory_bytes': self._memory.currsize if self._memory is not None else 0,
+                'memory_max_bytes': self._memory.maxsize if self._memory is not None else 0,
+                'memory_tiles': len(self._memory) if self._memory is not None else 0,
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes if self._disk_enabled else 0,
+                'disk_tiles': len(self._disk_index or {}),
+            }
+
+    def _store_memory(self, key, content):
+        if self._memory is not None and len(content) <= self._memory.maxsize:
+            self._memory[key] = content
+
+    def _file_path(self, key):
+        return os.path.join(self.disk_path, key[:2], key)
+
+    def _scan_disk(self):
+        """Index the files on disk by key, least recently used (oldest mtime) first."""
+        files = []
+        if os.path.isdir(self.disk_path):
+            for shard in os.scandir(self.disk_path):
+                if shard.is_dir():
+                    for entry in os.scandir(shard.path):
+                        if entry.is_file() and not entry.name.endswith('.tmp'):
+                            try:
+                                stat = entry.stat()
+                            except FileNotFoundError:
+                                continue  # evicted by another worker meanwhile
+                            files.append((stat.st_mtime, entry.name, stat.st_size))
+        return OrderedDict((key, size) for _, key, size in sorted(files))
+
+    def _refresh_disk_index(self):
+        """Rescan the directory when the index is missing or older than ``disk_rescan_seconds``."""
+        now = time.monotonic()
+        if self._disk_index is not None and now - self._disk_indexed_at < self._disk_rescan_seconds:
+            return
+        # Scanned outside the lock; tiles written meanwhile are picked up by the next scan
+        index = self._scan_disk()
+        with self._lock:
+            self._disk_index = index
+            self._disk_bytes = sum(index.values())
+            self._disk_indexed_at = now
+
+    def _read_disk(self, key):
+        if not self._disk_enabled:
+            return None
+        path = self._file_path(key)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            # The mtime records recency for every worker sharing the directory
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning(f"Failed to read cached tile {key}: {e}")
+            return None
+
+        with self._lock:
+            if self._disk_index is not None and key in self._disk_index:
+                self._disk_index.move_to_end(key)
+        return content
+
+    def _write_disk(self, key, content):
+        if not self._disk_enabled or len(content) > self.disk_max_bytes:
+            return
+        path = self._file_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial tile
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning(f"Failed to write cached tile {key}: {e}")
+            return
+
+        self._refresh_disk_index()
+        with self._lock:
+            index = self._disk_index
+            self._disk_bytes += len(content) - index.pop(key, 0)
+            index[key] = len(content)
+            while self._disk_bytes > self.disk_max_bytes and index:
+                self._remove_disk_file(next(iter(index)))
+
+    def _remove_disk_file(self, key):
+        self._disk_bytes -= self._disk_index.pop(key, 0) if self._disk_index is not None else 0
+        try:
+            os.remove(self._file_path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"Failed to evict cached tile {key}: {e}")
@@ -0,0 +1,241 @@
+import logging
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from api.utils.shared_cache import MemoryCacheBackend
+
+log = logging.getLogger(__name__)
+
+MAX_WEB_MERCATOR_LATITUDE = 85.0511287798
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+
+
+def _tile_x(lon, zoom):
+    return int((lon + 180.0) / 360.0 * (1 << zoom))
+
+
+def _tile_y(lat, zoom):
+    lat = math.radians(max(-MAX_WEB_MERCATOR_LATITUDE, min(MAX_WEB_MERCATOR_LATITUDE, lat)))
+    return int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * (1 << zoom))
+
+
+def _tile_ranges(bbox, zoom):
+    west, south, east, north = bbox
+    last = (1 << zoom) - 1
+    xs = range(min(_tile_x(west, zoom), last), min(_tile_x(east, zoom), last) + 1)
+    ys = range(min(_tile_y(north, zoom), last), min(_tile_y(south, zoom), last) + 1)
+    return xs, ys
+
+
+def count_tiles(bbox, min_zoom, max_zoom):
+    """Number of XYZ (web mercator) tiles covering ``bbox`` (west, south, east, north) from min_zoom to max_zoom."""
+    total = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = _tile_ranges(bbox, zoom)
+        total += len(xs) * len(ys)
+    return total
+
+
+def tiles_for_bbox(bbox, min_zoom, max_zoom):
+    """Yield the (z, x, y) XYZ tiles covering ``bbox`` (west, south, east, north), lowest zoom first."""
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = _tile_ranges(bbox, zoom)
+        for x in xs:
+            for y in ys:
+                yield zoom, x, y
+
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1/rate seconds apart across threads; a rate of 0 disables it."""
+
+    def __init__(self, rate_per_second):
+        self._interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class TileSeedJob:
+    """
+    Warms a tile cache for a list of tiles on a background thread.
+
+    ``seed_tile(z, x, y, throttle)`` renders and stores one tile, calling
+    ``throttle()`` right before it requests the tiler, and returns False when
+    the tile was already cached. Tiles are seeded by a pool of ``max_workers``
+    threads that together request at most ``max_requests_per_second`` tiles.
+    Once added to a TileSeedJobs, the job publishes its progress there after
+    every batch of tiles and picks up cancellations requested by any worker.
+    """
+
+    def __init__(self, tiles, total, seed_tile, max_workers, max_requests_per_second, description=None):
+        self.id = str(uuid.uuid4())
+        self.description = description or {}
+        self.total = total
+        self.seeded = 0
+        self.cached = 0
+        self.failed = 0
+        self.status = STATUS_RUNNING
+        self.created = datetime.now(timezone.utc)
+        self.finished = None
+        self._tiles = tiles
+        self._seed_tile = seed_tile
+        self._max_workers = max_workers
+        self._limiter = RateLimiter(max_requests_per_second)
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._jobs = None
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"tile-seed-{self.id}", daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def to_dict(self):
+        with self._lock:
+            done = self.seeded + self.cached + self.failed
+            return {
+                'id': self.id,
+                'status': self.status,
+                'total': self.total,
+                'done': done,
+                'seeded': self.seeded,
+                'cached': self.cached,
+                'failed': self.failed,
+                'progress': round(done / self.total, 4) if self.total else 1.0,
+                'created': self.created.isoformat(),
+                'finished': self.finished.isoformat() if self.finished else None,
+                **self.description
+            }
+
+    def _seed(self, tile):
+        if self._cancelled.is_set():
+            return
+        try:
+            seeded = self._seed_tile(*tile, self._limiter.wait)
+        except Exception as e:
+            log.warning(f"Seeding tile {tile} failed: {e}")
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            if seeded:
+                self.seeded += 1
+            else:
+                self.cached += 1
+
+    def _sync(self):
+        """Publish progress to the job registry and pick up a cancellation requested there."""
+        if self._jobs is None:
+            return
+        try:
+            if self._jobs.cancel_requested(self.id):
+                self._cancelled.set()
+            self._jobs.save(self)
+        except Exception as e:
+            log.warning(f"Failed to publish progress of tile seeding job {self.id}: {e}")
+
+    def _run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='tile-seed') as pool:
+                # Submit in bounded batches so a large job does not queue every tile up front
+                batch = []
+                for tile in self._tiles:
+                    if self._cancelled.is_set():
+                        break
+                    batch.append(pool.submit(self._seed, tile))
+                    if len(batch) >= self._max_workers * 4:
+                        for future in batch:
+                            future.result()
+                        batch = []
+                        self._sync()
+                for future in batch:
+                    future.result()
+        finally:
+            with self._lock:
+                self.status = STATUS_CANCELLED if self._cancelled.is_set() else STATUS_COMPLETED
+                self.finished = datetime.now(timezone.utc)
+            self._sync()
+
+
+class TileSeedJobs:
+    """
+    Records of the most recent ``maxsize`` seed jobs, by id, kept in ``store`` (a
+    shared_cache backend). With a sqlite or redis store every worker sees the
+    progress of jobs running in any other and can cancel them; a memory store
+    only suits a single worker. Records are returned as TileSeedJob.to_dict().
+    """
+
+    INDEX_KEY = 'index'
+
+    def __init__(self, store=None, maxsize=50, ttl=7 * 24 * 60 * 60):
+        # A record and a possible cancel flag per job, plus the index
+        self._store = store or MemoryCacheBackend('wmts-tile-seed-jobs', maxsize * 2 + 1)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        job._jobs = self
+        self.save(job)
+        with self._lock:
+            self._running[job.id] = job
+            # Read-modify-write: jobs started at the same moment by two workers may
+            # drop one of them from the listing, though each stays reachable by id
+            index = [job.id] + [job_id for job_id in self._store.get(self.INDEX_KEY, []) if job_id != job.id]
+            self._store.set(self.INDEX_KEY, index[:self.maxsize], self.ttl)
+        return job
+
+    def save(self, job):
+        record = job.to_dict()
+        self._store.set(f'job:{job.id}', record, self.ttl)
+        if record['finished'] is not None:
+            with self._lock:
+                self._running.pop(job.id, None)
+
+    def get(self, job_id):
+        record = self._store.get(f'job:{job_id}')
+        if record is not None:
+            record = dict(record)
+            record['cancel_requested'] = record['finished'] is None and self.cancel_requested(job_id)
+        return record
+
+    def list(self):
+        records = [self.get(job_id) for job_id in self._store.get(self.INDEX_KEY, [])]
+        return sorted([record for record in records if record is not None],
+                      key=lambda record: record['created'], reverse=True)
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop, wherever it runs; a job running in another worker stops
+        once it has finished its current batch. Returns the job's record, or None.
+        """
+        if self._store.get(f'job:{job_id}') is None:
+            return None
+        self._store.set(f'cancel:{job_id}', True, self.ttl)
+        with self._lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            job.cancel()
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        return bool(self._store.get(f'cancel:{job_id}'))
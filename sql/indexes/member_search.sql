@@ -0,0 +1,6 @@
+-- Indexes backing the member directory prefix search (GET /members?q=...).
+-- New databases get them from the Member model; run this on existing ones.
+create index concurrently if not exists ix_member_lower_username on member (lower(username) text_pattern_ops);
+create index concurrently if not exists ix_member_lower_email on member (lower(email) text_pattern_ops);
+create index concurrently if not exists ix_member_lower_first_name on member (lower(first_name) text_pattern_ops);
+create index concurrently if not exists ix_member_lower_last_name on member (lower(last_name) text_pattern_ops);
@@ -9,7 +9,7 @@ from api.models.member import Member
 from api.models.member_session import MemberSession
 from api.models.role import Role
 from api.auth.cas_auth import validate, validate_proxy, validate_bearer, decrypt_proxy_ticket
-from api.auth.cas_auth import start_member_session, get_cas_attribute_value
+from api.auth.cas_auth import start_member_session, get_cas_attribute_value, clear_proxy_ticket_caches
 from api.utils.security_utils import AuthenticationError
 from api import settings
 
@@ -18,6 +18,7 @@ class TestCASAuthentication(unittest.TestCase):
 
     def setUp(self):
         """Set up test environment before each test."""
+        clear_proxy_ticket_caches()
         with app.app_context():
             initialize_sql(db.engine)
             # Clear any existing test data
@@ -380,6 +381,47 @@ class TestCASAuthentication(unittest.TestCase):
         # Then the decrypted ticket should be returned
         assert result == "PGT-12345-decrypted"
 
+    @patch('api.auth.cas_auth.RSA')
+    @patch('api.auth.cas_auth.PKCS1_v1_5')
+    @patch('api.auth.cas_auth.b64decode')
+    def test_decrypt_proxy_ticket_caches_key_and_result(self, mock_b64decode, mock_pkcs, mock_rsa):
+        """Test: decrypt_proxy_ticket parses the key once and reuses decrypted tickets"""
+        # Given mocked crypto components
+        mock_b64decode.return_value = b"encrypted_data"
+        mock_decryptor = MagicMock()
+        mock_pkcs.new.return_value = mock_decryptor
+        mock_decryptor.decrypt.side_effect = [b"PGT-first", b"PGT-second"]
+
+        # When the same ticket is decrypted twice and another ticket once
+        first = decrypt_proxy_ticket("encrypted-ticket-1")
+        again = decrypt_proxy_ticket("encrypted-ticket-1")
+        second = decrypt_proxy_ticket("encrypted-ticket-2")
+
+        # Then the key is parsed once and the repeat is served from cache
+        assert first == again == "PGT-first"
+        assert second == "PGT-second"
+        assert mock_rsa.import_key.call_count == 1
+        assert mock_decryptor.decrypt.call_count == 2
+
+    def test_validate_proxy_does_not_revalidate_rejected_ticket(self):
+        """Test: validate_proxy skips CAS for tickets CAS already rejected"""
+        with app.app_context():
+            with patch('api.auth.cas_auth.decrypt_proxy_ticket') as mock_decrypt, \
+                 patch('api.auth.cas_auth.validate_cas_request') as mock_validate_cas, \
+                 app.test_request_context('/test'):
+                mock_decrypt.return_value = 'PGT-rejected-test'
+                mock_validate_cas.return_value = (False, {})
+
+                # When the same rejected ticket is presented twice
+                first = validate_proxy('encrypted-rejected-ticket')
+                second = validate_proxy('encrypted-rejected-ticket')
+
+            # Then CAS is only consulted for the first attempt
+            assert first is None
+            assert second is None
+            assert mock_validate_cas.call_count == 1
+            assert mock_decrypt.call_count == 1
+
     def test_decrypt_proxy_ticket_handles_decryption_error(self):
         """Test: decrypt_proxy_ticket handles decryption errors gracefully"""
         # Given an invalid encrypted ticket
@@ -1,13 +1,19 @@
 import unittest
+import json
 import os
 import tempfile
 import zipfile
 from io import BytesIO
+from urllib.parse import quote, parse_qs
+import shapefile
 import responses
 from unittest.mock import patch, mock_open
 from api.maapapp import app
 from api.maap_database import db
 from api.models import initialize_sql
+from api import settings
+import api.endpoints.cmr as cmr
+from api.endpoints.cmr import cmr_search_cache
 
 
 class TestCMRIntegration(unittest.TestCase):
@@ -15,6 +21,7 @@ class TestCMRIntegration(unittest.TestCase):
     
     def setUp(self):
         """Set up test environment before each test."""
+        cmr_search_cache.clear()
         with app.app_context():
             initialize_sql(db.engine)
     
@@ -320,6 +327,284 @@ class TestCMRIntegration(unittest.TestCase):
             data = response.get_json()
             self.assertEqual(len(data['feed']['entry']), 2)
 
+    @responses.activate
+    def test_repeated_searches_are_served_from_cache(self):
+        """Test: identical searches reuse the cached CMR response"""
+        with app.test_client() as client:
+            responses.add(
+                responses.GET,
+                'https://cmr.maap-project.org/search/granules',
+                json={'feed': {'entry': [{'id': 'G1-NASA_MAAP'}]}},
+                status=200
+            )
+
+            first = client.get('/api/cmr/granules?short_name=GEDI02_A&version=002')
+            first_data = first.get_json()
+            # Same query with keys in a different order
+            second = client.get('/api/cmr/granules?version=002&short_name=GEDI02_A')
+
+            self.assertEqual(first_data, second.get_json())
+            self.assertEqual(first.headers['X-Cache'], 'MISS')
+            self.assertEqual(second.headers['X-Cache'], 'HIT')
+            self.assertIn('max-age', second.headers['Cache-Control'])
+            self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_search_cache_is_keyed_by_accept_header_and_honors_no_cache(self):
+        """Test: the Accept header is part of the cache key and clients can force a refetch"""
+        with app.test_client() as client:
+            responses.add(
+                responses.GET,
+                'https://cmr.maap-project.org/search/collections',
+                json={'feed': {'entry': []}},
+                status=200
+            )
+
+            client.get('/api/cmr/collections?keyword=cache').get_data()
+            client.get('/api/cmr/collections?keyword=cache', headers={'Accept': 'application/vnd.nasa.cmr.umm_results+json'}).get_data()
+            client.get('/api/cmr/collections?keyword=cache', headers={'Cache-Control': 'no-cache'}).get_data()
+            client.get('/api/cmr/collections?keyword=cache').get_data()
+
+            self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_search_errors_are_not_cached(self):
+        """Test: failed CMR searches are not cached"""
+        with app.test_client() as client:
+            responses.add(
+                responses.GET,
+                'https://cmr.maap-project.org/search/collections',
+                json={'errors': ['bad request']},
+                status=400
+            )
+
+            client.get('/api/cmr/collections?bad_param=1')
+            client.get('/api/cmr/collections?bad_param=1')
+
+            self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_search_results_are_passed_through_unparsed(self):
+        """Test: successful searches stream CMR's bytes and paging headers unchanged"""
+        with app.test_client() as client:
+            body = b'{"items":[{"meta":{"concept-id":"G1-NASA_MAAP"}}],  "hits":1}'
+            responses.add(
+                responses.GET,
+                'https://cmr.maap-project.org/search/granules',
+                body=body,
+                status=200,
+                content_type='application/vnd.nasa.cmr.umm_results+json;version=1.6.5',
+                headers={'CMR-Hits': '1', 'CMR-Search-After': '["g1"]'}
+            )
+
+            with patch('api.endpoints.cmr.json.loads') as mock_loads:
+                response = client.get('/api/cmr/granules?short_name=GEDI02_A&page_size=2000',
+                                      headers={'Accept': 'application/vnd.nasa.cmr.umm_results+json'})
+                data = response.get_data()
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data, body)
+            self.assertEqual(response.headers['Content-Type'], 'application/vnd.nasa.cmr.umm_results+json;version=1.6.5')
+            self.assertEqual(response.headers['CMR-Hits'], '1')
+            self.assertEqual(response.headers['CMR-Search-After'], '["g1"]')
+            mock_loads.assert_not_called()
+
+    @responses.activate
+    def test_large_search_pages_are_streamed_without_being_cached(self):
+        """Test: pages larger than the streamed cache cap are passed through and refetched"""
+        with app.test_client() as client, \
+                patch('api.endpoints.cmr.settings.CMR_SEARCH_STREAM_CACHE_MAX_BYTES', 64):
+            body = b'{"items":[' + b','.join([b'{"meta":{"concept-id":"G1-NASA_MAAP"}}'] * 10) + b'],"hits":10}'
+            responses.add(responses.GET, 'https://cmr.maap-project.org/search/granules', body=body, status=200)
+
+            first = client.get('/api/cmr/granules?short_name=GEDI02_A&page_size=2000').get_data()
+            second = client.get('/api/cmr/granules?short_name=GEDI02_A&page_size=2000').get_data()
+
+            self.assertEqual(first, body)
+            self.assertEqual(second, body)
+            self.assertEqual(len(responses.calls), 2)
+            self.assertEqual(cmr_search_cache.keys(), [])
+
+    def _add_granule_pages(self):
+        pages = [
+            ({'feed': {'entry': [{'id': 'G1'}, {'id': 'G2'}]}}, {'CMR-Hits': '5', 'CMR-Search-After': '["a"]'}),
+            ({'feed': {'entry': [{'id': 'G3'}, {'id': 'G4'}]}}, {'CMR-Hits': '5', 'CMR-Search-After': '["b"]'}),
+            ({'feed': {'entry': [{'id': 'G5'}]}}, {'CMR-Hits': '5', 'CMR-Search-After': '["c"]'}),
+            ({'feed': {'entry': []}}, {'CMR-Hits': '5'}),
+        ]
+        for body, headers in pages:
+            responses.add(responses.GET, 'https://cmr.maap-project.org/search/granules',
+                          json=body, status=200, headers=headers)
+
+    @responses.activate
+    def test_all_granules_are_merged_across_pages(self):
+        """Test: /granules/all walks every page with CMR-Search-After and returns one JSON array"""
+        with app.test_client() as client:
+            self._add_granule_pages()
+
+            response = client.get('/api/cmr/granules/all?short_name=GEDI02_A&page_num=3')
+            data = response.get_json()
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['CMR-Hits'], '5')
+            self.assertEqual([g['id'] for g in data], ['G1', 'G2', 'G3', 'G4', 'G5'])
+            self.assertNotIn('CMR-Search-After', responses.calls[0].request.headers)
+            self.assertEqual(responses.calls[1].request.headers['CMR-Search-After'], '["a"]')
+            self.assertEqual(responses.calls[2].request.headers['CMR-Search-After'], '["b"]')
+            self.assertIn('page_size=2000', responses.calls[0].request.url)
+            self.assertNotIn('page_num', responses.calls[0].request.url)
+
+    @responses.activate
+    def test_all_granules_can_be_capped_and_streamed_as_ndjson(self):
+        """Test: /granules/all honors max_results and the NDJSON output format"""
+        with app.test_client() as client:
+            self._add_granule_pages()
+
+            response = client.get('/api/cmr/granules/all?short_name=GEDI02_A&output_format=ndjson&max_results=3')
+            lines = response.get_data(as_text=True).splitlines()
+
+            self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+            self.assertEqual([json.loads(line)['id'] for line in lines], ['G1', 'G2', 'G3'])
+            self.assertIn('page_size=3', responses.calls[0].request.url)
+
+    def test_all_granules_rejects_unknown_output_format(self):
+        """Test: /granules/all validates output_format"""
+        with app.test_client() as client:
+            response = client.get('/api/cmr/granules/all?output_format=csv')
+
+            self.assertEqual(response.status_code, 400)
+
+    def test_all_granules_rejects_negative_max_results(self):
+        """Test: /granules/all validates max_results"""
+        with app.test_client() as client:
+            response = client.get('/api/cmr/granules/all?max_results=-1')
+
+            self.assertEqual(response.status_code, 400)
+
+    @responses.activate
+    def test_all_granules_stream_is_aborted_when_a_page_fails(self):
+        """Test: A failing later page aborts the stream instead of closing the JSON array"""
+        responses.add(responses.GET, 'https://cmr.maap-project.org/search/granules',
+                      json={'feed': {'entry': [{'id': 'G1'}]}}, headers={'CMR-Search-After': '["a"]'})
+        responses.add(responses.GET, 'https://cmr.maap-project.org/search/granules',
+                      json={'errors': ['boom']}, status=500)
+
+        with app.test_client() as client:
+            response = client.get('/api/cmr/granules/all?short_name=GEDI02_A')
+
+            self.assertEqual(response.status_code, 200)
+            chunks = []
+            with self.assertRaises(Exception):
+                for chunk in response.response:
+                    chunks.append(chunk)
+            self.assertEqual(''.join(chunks), '[{"id": "G1"}')
+
+    @responses.activate
+    def test_federated_search_merges_hosts_by_concept_id(self):
+        """Test: Federated search queries every host and de-duplicates entries by concept id"""
+        responses.add(responses.GET, 'https://cmr.maap-project.org/search/collections',
+                      json={'feed': {'entry': [{'id': 'C1-NASA_MAAP'}, {'id': 'C2-NASA'}]}},
+                      headers={'CMR-Hits': '2'})
+        responses.add(responses.GET, 'https://cmr.earthdata.nasa.gov/search/collections',
+                      json={'feed': {'entry': [{'id': 'C2-NASA'}, {'id': 'C3-NASA'}]}},
+                      headers={'CMR-Hits': '40'})
+
+        with app.test_client() as client:
+            response = client.get('/api/cmr/collections?keyword=GEDI'
+                                  '&cmr_hosts=cmr.maap-project.org,cmr.earthdata.nasa.gov')
+
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertEqual([entry['id'] for entry in data['feed']['entry']], ['C1-NASA_MAAP', 'C2-NASA', 'C3-NASA'])
+            self.assertEqual([(host['host'], host['hits']) for host in data['hosts']],
+                             [('cmr.maap-project.org', 2), ('cmr.earthdata.nasa.gov', 40)])
+            for call in responses.calls:
+                self.assertNotIn('cmr_hosts', call.request.url)
+
+    @responses.activate
+    def test_federated_host_searches_do_not_outlive_the_deadline(self):
+        """Test: Host searches get the time left before the deadline and are not started after it"""
+        responses.add(responses.GET, 'https://cmr.maap-project.org/search/collections',
+                      json={'feed': {'entry': []}})
+
+        with app.test_client() as client, \
+                patch('api.endpoints.cmr.cmr_session.get', wraps=cmr.cmr_session.get) as session_get:
+            client.get('/api/cmr/collections?keyword=GEDI&cmr_hosts=cmr.maap-project.org')
+            self.assertLessEqual(session_get.call_args.kwargs['timeout'], settings.CMR_FEDERATED_TIMEOUT_SECONDS)
+
+            # The host search only starts once the deadline has passed
+            with patch('api.endpoints.cmr.time') as cmr_time:
+                cmr_time.monotonic.side_effect = [0, settings.CMR_FEDERATED_TIMEOUT_SECONDS + 1]
+                response = client.get('/api/cmr/collections?keyword=LVIS&cmr_hosts=cmr.maap-project.org')
+
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(session_get.call_count, 1)
+
+    @responses.activate
+    def test_federated_search_reports_failed_hosts(self):
+        """Test: A failing host is reported without failing the federated search"""
+        responses.add(responses.GET, 'https://cmr.maap-project.org/search/granules',
+                      json={'feed': {'entry': [{'id': 'G1-NASA_MAAP'}]}}, headers={'CMR-Hits': '1'})
+        responses.add(responses.GET, 'https://cmr.earthdata.nasa.gov/search/granules',
+                      json={'errors': ['boom']}, status=500)
+
+        with app.test_client() as client:
+            response = client.get('/api/cmr/granules?cmr_hosts=cmr.maap-project.org&cmr_hosts=cmr.earthdata.nasa.gov')
+
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertEqual([entry['id'] for entry in data['feed']['entry']], ['G1-NASA_MAAP'])
+            self.assertEqual(data['hosts'][1]['status'], 500)
+            self.assertIn('error', data['hosts'][1])
+
+    @responses.activate
+    def test_granule_data_forwards_range_requests(self):
+        """Test: Granule data proxy forwards Range and returns 206 Partial Content"""
+        data_url = 'https://data.daac.test/GEDI02_A/granule.h5'
+        responses.add(responses.GET, data_url, body=b'0123', status=206,
+                      headers={'Content-Range': 'bytes 0-3/100', 'Accept-Ranges': 'bytes'},
+                      content_type='application/x-hdf5')
+
+        with app.test_client() as client:
+            response = client.get(f'/api/cmr/granules/{quote(quote(data_url, safe=""), safe="")}/data',
+                                  headers={'Range': 'bytes=0-3'})
+
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.get_data(), b'0123')
+            self.assertEqual(response.headers['Content-Range'], 'bytes 0-3/100')
+            self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+            self.assertEqual(responses.calls[0].request.headers['Range'], 'bytes=0-3')
+
+    @responses.activate
+    def test_granule_data_cookies_are_not_shared_between_requests(self):
+        """Test: A cookie set by one granule download is not sent with the next one"""
+        data_url = 'https://data.daac.test/GEDI02_A/granule.h5'
+        responses.add(responses.GET, data_url, body=b'0123', status=200,
+                      headers={'Set-Cookie': 'urs_session=alice; Domain=data.daac.test; Path=/'})
+        responses.add(responses.GET, data_url, body=b'0123', status=200)
+
+        with app.test_client() as client:
+            for _ in range(2):
+                response = client.get(f'/api/cmr/granules/{quote(quote(data_url, safe=""), safe="")}/data')
+                response.get_data()
+
+        self.assertEqual(len(responses.calls), 2)
+        self.assertNotIn('Cookie', responses.calls[1].request.headers)
+
+    @responses.activate
+    def test_granule_data_can_redirect_to_final_url(self):
+        """Test: Granule data proxy returns a 302 to the resolved URL when redirect=true"""
+        data_url = 'https://data.daac.test/GEDI02_A/granule.h5'
+        signed_url = 'https://bucket.s3.test/granule.h5?X-Amz-Signature=abc'
+        responses.add(responses.GET, data_url, status=302, headers={'Location': signed_url})
+        responses.add(responses.GET, signed_url, body=b'0123', status=200)
+
+        with app.test_client() as client:
+            response = client.get(f'/api/cmr/granules/{quote(quote(data_url, safe=""), safe="")}/data?redirect=true')
+
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.headers['Location'], signed_url)
+
     def test_shapefile_upload_requires_file(self):
         """Test: Shapefile upload endpoint requires a file to be uploaded"""
         with app.test_client() as client:
@@ -381,5 +666,37 @@ class TestCMRIntegration(unittest.TestCase):
             self.assertIn('bounding_box', responses.calls[0].request.url)
 
 
+    @responses.activate
+    def test_shapefile_upload_can_search_by_polygon(self):
+        """Test: Shapefile upload can search CMR by the shapefile's polygon instead of its bbox"""
+        shp, shx, dbf = BytesIO(), BytesIO(), BytesIO()
+        with shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POLYGON) as writer:
+            writer.field('name', 'C')
+            writer.poly([[(-10, 0), (0, 10), (10, 0), (0, -10), (-10, 0)]])
+            writer.record('aoi')
+
+        zip_buffer = BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
+            zip_file.writestr('AOI.SHP', shp.getvalue())
+            zip_file.writestr('AOI.SHX', shx.getvalue())
+            zip_file.writestr('AOI.DBF', dbf.getvalue())
+        zip_buffer.seek(0)
+
+        responses.add(responses.POST, 'https://cmr.maap-project.org/search/collections',
+                      json={'feed': {'entry': []}}, status=200)
+
+        with app.test_client() as client:
+            response = client.post(
+                '/api/cmr/collections/shapefile',
+                data={'file': (zip_buffer, 'aoi.zip'), 'geometry': 'polygon'},
+                content_type='multipart/form-data'
+            )
+
+            self.assertEqual(response.status_code, 200)
+            body = parse_qs(responses.calls[0].request.body)
+            self.assertEqual(body['polygon[]'], ['-10.0,0.0,0.0,-10.0,10.0,0.0,0.0,10.0,-10.0,0.0'])
+            self.assertNotIn('bounding_box', body)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,95 @@
+import datetime
+import json
+import unittest
+from unittest.mock import patch
+from api import settings
+from api.maapapp import app
+from api.maap_database import db
+from api.models import initialize_sql
+from api.models.member import Member
+from api.models.member_session import MemberSession
+from api.models.member_algorithm import MemberAlgorithm
+from api.models.role import Role
+
+CAS_SECRET_KEY = 'member-directory-secret'
+
+
+class TestMemberDirectory(unittest.TestCase):
+    """Tests paging, projection, search and streaming of GET /members."""
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            initialize_sql(db.engine)
+            self._clear_tables()
+            for role_id, role_name in ((Role.ROLE_GUEST, 'guest'), (Role.ROLE_MEMBER, 'member'), (Role.ROLE_ADMIN, 'admin')):
+                db.session.add(Role(id=role_id, role_name=role_name))
+            for username, first_name in (('carol', 'Carol'), ('alice', 'Alice'), ('bob', 'Robert'), ('dave', 'Al')):
+                db.session.add(Member(username=username, email=f'{username}@example.com', first_name=first_name,
+                                      last_name='Tester', role_id=Role.ROLE_MEMBER, status='active',
+                                      creation_date=datetime.datetime(2024, 1, 2)))
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            self._clear_tables()
+
+    def _clear_tables(self):
+        db.session.query(MemberAlgorithm).delete()
+        db.session.query(MemberSession).delete()
+        db.session.query(Member).delete()
+        db.session.query(Role).delete()
+        db.session.commit()
+
+    def _get(self, query_string=''):
+        with patch.object(settings, 'CAS_SECRET_KEY', CAS_SECRET_KEY):
+            response = self.app.get('/api/members' + query_string, headers={'cas-authorization': CAS_SECRET_KEY})
+            response.get_data()  # consume streamed bodies while the settings are patched
+        return response
+
+    def test_full_directory_is_streamed_in_order(self):
+        """Test: Without a limit every member is returned, ordered by username, in the original format."""
+        with patch.object(settings, 'MEMBER_DIRECTORY_MAX_PAGE_SIZE', 3):
+            response = self._get()
+
+        members = json.loads(response.data)
+        self.assertEqual([m['username'] for m in members], ['alice', 'bob', 'carol', 'dave'])
+        self.assertEqual(members[0]['role_name'], 'member')
+        self.assertEqual(members[0]['creation_date'], '01/02/2024')
+
+    def test_pages_follow_the_next_cursor(self):
+        first = self._get('?limit=3&fields=username,email')
+        second = self._get(f"?limit=3&fields=username,email&cursor={first.headers['X-Next-Cursor']}")
+
+        self.assertEqual(json.loads(first.data), [{'username': u, 'email': f'{u}@example.com'}
+                                                  for u in ('alice', 'bob', 'carol')])
+        self.assertIn('rel="next"', first.headers['Link'])
+        self.assertEqual([m['username'] for m in json.loads(second.data)], ['dave'])
+        self.assertNotIn('X-Next-Cursor', second.headers)
+
+    def test_search_matches_name_prefixes(self):
+        """Test: q matches a case-insensitive prefix of the username, email, first or last name."""
+        response = self._get('?q=AL&fields=username')
+
+        self.assertEqual(json.loads(response.data), [{'username': 'alice'}, {'username': 'dave'}])
+
+    def test_projection_does_not_change_which_members_are_listed(self):
+        """Test: A member without a matching role is left out whether or not role_name is requested."""
+        with app.app_context():
+            db.session.add(Member(username='erin', email='erin@example.com', role_id=99, status='active',
+                                  creation_date=datetime.datetime(2024, 1, 2)))
+            db.session.commit()
+
+        with_role = json.loads(self._get('?fields=username,role_name').data)
+        without_role = json.loads(self._get('?fields=username').data)
+
+        self.assertEqual([m['username'] for m in with_role], [m['username'] for m in without_role])
+        self.assertNotIn('erin', [m['username'] for m in without_role])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self._get('?fields=username,password').status_code, 400)
+        self.assertEqual(self._get('?limit=0').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
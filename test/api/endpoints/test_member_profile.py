@@ -0,0 +1,114 @@
+import datetime
+import json
+import unittest
+from unittest.mock import patch
+from sqlalchemy import event
+from api import settings
+from api.maapapp import app
+from api.maap_database import db
+from api.models import initialize_sql
+from api.models.member import Member
+from api.models.member_session import MemberSession
+from api.models.member_algorithm import MemberAlgorithm
+from api.models.organization import Organization
+from api.models.organization_membership import OrganizationMembership
+from api.models.role import Role
+
+CAS_SECRET_KEY = 'member-profile-secret'
+
+
+class TestMemberProfile(unittest.TestCase):
+    """Tests the member profile returned by GET /members/<key>."""
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            initialize_sql(db.engine)
+            self._clear_tables()
+            db.session.add(Role(id=Role.ROLE_MEMBER, role_name='member'))
+            alice = Member(username='alice', email='alice@example.com', first_name='Alice', last_name='Tester',
+                           role_id=Role.ROLE_MEMBER, status='active', public_ssh_key='ssh-rsa AAAA',
+                           public_ssh_key_name='laptop', creation_date=datetime.datetime(2024, 1, 2, 3, 4, 5))
+            bob = Member(username='bob', email='bob@example.com', role_id=Role.ROLE_MEMBER)
+            db.session.add_all([alice, bob])
+            db.session.commit()
+            for session_key in ('old-session', 'new-session'):
+                db.session.add(MemberSession(member_id=alice.id, session_key=session_key))
+                db.session.commit()
+            orgs = [Organization(name=name) for name in ('Zeta', 'Alpha', 'Other')]
+            db.session.add_all(orgs)
+            db.session.commit()
+            db.session.add_all([OrganizationMembership(member_id=alice.id, org_id=orgs[0].id),
+                                OrganizationMembership(member_id=alice.id, org_id=orgs[1].id),
+                                OrganizationMembership(member_id=bob.id, org_id=orgs[2].id)])
+            db.session.commit()
+            self.alice_id = alice.id
+
+    def tearDown(self):
+        with app.app_context():
+            self._clear_tables()
+
+    def _clear_tables(self):
+        db.session.query(OrganizationMembership).delete()
+        db.session.query(Organization).delete()
+        db.session.query(MemberAlgorithm).delete()
+        db.session.query(MemberSession).delete()
+        db.session.query(Member).delete()
+        db.session.query(Role).delete()
+        db.session.commit()
+
+    def _get(self, key):
+        statements = []
+
+        def count_statement(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            with patch.object(settings, 'CAS_SECRET_KEY', CAS_SECRET_KEY):
+                response = self.app.get(f'/api/members/{key}', headers={'cas-authorization': CAS_SECRET_KEY})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+        return response, statements
+
+    def test_profile_is_assembled_in_two_queries(self):
+        """Test: The profile, latest session and organizations are read with one member and one organization query."""
+        response, statements = self._get('alice')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            'id': self.alice_id,
+            'username': 'alice',
+            'first_name': 'Alice',
+            'last_name': 'Tester',
+            'email': 'alice@example.com',
+            'status': 'active',
+            'public_ssh_key': 'ssh-rsa AAAA',
+            'public_ssh_key_name': 'laptop',
+            'public_ssh_key_modified_date': None,
+            'creation_date': '2024-01-02T03:04:05',
+            'session_key': 'new-session',
+            'organizations': [{'id': org_id, 'name': name} for org_id, name in self._org_ids('Alpha', 'Zeta')],
+        })
+        self.assertEqual(len(statements), 2)
+
+    def test_member_without_session_has_no_session_key(self):
+        response, _ = self._get('bob')
+
+        profile = json.loads(response.data)
+        self.assertNotIn('session_key', profile)
+        self.assertEqual([org['name'] for org in profile['organizations']], ['Other'])
+
+    def test_unknown_member_is_not_found(self):
+        response, _ = self._get('nobody')
+
+        self.assertEqual(response.status_code, 404)
+
+    def _org_ids(self, *names):
+        with app.app_context():
+            orgs = {org.name: org.id for org in db.session.query(Organization)}
+        return [(orgs[name], name) for name in names]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from api import settings
+import api.endpoints.members as members
+
+
+def _head_object(Bucket, Key, ExpectedBucketOwner):
+    if Key.endswith('missing.txt'):
+        raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+    if Key.endswith('forbidden.txt'):
+        raise ClientError({'Error': {'Code': '403'}}, 'HeadObject')
+    return {}
+
+
+class TestPresignedUrls(unittest.TestCase):
+    """Tests batch presigning of s3 keys."""
+
+    def setUp(self):
+        members.s3_object_existence_cache.clear()
+        self.s3_client = MagicMock()
+        self.s3_client.head_object.side_effect = _head_object
+        self.s3_client.generate_presigned_url.side_effect = \
+            lambda _method, Params, ExpiresIn: f"https://{Params['Bucket']}.s3/{Params['Key']}?exp={ExpiresIn}"
+
+    def test_batch_maps_each_key_to_a_url_or_error(self):
+        """Tests mounted paths are mapped to workspace keys and missing or forbidden keys get errors."""
+        keys = [f'{settings.WORKSPACE_MOUNT_PRIVATE}/a.txt', 'shared/missing.txt', 'org/forbidden.txt']
+
+        with patch.object(members, 's3_client', self.s3_client):
+            urls = members.presign_s3_keys('bucket', keys, 'alice', 600, '123456789012')
+
+        self.assertEqual(urls[keys[0]], {'url': 'https://bucket.s3/alice/a.txt?exp=600'})
+        self.assertEqual(urls[keys[1]]['code'], 404)
+        self.assertEqual(urls[keys[2]]['code'], 403)
+        self.s3_client.head_object.assert_any_call(Bucket='bucket', Key='alice/a.txt',
+                                                   ExpectedBucketOwner='123456789012')
+
+    def test_existence_checks_are_cached(self):
+        """Tests existing objects are only checked once, while missing and forbidden objects are rechecked."""
+        keys = ['a.txt', 'missing.txt', 'forbidden.txt']
+
+        with patch.object(members, 's3_client', self.s3_client):
+            members.presign_s3_keys('bucket', keys, '', 600, '123456789012')
+            urls = members.presign_s3_keys('bucket', keys, '', 600, '123456789012')
+
+        self.assertIn('url', urls['a.txt'])
+        self.assertEqual(self.s3_client.head_object.call_count, 5)
+
+    def test_object_is_found_right_after_upload(self):
+        self.s3_client.head_object.side_effect = [ClientError({'Error': {'Code': '404'}}, 'HeadObject'), {}]
+
+        with patch.object(members, 's3_client', self.s3_client):
+            before = members.check_s3_object('bucket', 'new.txt', '123456789012')
+            after = members.check_s3_object('bucket', 'new.txt', '123456789012')
+
+        self.assertEqual(before[1], 404)
+        self.assertIsNone(after)
+
+
+if __name__ == '__main__':
+    unittest.main()
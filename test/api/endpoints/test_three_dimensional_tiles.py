@@ -0,0 +1,87 @@
+import gzip
+import unittest
+import responses
+from api import settings
+from api.maapapp import app
+import api.endpoints.three_dimensional_tiles as three_dimensional_tiles
+
+TILES_URL = settings.DATA_SYSTEM_SERVICES_API_BASE + settings.DATA_SYSTEM_FILES_PATH
+
+
+class TestThreeDimensionalTiles(unittest.TestCase):
+    """3D Tiles proxy tests against a mocked data system."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        three_dimensional_tiles.tiles_cache.clear()
+
+    @responses.activate
+    def test_binary_tiles_keep_their_content_type_and_are_cached(self):
+        """Tests binary tile content is streamed with its own content type and then served from cache."""
+        responses.add(responses.GET, TILES_URL + 'ept/0-0-0-0.pnts', body=b'pnts\x00\x01',
+                      headers={'Content-Type': 'binary/octet-stream', 'ETag': '"abc"'})
+
+        # Streamed bodies are cached once fully read
+        first = self.app.get('/api/3d-tiles/ept/0-0-0-0.pnts')
+        self.assertEqual(first.get_data(), b'pnts\x00\x01')
+        second = self.app.get('/api/3d-tiles/ept/0-0-0-0.pnts')
+        not_modified = self.app.get('/api/3d-tiles/ept/0-0-0-0.pnts', headers={'If-None-Match': '"abc"'})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Content-Type'], 'application/octet-stream')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_data(), b'pnts\x00\x01')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_gzip_tileset_is_passed_through(self):
+        """Tests a gzip encoded tileset.json reaches clients that accept gzip without being decoded."""
+        body = gzip.compress(b'{"asset": {"version": "1.0"}}')
+        responses.add(responses.GET, TILES_URL + 'ept/tileset.json', body=body,
+                      headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+
+        response = self.app.get('/api/3d-tiles/ept/tileset.json', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(gzip.decompress(response.get_data()), b'{"asset": {"version": "1.0"}}')
+        self.assertEqual(responses.calls[0].request.headers['Accept-Encoding'], 'gzip')
+
+    @responses.activate
+    def test_gzip_stored_tileset_is_decoded_for_identity_clients(self):
+        """Tests an object stored gzip encoded is decoded for clients that don't accept gzip, even once cached."""
+        body = gzip.compress(b'{"asset": {"version": "1.0"}}')
+        responses.add(responses.GET, TILES_URL + 'ept/tileset.json', body=body,
+                      headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+
+        self.app.get('/api/3d-tiles/ept/tileset.json', headers={'Accept-Encoding': 'gzip'}).get_data()
+        for cache_status in ('MISS', 'HIT'):
+            response = self.app.get('/api/3d-tiles/ept/tileset.json', headers={'Accept-Encoding': 'identity'})
+
+            self.assertEqual(response.get_data(), b'{"asset": {"version": "1.0"}}')
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(response.headers['X-Cache'], cache_status)
+
+    @responses.activate
+    def test_expired_tiles_are_revalidated_upstream(self):
+        """Tests an expired entry is revalidated with If-None-Match and kept on a 304."""
+        url = TILES_URL + 'ept/tileset.json'
+        responses.add(responses.GET, url, body=b'{}', headers={'ETag': '"v1"', 'Cache-Control': 'max-age=1'})
+        self.app.get('/api/3d-tiles/ept/tileset.json').get_data()
+        entry = three_dimensional_tiles.tiles_cache.get('identity ' + url)
+        entry.stored_at -= 2
+
+        responses.replace(responses.GET, url, status=304)
+        response = self.app.get('/api/3d-tiles/ept/tileset.json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), b'{}')
+        self.assertEqual(response.headers['X-Cache'], 'REVALIDATED')
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'], '"v1"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from io import BytesIO
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from api.maapapp import app
+import api.endpoints.wms as wms
+import api.endpoints.wmts as wmts
+
+
+class TestWMSServices(unittest.TestCase):
+    """WMS GetMap tests against a capabilities document built from mocked CMR and tiler calls."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        wms.wms_services_cache.clear()
+        wmts.get_cog_urls_string = MagicMock(return_value='s3://bucket/cog.tif')
+        wmts.get_mosaic_tilejson = MagicMock(return_value={'bounds': [8.727, -2.291, 13.800, 2.04]})
+        wmts.get_stats = MagicMock(return_value={'statistics': {'1': {'pc': [2.3, 51.1]}}})
+
+    def test_mapproxy_services_are_built_in_memory_and_cached(self):
+        """Tests GetMap builds the mapproxy services for a layer once and reuses them."""
+        with patch.object(wms, 'render_map', return_value=b'imagebytes') as render_map, \
+                patch('builtins.open') as mock_open:
+            first = self.app.get('/api/wms/GetMap?LAYERS=G1&BBOX=8,-2,13,2&WIDTH=256&HEIGHT=256')
+            second = self.app.get('/api/wms/GetMap?LAYERS=G1&BBOX=9,-1,12,1&WIDTH=256&HEIGHT=256')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.get_data(), b'imagebytes')
+        self.assertEqual(second.headers['Content-Type'], 'image/png')
+        mock_open.assert_not_called()
+        wmts.get_cog_urls_string.assert_called_once()
+        self.assertIs(render_map.call_args_list[0][0][0], render_map.call_args_list[1][0][0])
+        self.assertEqual(render_map.call_args_list[1][0][1:3], ('G1', 'image/png'))
+
+    def test_layers_are_cached_per_time(self):
+        """Tests services are cached per layer and TIME."""
+        with patch.object(wms, 'render_map', return_value=b'imagebytes'):
+            self.app.get('/api/wms/GetMap?LAYERS=G1&TIME=2020-01-01')
+            self.app.get('/api/wms/GetMap?LAYERS=G1&TIME=2020-01-02')
+
+        self.assertEqual(set(wms.wms_services_cache.keys()), {('G1', '2020-01-01'), ('G1', '2020-01-02')})
+
+
+    def test_multiple_layers_are_rendered_concurrently_and_composited(self):
+        """Tests comma-separated LAYERS are rendered once each and composited in order."""
+        def png(color):
+            output = BytesIO()
+            Image.new('RGBA', (4, 2), color).save(output, format='PNG')
+            return output.getvalue()
+
+        layer_images = {'G1': png((255, 0, 0, 255)), 'G2': png((0, 0, 255, 0)), 'G3': png((0, 255, 0, 255))}
+
+        def render(services, layer, img_format, bbox, size):
+            self.assertEqual((img_format, size), ('image/png', (4, 2)))
+            return layer_images[layer]
+
+        with patch.object(wms, 'render_map', side_effect=render) as render_map:
+            response = self.app.get('/api/wms/GetMap?LAYERS=G1,G2&WIDTH=4&HEIGHT=2&FORMAT=image/jpeg')
+            top = self.app.get('/api/wms/GetMap?LAYERS=G1,G3&WIDTH=4&HEIGHT=2')
+
+        self.assertEqual(response.headers['Content-Type'], 'image/jpeg')
+        image = Image.open(BytesIO(response.get_data()))
+        self.assertEqual((image.format, image.size), ('JPEG', (4, 2)))
+        self.assertGreater(image.getpixel((0, 0))[0], 200)  # G2 is transparent, G1 shows through
+        self.assertEqual(Image.open(BytesIO(top.get_data())).getpixel((0, 0)), (0, 255, 0, 255))
+        self.assertEqual(render_map.call_count, 4)
+        self.assertEqual(set(wms.wms_services_cache.keys()), {('G1', None), ('G2', None), ('G3', None)})
+
+    def test_too_many_layers_are_rejected(self):
+        with patch.object(wms.settings, 'WMS_MAX_LAYERS', 2):
+            response = self.app.get('/api/wms/GetMap?LAYERS=G1,G2,G3')
+
+        self.assertEqual(response.get_json()['code'], 500)
+        self.assertIn('At most 2 LAYERS', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,13 @@ from api.maap_database import db
 from api.maapapp import app
 import api.endpoints.wmts as wmts
 import json
+import tempfile
+import time
+from api.utils.tile_cache import TileCache
+
+# Captured before the tests below replace module functions with mocks
+get_cog_urls_string = wmts.get_cog_urls_string
+
 
 class TestWMTSServices(unittest.TestCase):
     """Unified WMTS service tests for both legacy and new Titiler."""
@@ -17,6 +24,11 @@ class TestWMTSServices(unittest.TestCase):
         """Setup test environment."""
         app.config['TESTING'] = True
         self.app = app.test_client()
+        wmts.capabilities_cache.clear()
+        wmts.granule_cog_urls_cache.clear()
+        self.tile_cache_dir = tempfile.TemporaryDirectory()
+        wmts.tile_cache = TileCache(memory_max_bytes=1024 * 1024, disk_max_bytes=1024 * 1024,
+                                    disk_path=self.tile_cache_dir.name)
         self.maxDiff = None
         initialize_sql(db.engine)
         db.create_all()
@@ -48,6 +60,7 @@ class TestWMTSServices(unittest.TestCase):
         """Clean up test database."""
         db.session.remove()
         db.drop_all()
+        self.tile_cache_dir.cleanup()
     
     # Tile Generation Tests
     def test_wmts_tile_generation_with_granule_ur(self):
@@ -115,6 +128,67 @@ class TestWMTSServices(unittest.TestCase):
         self.assertIn('ServiceIdentification', content)
         self.assertIn('Contents', content)
     
+    def test_wmts_capabilities_are_cached_with_etag(self):
+        """Tests capabilities documents are served from cache and revalidated with ETag/304."""
+        wmts.get_cog_urls_string = MagicMock(return_value='out.cog.tif')
+
+        first = self.app.get("/api/wmts/GetCapabilities")
+        second = self.app.get("/api/wmts/GetCapabilities")
+        not_modified = self.app.get("/api/wmts/GetCapabilities", headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(wmts.get_cog_urls_string.call_count, len(wmts.default_collections))
+
+    def test_wmts_capabilities_refresher_rerenders_requested_documents(self):
+        """Tests the background refresher re-renders documents requested since its last run."""
+        wmts.get_cog_urls_string = MagicMock(return_value='out.cog.tif')
+        refresher = wmts.CapabilitiesRefresher(wmts.capabilities_cache, interval_seconds=3600)
+        key = wmts.capabilities_cache_key(wmts.ImmutableMultiDict([('short_name', 'GEDI02_A')]))
+
+        refresher.track(app, key)
+        refresher.refresh()
+        refresher.stop()
+
+        self.assertIn(b'search_results', wmts.capabilities_cache.get(key).content)
+        wmts.get_cog_urls_string.assert_called_once_with(wmts.ImmutableMultiDict([('short_name', 'GEDI02_A')]))
+
+    def test_wmts_capabilities_refresher_only_rerenders_recent_documents(self):
+        """Tests the refresher keeps only the most recently requested documents."""
+        wmts.get_cog_urls_string = MagicMock(return_value='out.cog.tif')
+        refresher = wmts.CapabilitiesRefresher(wmts.capabilities_cache, interval_seconds=3600, max_documents=2)
+        keys = [wmts.capabilities_cache_key(wmts.ImmutableMultiDict([('short_name', name)]))
+                for name in ('GEDI01_B', 'GEDI02_A', 'GEDI02_B')]
+
+        for key in keys:
+            refresher.track(app, key)
+        refresher.refresh()
+        refresher.refresh()
+        refresher.stop()
+
+        self.assertIsNone(wmts.capabilities_cache.get(keys[0]))
+        self.assertIsNotNone(wmts.capabilities_cache.get(keys[2]))
+        self.assertEqual(wmts.get_cog_urls_string.call_count, 2)
+
+    def test_wmts_capabilities_degrade_failed_layers(self):
+        """Tests a failing layer lookup degrades or drops that layer instead of failing the document."""
+        def cog_urls(params):
+            if params['short_name'] != 'AFLVIS2':
+                raise Exception('CMR down')
+            return 'out.cog.tif'
+
+        wmts.get_stats = MagicMock(side_effect=Exception('tiler timed out'))
+        wmts.get_cog_urls_string = MagicMock(side_effect=cog_urls)
+
+        response = self.app.get("/api/wmts/GetCapabilities")
+
+        self.assertEqual(response.status_code, 200)
+        content = response.get_data(as_text=True)
+        self.assertIn('<ows:Identifier>AFLVIS2</ows:Identifier>', content)
+        self.assertNotIn('<ows:Identifier>AfriSAR_UAVSAR_Coreg_SLC</ows:Identifier>', content)
+
     # Multi-granule and Advanced Tests
     def test_wmts_multiple_granules_mosaic(self):
         """Tests tile generation with multiple granules."""
@@ -130,6 +204,65 @@ class TestWMTSServices(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.headers['Content-Type'], 'image/png')
     
+    def test_wmts_multiple_granules_are_resolved_with_one_cached_search(self):
+        """Tests browse urls for all granule URs of a tile come from one search, cached across tiles."""
+        wmts.get_cog_urls_string = MagicMock(return_value="granule1.tif,granule2.tif")
+
+        for x in (545, 546):
+            response = self.app.get(f"/api/wmts/GetTile/10/{x}/513.png?granule_urs=granule1,granule2")
+            self.assertEqual(response.status_code, 200)
+
+        wmts.get_cog_urls_string.assert_called_once_with({'granule_ur[]': ['granule1', 'granule2']})
+
+    @responses.activate
+    def test_granule_browse_urls_keep_requested_order(self):
+        """Tests a batched granule_ur[] search returns browse urls in the requested granule order."""
+        def granule(granule_ur):
+            return {'title': granule_ur, 'links': [{'title': '(BROWSE)', 'href': f's3://bucket/{granule_ur}.tif'}]}
+
+        responses.add(responses.GET, wmts.cmr_search_granules_url,
+                      json={'feed': {'entry': [granule('b'), granule('a')]}})
+
+        urls = get_cog_urls_string({'granule_ur[]': ['a', 'b']})
+
+        self.assertEqual(urls, 's3://bucket/a.tif,s3://bucket/b.tif')
+        self.assertIn('granule_ur%5B%5D=a&granule_ur%5B%5D=b', responses.calls[0].request.url)
+
+    def test_wmts_tiles_are_cached_with_etag(self):
+        """Tests rendered tiles are served from the tile cache and revalidated with ETag/304."""
+        wmts.get_cog_urls_string = MagicMock(return_value='test.tif')
+        url = "/api/wmts/GetTile/10/545/513.png?granule_urs=cached.vrt"
+
+        first = self.app.get(url)
+        second = self.app.get(url)
+        not_modified = self.app.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_data(), b'imagebytes')
+        self.assertIn('max-age', second.headers['Cache-Control'])
+        self.assertEqual(not_modified.status_code, 304)
+        wmts.get_tiles.assert_called_once()
+        self.assertEqual(wmts.tile_cache.stats()['memory_hits'], 1)
+
+    def test_seeded_tiles_are_served_from_cache(self):
+        """Tests a seeding job renders each tile once and GetTile then serves them as cache hits."""
+        wmts.get_cog_urls_string = MagicMock(return_value='test.tif')
+        with patch.object(wmts.settings, 'WMTS_SEED_MAX_REQUESTS_PER_SECOND', 0):
+            job = wmts.start_tile_seed([-10, -10, 10, 10], 2, 3, granule_urs='seeded.vrt')
+        for _ in range(500):
+            if job.to_dict()['finished']:
+                break
+            time.sleep(0.01)
+
+        progress = job.to_dict()
+        self.assertEqual(progress['status'], 'completed')
+        self.assertEqual(progress['seeded'], progress['total'])
+        self.assertEqual(wmts.get_tiles.call_count, progress['total'])
+
+        response = self.app.get("/api/wmts/GetTile/3/3/3.png?granule_urs=seeded.vrt")
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+
     # Titiler Integration Tests
     def test_titiler_integration_error_handling(self):
         """Tests error handling for Titiler integration failures."""
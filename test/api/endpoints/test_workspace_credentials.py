@@ -0,0 +1,110 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, MagicMock
+from api.maapapp import app
+from api.maap_database import db
+from api.models import initialize_sql
+import api.endpoints.members as members
+from api.utils import s3_access
+
+
+def _assumed_role(lifetime=timedelta(hours=12)):
+    return {'Credentials': {
+        'AccessKeyId': 'AKIA',
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': datetime.now(timezone.utc) + lifetime
+    }}
+
+
+class TestWorkspaceCredentials(unittest.TestCase):
+    """Tests caching of workspace bucket STS credentials and the user policies they are scoped to."""
+
+    def setUp(self):
+        members.workspace_credentials_cache.clear()
+        s3_access.user_s3_policy_cache.clear()
+
+    def test_credentials_are_cached_per_policy(self):
+        """Tests repeated calls reuse credentials and a policy change assumes the role again."""
+        with patch.object(members, 'sts_client') as sts_client:
+            sts_client.assume_role.return_value = _assumed_role()
+            first = members.get_workspace_bucket_credentials(1, 'alice', '{"policy": 1}', 'arn:role')
+            second = members.get_workspace_bucket_credentials(1, 'alice', '{"policy": 1}', 'arn:role')
+            members.get_workspace_bucket_credentials(1, 'alice', '{"policy": 2}', 'arn:role')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['aws_session_token'], 'token')
+        self.assertEqual(sts_client.assume_role.call_count, 2)
+
+    def test_credentials_close_to_expiry_are_not_cached(self):
+        with patch.object(members, 'sts_client') as sts_client:
+            sts_client.assume_role.return_value = _assumed_role(lifetime=timedelta(minutes=5))
+            members.get_workspace_bucket_credentials(1, 'alice', '{}', 'arn:role')
+            members.get_workspace_bucket_credentials(1, 'alice', '{}', 'arn:role')
+
+        self.assertEqual(sts_client.assume_role.call_count, 2)
+
+    def test_requester_pays_credentials_are_reused_for_the_same_duration(self):
+        """Tests credentials are reused for the same requested duration, within the lifetime slack."""
+        members.requester_pays_credentials_cache.clear()
+        with patch.object(members, 'sts_client') as sts_client, \
+                patch.object(members.settings, 'REQUESTER_PAYS_LIFETIME_SLACK_SECONDS', 300):
+            sts_client.assume_role.side_effect = \
+                lambda DurationSeconds, **_: _assumed_role(lifetime=timedelta(seconds=DurationSeconds))
+            first = members.get_requester_pays_credentials('alice', members.requester_pays_duration(7200))
+            again = members.get_requester_pays_credentials('alice', members.requester_pays_duration(7200))
+            members.get_requester_pays_credentials('alice', members.requester_pays_duration(10 ** 6))
+
+        self.assertEqual(first, again)
+        self.assertEqual([c.kwargs['DurationSeconds'] for c in sts_client.assume_role.call_args_list],
+                         [7200 + 300, members.STS_MAX_DURATION_SECONDS])
+
+    def test_short_requests_never_get_longer_lived_credentials(self):
+        """Tests a short request is not served the cached credentials of a longer one."""
+        members.requester_pays_credentials_cache.clear()
+        with patch.object(members, 'sts_client') as sts_client, \
+                patch.object(members.settings, 'REQUESTER_PAYS_LIFETIME_SLACK_SECONDS', 300):
+            sts_client.assume_role.side_effect = \
+                lambda DurationSeconds, **_: _assumed_role(lifetime=timedelta(seconds=DurationSeconds))
+            members.get_requester_pays_credentials('alice', members.requester_pays_duration(43200))
+            short = members.get_requester_pays_credentials('alice', members.requester_pays_duration(900))
+
+        self.assertEqual(sts_client.assume_role.call_count, 2)
+        self.assertLessEqual(members.requester_pays_remaining_seconds(short), 900 + 300)
+
+    def test_requester_pays_duration_is_capped(self):
+        self.assertEqual(members.requester_pays_duration(3700), 3700)
+        self.assertEqual(members.requester_pays_duration(10 ** 6), members.STS_MAX_DURATION_SECONDS)
+
+    def test_s3_access_changes_invalidate_cached_policies(self):
+        """Tests user policies are served from cache until an org S3 access entry changes."""
+        with app.app_context():
+            initialize_sql(db.engine)
+            db.create_all()
+            with patch.object(s3_access, 'get_user_s3_access', return_value=[]) as get_user_s3_access:
+                s3_access.get_user_s3_policy('bucket', 'alice', 1)
+                policy, paths = s3_access.get_user_s3_policy('bucket', 'alice', 1)
+                entry = s3_access.create_s3_access(1, 'org-bucket', 'prefix')
+                s3_access.get_user_s3_policy('bucket', 'alice', 1)
+                s3_access.delete_s3_access(entry['id'])
+
+        self.assertEqual(get_user_s3_access.call_count, 2)
+        self.assertEqual(paths[0]['uri'], 's3://bucket/alice')
+
+    def test_invalidation_reaches_other_workers(self):
+        """Tests a policy cached by one worker is rebuilt once another worker bumps the policy generation."""
+        with app.app_context():
+            initialize_sql(db.engine)
+            db.create_all()
+            with patch.object(s3_access, 'get_user_s3_access', return_value=[]) as get_user_s3_access:
+                s3_access.get_user_s3_policy('bucket', 'alice', 1)
+                # Another worker invalidates; its cache clear does not reach this process
+                with patch.object(s3_access.user_s3_policy_cache, 'clear'):
+                    s3_access.invalidate_user_s3_policies()
+                s3_access.get_user_s3_policy('bucket', 'alice', 1)
+
+        self.assertEqual(get_user_s3_access.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from api.utils.edl_token_refresher import EdlTokenRefresher
+
+
+def _broker_token(token, expires_in_seconds):
+    return {"access_token": token, "expires_in": expires_in_seconds}
+
+
+class TestEdlTokenRefresher(unittest.TestCase):
+
+    def _refresher(self, fetch, persist=None, max_members=10):
+        return EdlTokenRefresher(fetch=fetch,
+                                 persist=persist or MagicMock(),
+                                 max_members=max_members,
+                                 refresh_ahead=timedelta(minutes=15),
+                                 interval_seconds=3600,
+                                 wait_timeout_seconds=5,
+                                 enabled=False)
+
+    def test_refresh_records_expiration(self):
+        """Tests a refresh returns the new token and tracks its expiration."""
+        refresher = self._refresher(MagicMock(return_value=_broker_token("edl-1", 3600)))
+        refresher.track(None, 1, "kc-token")
+
+        token = refresher.refresh(1)
+
+        self.assertEqual(token, "edl-1")
+        expiration = refresher.get_expiration(1)
+        self.assertGreater(expiration, datetime.now(timezone.utc) + timedelta(minutes=59))
+
+    def test_concurrent_refreshes_share_one_broker_call(self):
+        """Tests concurrent refreshes for the same member are deduplicated."""
+        release = threading.Event()
+        calls = []
+
+        def fetch(kc_access_token):
+            calls.append(kc_access_token)
+            release.wait(5)
+            return _broker_token("edl-shared", 3600)
+
+        refresher = self._refresher(fetch)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(refresher.refresh(7, "kc-token")))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["edl-shared"] * 5)
+
+    def test_refresh_due_tokens_renews_only_expiring_members(self):
+        """Tests the background pass refreshes members close to expiry and persists them."""
+        fetch = MagicMock(side_effect=[_broker_token("soon", 60),
+                                       _broker_token("later", 7200),
+                                       _broker_token("renewed", 7200)])
+        persist = MagicMock()
+        refresher = self._refresher(fetch, persist)
+        refresher.track(None, 1, "kc-1")
+        refresher.track(None, 2, "kc-2")
+        refresher.refresh(1)
+        refresher.refresh(2)
+
+        refresher.refresh_due_tokens()
+
+        self.assertEqual(fetch.call_count, 3)
+        fetch.assert_called_with("kc-1")
+        persist.assert_called_once_with(1, "renewed")
+
+    def test_failed_background_refresh_stops_tracking(self):
+        """Tests members whose refresh fails are dropped from the tracker."""
+        refresher = self._refresher(MagicMock(return_value=None))
+        refresher.track(None, 3, "expired-kc-token")
+
+        refresher.refresh_due_tokens()
+
+        self.assertIsNone(refresher.get_expiration(3))
+        self.assertIsNone(refresher.refresh(3))
+
+    def test_expired_keycloak_token_is_not_sent_to_the_broker(self):
+        """Tests members whose tracked Keycloak token has expired are dropped without a broker call."""
+        fetch = MagicMock(return_value=_broker_token("soon", 60))
+        persist = MagicMock()
+        refresher = self._refresher(fetch, persist)
+        now = datetime.now(timezone.utc)
+        refresher.track(None, 1, "kc-live", (now + timedelta(minutes=5)).timestamp())
+        refresher.track(None, 2, "kc-expired", (now - timedelta(minutes=1)).timestamp())
+        refresher.refresh(1, "kc-live")
+        refresher.refresh(2, "kc-expired")
+
+        refresher.refresh_due_tokens()
+
+        self.assertEqual(fetch.call_count, 3)
+        fetch.assert_called_with("kc-live")
+        persist.assert_called_once_with(1, "soon")
+        self.assertIsNone(refresher.refresh(2))
+        self.assertEqual(fetch.call_count, 3)
+
+    def test_tracked_members_are_bounded(self):
+        """Tests the tracker evicts least recently used members beyond its size."""
+        refresher = self._refresher(MagicMock(return_value=_broker_token("edl", 3600)), max_members=2)
+        for member_id in range(3):
+            refresher.track(None, member_id, f"kc-{member_id}")
+            refresher.refresh(member_id)
+
+        self.assertIsNone(refresher.get_expiration(0))
+        self.assertIsNotNone(refresher.get_expiration(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import math
+import unittest
+from types import SimpleNamespace
+
+from api.utils.geometry import simplify, reduce_ring, shape_polygons, signed_area, format_polygon
+
+
+def _circle(points, clockwise=True):
+    step = (-1 if clockwise else 1) * 2 * math.pi / points
+    ring = [(math.cos(i * step), math.sin(i * step)) for i in range(points)]
+    return ring + [ring[0]]
+
+
+class TestGeometry(unittest.TestCase):
+
+    def test_simplify_drops_collinear_points(self):
+        self.assertEqual(simplify([(0, 0), (1, 0), (2, 0), (2, 2)], 0.01), [(0, 0), (2, 0), (2, 2)])
+
+    def test_ring_is_reduced_to_max_points(self):
+        ring = reduce_ring(_circle(2000), 100)
+
+        self.assertLessEqual(len(ring), 100)
+        self.assertGreaterEqual(len(ring), 4)
+        self.assertEqual(ring[0], ring[-1])
+
+    def test_exterior_rings_are_counter_clockwise_and_holes_dropped(self):
+        outer = _circle(50, clockwise=True)
+        hole = [(x / 2, y / 2) for x, y in _circle(10, clockwise=False)]
+        shape = SimpleNamespace(shapeType=5, parts=[0, len(outer)], points=outer + hole)
+
+        rings = shape_polygons([shape], 500)
+
+        self.assertEqual(len(rings), 1)
+        self.assertGreater(signed_area(rings[0]), 0)
+
+    def test_non_polygon_shapes_are_rejected(self):
+        self.assertIsNone(shape_polygons([SimpleNamespace(shapeType=1, parts=[], points=[(0, 0)])], 500))
+
+    def test_format_polygon(self):
+        self.assertEqual(format_polygon([(-10.5, 0), (10, 0), (0, 10), (-10.5, 0)]), '-10.5,0,10,0,0,10,-10.5,0')
+
+
+if __name__ == '__main__':
+    unittest.main()
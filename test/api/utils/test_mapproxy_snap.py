@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+import responses
+
+from api.endpoints.wmts import capabilities_template
+from api.utils import mapproxy_snap
+from api.utils.mapproxy_snap import WmtsServiceCache, TileStorage, create_config_wmts, create_config_wmts_xml, \
+    build_services
+
+SERVICE_URL = 'https://wmts.test/wmts/1.0.0/WMTSCapabilities.xml'
+
+
+def _capabilities(*layer_titles):
+    layers = [{'layer_title': title, 'bounds': [8.7, -2.3, 13.8, 2.0], 'content_type': 'png', 'ext': 'png',
+               'query': f'urls={title}.tif', 'color_map': 'schwarzwald', 'rescale': '-1,1'} for title in layer_titles]
+    return capabilities_template.render(service_title='Test WMTS', provider='Test', provider_url='https://wmts.test',
+                                        base_url='https://wmts.test', layers=layers, minzoom=0, maxzoom=18,
+                                        zoom=10, tile_width=256, tile_height=256)
+
+
+class TestMapproxySnap(unittest.TestCase):
+
+    def setUp(self):
+        mapproxy_snap.wmts_service_cache.clear()
+
+    def test_config_is_built_from_in_memory_capabilities(self):
+        conf = create_config_wmts_xml(_capabilities('G1', 'G2'), layernames=['G2'])
+
+        self.assertEqual([layer['name'] for layer in conf['layers']], ['G2'])
+        self.assertIn('G2_Grid', conf['grids'])
+        self.assertIn('%(z)s/%(x)s/%(y)s', conf['sources']['G2_Source']['url'])
+
+    def test_parsed_services_are_cached_without_patching_requests(self):
+        """Tests a capabilities file is parsed once and requests is left untouched."""
+        original_request = requests.request
+        with tempfile.NamedTemporaryFile('w', suffix='.xml', delete=False) as f:
+            f.write(_capabilities('G1', 'G2'))
+        try:
+            with patch.object(mapproxy_snap, 'WebMapTileService', wraps=mapproxy_snap.WebMapTileService) as parse:
+                first = create_config_wmts(['file://' + f.name], layernames=['G1'])
+                second = create_config_wmts(['file://' + f.name], layernames=['G2'])
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(first['grids']['G1_Grid'], second['grids']['G2_Grid'])
+        self.assertIs(requests.request, original_request)
+
+    @responses.activate
+    def test_expired_services_are_revalidated_with_etag(self):
+        responses.add(responses.GET, SERVICE_URL, body=_capabilities('G1'), headers={'ETag': '"v1"'})
+        responses.add(responses.GET, SERVICE_URL, status=304)
+        cache = WmtsServiceCache(maxsize=4, ttl_seconds=60)
+
+        service = cache.get(SERVICE_URL)
+        with patch('api.utils.mapproxy_snap.time_module.time', return_value=time.time() + 120):
+            revalidated = cache.get(SERVICE_URL)
+
+        self.assertIs(revalidated, service)
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'], '"v1"')
+
+
+
+class TestTileStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_caches_store_tiles_only_when_storage_is_configured(self):
+        for backend in TileStorage.BACKENDS:
+            storage = TileStorage(backend, self.tmpdir.name, max_bytes=1024, ttl_seconds=60)
+            conf = create_config_wmts_xml(_capabilities('G1'), storage=storage)
+
+            cache = conf['caches']['G1_Cache']
+            self.assertNotIn('disable_storage', cache)
+            self.assertEqual(cache['cache']['type'], backend)
+            self.assertEqual(cache['refresh_before'], {'seconds': 60})
+            build_services(conf)  # mapproxy accepts the configuration
+
+        self.assertTrue(create_config_wmts_xml(_capabilities('G1'))['caches']['G1_Cache']['disable_storage'])
+
+    def test_file_storage_is_cleaned_up_to_budget_and_ttl(self):
+        storage = TileStorage('file', self.tmpdir.name, max_bytes=10, ttl_seconds=3600)
+        now = time.time()
+        for name, age in (('expired.png', 7200), ('old.png', 30), ('new.png', 10)):
+            path = os.path.join(self.tmpdir.name, 'G1', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'123456')
+            os.utime(path, (now - age, now - age))
+
+        freed = storage.cleanup(now=now)
+
+        self.assertEqual(freed, 12)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'G1')), ['new.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from api.utils.response_cache import ResponseCache, CACHE_HIT, CACHE_STALE, parse_cache_control
+
+
+def _upstream(content=b'{}', status_code=200, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {'Content-Type': 'application/json'}
+    return response
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_parse_cache_control(self):
+        self.assertEqual(parse_cache_control('public, max-age=60, no-cache'),
+                         {'public': True, 'max-age': '60', 'no-cache': True})
+        self.assertEqual(parse_cache_control(None), {})
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        """Tests an expired entry inside the stale window is returned immediately and refreshed once."""
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=10, stale_seconds=60)
+        refreshed = threading.Event()
+        fetch = MagicMock(return_value=_upstream(b'old'))
+        cache.get_or_fetch('key', fetch)
+
+        def refetch():
+            refreshed.set()
+            return _upstream(b'new')
+
+        with patch('api.utils.response_cache.time.time', return_value=cache.get('key').stored_at + 30):
+            stale = cache.get_or_fetch('key', refetch)
+        refreshed.wait(5)
+
+        self.assertEqual(stale.cache_status, CACHE_STALE)
+        self.assertEqual(stale.content, b'old')
+        for _ in range(50):
+            if cache.get('key').content == b'new':
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get('key').content, b'new')
+        self.assertEqual(cache.get_or_fetch('key', fetch).cache_status, CACHE_HIT)
+
+    def test_cache_is_bounded_by_bytes(self):
+        cache = ResponseCache(max_bytes=10, ttl_seconds=60)
+        cache.get_or_fetch('a', lambda: _upstream(b'123456'))
+        cache.get_or_fetch('b', lambda: _upstream(b'123456'))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+
+    def test_upstream_cache_control_is_respected(self):
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+        cache.get_or_fetch('private', lambda: _upstream(headers={'Cache-Control': 'private'}))
+        cache.get_or_fetch('short', lambda: _upstream(headers={'Cache-Control': 'max-age=5'}))
+
+        self.assertIsNone(cache.get('private'))
+        self.assertEqual(cache.get('short').ttl, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import fnmatch
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet
+
+from api import settings
+from api.utils.shared_cache import CacheBackend, MemoryCacheBackend, SQLiteCacheBackend, NetworkCacheBackend, \
+    get_cache_backend, cached
+
+
+class FakeKeyValueClient:
+    """Local stand-in for a Redis-style networked key/value store."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, time.time() + ex if ex is not None else None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match=None):
+        return [k for k in self.data if match is None or fnmatch.fnmatch(k, match)]
+
+
+class CacheBackendContract:
+    """Behaviour every cache backend must provide."""
+
+    def make_cache(self, namespace="test", maxsize=3):
+        raise NotImplementedError
+
+    def test_set_get_delete(self):
+        cache = self.make_cache()
+        cache.set("a", {"value": 1})
+        self.assertEqual(cache.get("a"), {"value": 1})
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+
+    def test_entries_expire(self):
+        cache = self.make_cache()
+        cache.set("a", "value", ttl=60)
+        self.assertEqual(cache.get("a"), "value")
+        with patch("time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("a"))
+
+    def test_namespaces_are_isolated(self):
+        first = self.make_cache("first")
+        second = self.make_cache("second")
+        first.set("a", 1)
+        self.assertIsNone(second.get("a"))
+        second.clear()
+        self.assertEqual(first.get("a"), 1)
+
+
+class TestMemoryCacheBackend(CacheBackendContract, unittest.TestCase):
+
+    def make_cache(self, namespace="test", maxsize=3):
+        return MemoryCacheBackend(namespace, maxsize)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self.make_cache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+
+class TestSQLiteCacheBackend(CacheBackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_cache(self, namespace="test", maxsize=3):
+        return SQLiteCacheBackend(namespace, maxsize, self.path)
+
+    def test_entries_are_shared_between_instances(self):
+        """Tests two backends on the same file (e.g. two workers) see each other's entries."""
+        self.make_cache().set("a", [1, 2])
+        self.assertEqual(self.make_cache().get("a"), [1, 2])
+
+    def test_encrypted_values_are_not_stored_in_plaintext(self):
+        """Tests values cached with a fernet are encrypted in the file and unreadable with another key."""
+        cache = SQLiteCacheBackend("creds", 3, self.path, fernet=Fernet(Fernet.generate_key()))
+        cache.set("a", {"aws_secret_access_key": "secret"})
+
+        self.assertEqual(cache.get("a"), {"aws_secret_access_key": "secret"})
+        with open(self.path, "rb") as f:
+            self.assertNotIn(b"secret", f.read())
+        other_key = SQLiteCacheBackend("creds", 3, self.path, fernet=Fernet(Fernet.generate_key()))
+        self.assertIsNone(other_key.get("a"))
+
+    def test_namespace_is_bounded(self):
+        cache = self.make_cache(maxsize=2)
+        with patch("time.time", side_effect=[1.0, 2.0, 3.0]):
+            cache.set("a", 1)
+            cache.set("b", 2)
+            cache.set("c", 3)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_reads_only_record_access_after_touch_interval(self):
+        """Tests a read only writes its access time once the entry was last touched touch_seconds ago."""
+        cache = SQLiteCacheBackend("test", 3, self.path, touch_seconds=60)
+        with patch("time.time", return_value=1000.0):
+            cache.set("a", 1)
+        statements = []
+        cache._connection().set_trace_callback(statements.append)
+
+        with patch("time.time", return_value=1030.0):
+            cache.get("a")
+        with patch("time.time", return_value=1090.0):
+            cache.get("a")
+
+        self.assertEqual(len([s for s in statements if s.startswith("UPDATE")]), 1)
+
+    def test_sets_below_maxsize_do_not_evict(self):
+        cache = self.make_cache(maxsize=2)
+        statements = []
+        cache._connection().set_trace_callback(statements.append)
+
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+
+        self.assertEqual(len([s for s in statements if s.startswith("DELETE")]), 1)
+
+
+class TestNetworkCacheBackend(CacheBackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeKeyValueClient()
+
+    def make_cache(self, namespace="test", maxsize=3):
+        return NetworkCacheBackend(namespace, self.client)
+
+    def test_keys_are_prefixed_by_namespace(self):
+        self.make_cache("edc").set("a", 1)
+        self.assertIn("maap-api:edc:a", self.client.data)
+
+    def test_encrypted_values_are_not_stored_in_plaintext(self):
+        cache = NetworkCacheBackend("edc", self.client, fernet=Fernet(Fernet.generate_key()))
+        cache.set("a", {"aws_secret_access_key": "secret"})
+
+        self.assertNotIn("secret", self.client.data["maap-api:edc:a"][0])
+        self.assertEqual(cache.get("a"), {"aws_secret_access_key": "secret"})
+
+
+class TestCacheBackend(unittest.TestCase):
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class GetOnlyBackend(CacheBackend):
+            def get(self, key, default=None):
+                return default
+
+        with self.assertRaises(TypeError):
+            GetOnlyBackend("test")
+
+    def test_encrypted_cache_requires_fernet_key(self):
+        with patch.object(settings, "FERNET_KEY", ""):
+            with self.assertRaises(ValueError):
+                get_cache_backend("creds", 10, backend="sqlite", encrypted=True)
+
+
+class TestCachedDecorator(unittest.TestCase):
+
+    def test_results_are_cached_by_key(self):
+        calls = []
+
+        @cached(MemoryCacheBackend("test", 10), key=lambda x, y: f"{x}:{y}")
+        def add(x, y):
+            calls.append((x, y))
+            return x + y
+
+        self.assertEqual(add(1, 2), 3)
+        self.assertEqual(add(1, 2), 3)
+        self.assertEqual(add(2, 2), 4)
+        self.assertEqual(calls, [(1, 2), (2, 2)])
+
+    def test_non_positive_ttl_is_not_cached(self):
+        calls = []
+
+        @cached(MemoryCacheBackend("test", 10), key=lambda x: str(x), ttl=lambda value: value)
+        def identity(x):
+            calls.append(x)
+            return x
+
+        identity(0)
+        identity(0)
+        identity(60)
+        identity(60)
+        self.assertEqual(calls, [0, 0, 60])
+
+    def test_get_cache_backend_rejects_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_cache_backend("test", 10, backend="memcached")
+
+    def test_edc_credentials_are_cached_for_half_their_lifetime(self):
+        from api.endpoints.members import creds_ttl_seconds
+        expiration = (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S%z")
+        ttl = creds_ttl_seconds({"expiration": expiration})
+        self.assertAlmostEqual(ttl, 30 * 60, delta=5)
+        self.assertLessEqual(creds_ttl_seconds({}), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
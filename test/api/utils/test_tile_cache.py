@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from api.utils.shared_cache import MemoryCacheBackend
+from api.utils.tile_cache import TileCache, tile_key, TIER_MEMORY, TIER_DISK
+
+
+class TestTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_tiles_are_promoted_from_disk_to_memory(self):
+        key = tile_key('https://tiler.test/mosaic/10/545/513.png?urls=a.tif')
+        TileCache(memory_max_bytes=1024, disk_max_bytes=1024, disk_path=self.tmpdir.name).put(key, b'tile')
+        cache = TileCache(memory_max_bytes=1024, disk_max_bytes=1024, disk_path=self.tmpdir.name)
+
+        self.assertEqual(cache.get(key), (b'tile', TIER_DISK))
+        self.assertEqual(cache.get(key), (b'tile', TIER_MEMORY))
+        self.assertIsNone(cache.get(tile_key('other')))
+        self.assertEqual(cache.stats()['hit_ratio'], round(2 / 3, 4))
+
+    def test_disk_tier_is_bounded(self):
+        cache = TileCache(memory_max_bytes=0, disk_max_bytes=10, disk_path=self.tmpdir.name)
+        first, second = tile_key('first'), tile_key('second')
+        cache.put(first, b'123456')
+        cache.put(second, b'123456')
+
+        self.assertIsNone(cache.get(first))
+        self.assertEqual(cache.get(second), (b'123456', TIER_DISK))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, first[:2], first)))
+        self.assertEqual(cache.stats()['disk_bytes'], 6)
+
+    def test_disk_cap_covers_tiles_of_other_workers(self):
+        """Tests a worker evicts the least recently used tiles written by other workers sharing the directory."""
+        first_worker = TileCache(memory_max_bytes=0, disk_max_bytes=10, disk_path=self.tmpdir.name, disk_rescan_seconds=0)
+        second_worker = TileCache(memory_max_bytes=0, disk_max_bytes=10, disk_path=self.tmpdir.name, disk_rescan_seconds=0)
+        old, recent, new = tile_key('old'), tile_key('recent'), tile_key('new')
+        second_worker.put(recent, b'123')
+        first_worker.put(old, b'123456')
+        os.utime(os.path.join(self.tmpdir.name, old[:2], old), (1, 1))
+        second_worker.put(new, b'123')
+
+        self.assertIsNone(second_worker.get(old))
+        self.assertEqual(first_worker.get(recent), (b'123', TIER_DISK))
+        self.assertEqual(second_worker.stats()['disk_bytes'], 6)
+
+    def test_clear_removes_tiles_from_both_tiers(self):
+        cache = TileCache(memory_max_bytes=1024, disk_max_bytes=1024, disk_path=self.tmpdir.name)
+        key = tile_key('tile')
+        cache.put(key, b'tile')
+        cache.clear()
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['disk_tiles'], 0)
+
+    def test_stats_and_clear_are_shared_between_workers(self):
+        """Tests metrics are summed over workers and a clear in one empties the memory tier of the others."""
+        store = MemoryCacheBackend('tile-cache-stats', 16)
+        key = tile_key('tile')
+        with patch('os.getpid', return_value=1):
+            first = TileCache(memory_max_bytes=1024, disk_max_bytes=0, disk_path='', stats_store=store)
+            first.put(key, b'tile')
+            first.get(key)
+        with patch('os.getpid', return_value=2):
+            second = TileCache(memory_max_bytes=1024, disk_max_bytes=0, disk_path='', stats_store=store)
+            second.put(key, b'tile')
+            second.get(tile_key('other'))
+            stats = second.stats()
+
+        self.assertEqual((stats['workers'], stats['memory_hits'], stats['misses']), (2, 1, 1))
+        self.assertEqual(stats['memory_tiles'], 2)
+
+        with patch('os.getpid', return_value=1):
+            first.clear()
+        with patch('os.getpid', return_value=2):
+            self.assertEqual(second.stats()['memory_tiles'], 0)
+            self.assertIsNone(second.get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from api.utils.shared_cache import SQLiteCacheBackend
+from api.utils.tile_seeder import (TileSeedJob, TileSeedJobs, RateLimiter, count_tiles, tiles_for_bbox,
+                                   STATUS_COMPLETED, STATUS_CANCELLED)
+
+
+def _wait_until_finished(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.to_dict()['finished'] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestTileSeeder(unittest.TestCase):
+
+    def test_tiles_for_bbox(self):
+        """Tests the tiles covering a bbox match the XYZ web mercator scheme at each zoom."""
+        world = [-180, -90, 180, 90]
+        self.assertEqual(list(tiles_for_bbox(world, 0, 0)), [(0, 0, 0)])
+        self.assertEqual(count_tiles(world, 0, 2), 1 + 4 + 16)
+
+        # North-eastern quadrant only
+        self.assertEqual(list(tiles_for_bbox([10, 10, 170, 80], 1, 1)), [(1, 1, 0)])
+        tiles = list(tiles_for_bbox([-10, -10, 10, 10], 3, 5))
+        self.assertEqual(len(tiles), count_tiles([-10, -10, 10, 10], 3, 5))
+        self.assertEqual(len(set(tiles)), len(tiles))
+
+    def test_job_seeds_tiles_and_skips_cached(self):
+        """Tests a job seeds every tile once, counting tiles that were already cached separately."""
+        cached = {(1, 0, 0), (1, 1, 1)}
+        seeded = []
+        lock = threading.Lock()
+
+        def seed_tile(z, x, y, throttle):
+            if (z, x, y) in cached:
+                return False
+            if (z, x, y) == (1, 0, 1):
+                raise Exception('tiler failed')
+            throttle()
+            with lock:
+                seeded.append((z, x, y))
+            return True
+
+        world = [-180, -90, 180, 90]
+        job = TileSeedJob(tiles_for_bbox(world, 0, 1), count_tiles(world, 0, 1), seed_tile,
+                          max_workers=2, max_requests_per_second=0)
+        job.start()
+        _wait_until_finished(job)
+
+        progress = job.to_dict()
+        self.assertEqual(progress['status'], STATUS_COMPLETED)
+        self.assertEqual(sorted(seeded), [(0, 0, 0), (1, 1, 0)])
+        self.assertEqual((progress['seeded'], progress['cached'], progress['failed']), (2, 2, 1))
+        self.assertEqual(progress['progress'], 1.0)
+
+    def test_cancelled_job_stops_seeding(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def seed_tile(z, x, y, throttle):
+            started.set()
+            release.wait(5)
+            return True
+
+        world = [-180, -90, 180, 90]
+        job = TileSeedJob(tiles_for_bbox(world, 0, 6), count_tiles(world, 0, 6), seed_tile,
+                          max_workers=1, max_requests_per_second=0)
+        job.start()
+        started.wait(5)
+        job.cancel()
+        release.set()
+        _wait_until_finished(job)
+
+        progress = job.to_dict()
+        self.assertEqual(progress['status'], STATUS_CANCELLED)
+        self.assertLess(progress['done'], progress['total'])
+
+    def test_rate_limiter_spaces_requests(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 - 0.01)
+
+    def test_jobs_registry_is_bounded(self):
+        jobs = TileSeedJobs(maxsize=2)
+        created = [jobs.add(TileSeedJob(iter(()), 0, None, 1, 0)) for _ in range(3)]
+
+        self.assertEqual({job['id'] for job in jobs.list()}, {created[1].id, created[2].id})
+
+    def test_jobs_are_shared_between_workers(self):
+        """Tests a job started by one worker reports progress to, and is cancelled from, another."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def seed_tile(z, x, y, throttle):
+            started.set()
+            release.wait(5)
+            return True
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'cache.sqlite')
+            starting_worker = TileSeedJobs(SQLiteCacheBackend('seeds', 10, path))
+            other_worker = TileSeedJobs(SQLiteCacheBackend('seeds', 10, path))
+
+            world = [-180, -90, 180, 90]
+            job = starting_worker.add(TileSeedJob(tiles_for_bbox(world, 0, 6), count_tiles(world, 0, 6), seed_tile,
+                                                  max_workers=1, max_requests_per_second=0))
+            job.start()
+            started.wait(5)
+            self.assertEqual([record['id'] for record in other_worker.list()], [job.id])
+            self.assertTrue(other_worker.cancel(job.id)['cancel_requested'])
+            release.set()
+            _wait_until_finished(job)
+
+            self.assertEqual(other_worker.get(job.id)['status'], STATUS_CANCELLED)
+            self.assertIsNone(other_worker.get('unknown'))
+
+
+if __name__ == '__main__':
+    unittest.main()
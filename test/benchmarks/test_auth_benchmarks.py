@@ -0,0 +1,250 @@
+"""
+Authentication microbenchmarks.
+
+Runs every authentication method supported by ``api.auth.security`` through
+``login_required`` + ``get_authorized_user`` against local stand-ins for the
+Keycloak JWKS/broker endpoints, CAS and the test database. For each method we
+record per-request latency, database statements and outbound HTTP calls, and
+fail when a count exceeds its budget in ``AUTH_BUDGETS``. Lower a budget when a
+change makes an auth path cheaper; never raise one without a reason.
+
+Set ``AUTH_BENCHMARK_OUTPUT`` to a file path to also write the measurements as
+JSON (e.g. ``test-results/auth_benchmarks.json`` in CI).
+"""
+import hashlib
+import json
+import os
+import statistics
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import jwt
+import responses
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt import PyJWKClient
+from jwt.algorithms import RSAAlgorithm
+from sqlalchemy import event
+from werkzeug.exceptions import HTTPException
+
+from api import settings
+from api.auth import cas_auth
+from api.auth.security import login_required, get_authorized_user
+from api.maap_database import db
+from api.maapapp import app
+from api.models import initialize_sql
+from api.models.member import Member
+from api.models.member_session import MemberSession
+from api.models.personal_access_token import PersonalAccessToken
+from api.models.role import Role
+
+ITERATIONS = int(os.getenv('AUTH_BENCHMARK_ITERATIONS', 20))
+
+KEYCLOAK_SERVER_URL = "https://keycloak.benchmark.test/"
+KEYCLOAK_REALM = "maap"
+KEYCLOAK_JWKS_URL = f"{KEYCLOAK_SERVER_URL}realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs"
+EDL_BROKER_URL = f"{KEYCLOAK_SERVER_URL}realms/{KEYCLOAK_REALM}/broker/edl/token"
+JWT_AUDIENCE = "maap-api"
+KID = "benchmark-key"
+CAS_SECRET_KEY = "benchmark-cas-secret"
+DPS_MACHINE_TOKEN = "benchmark-dps-token"
+PAT = "maap-pat-benchmark"
+PROXY_TICKET = "PGT-benchmark-session"
+REJECTED_PROXY_TICKET = "PGT-benchmark-rejected"
+
+# Steady-state cost ceilings per request (after one warm-up request).
+AUTH_BUDGETS = {
+    'jwt_bearer': {'db_queries': 2, 'outbound_calls': 2},
+    'jwt_proxy_ticket': {'db_queries': 2, 'outbound_calls': 2},
+    'pat_api_key': {'db_queries': 4, 'outbound_calls': 0},
+    'pat_bearer': {'db_queries': 4, 'outbound_calls': 0},
+    'cas_proxy_ticket': {'db_queries': 3, 'outbound_calls': 0},
+    'cas_proxy_ticket_rejected': {'db_queries': 0, 'outbound_calls': 0},
+    'dps_token': {'db_queries': 0, 'outbound_calls': 0},
+    'cas_authorization': {'db_queries': 0, 'outbound_calls': 0},
+}
+
+CAS_PROXY_FAILURE = """<cas:serviceResponse xmlns:cas="http://www.yale.edu/tp/cas">
+    <cas:proxyFailure code="INVALID_TICKET">Ticket not recognized</cas:proxyFailure>
+</cas:serviceResponse>"""
+
+
+class _Counters:
+    def __init__(self):
+        self.db_queries = 0
+        self.outbound_calls = 0
+
+
+class _FakeUrlopenResponse:
+    def __init__(self, body):
+        self._body = body
+
+    def read(self):
+        return self._body.encode("utf-8")
+
+
+class TestAuthBenchmarks(unittest.TestCase):
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_jwk = json.loads(RSAAlgorithm.to_jwk(cls.private_key.public_key()))
+        public_jwk.update({"kid": KID, "use": "sig", "alg": "RS256"})
+        cls.jwks = {"keys": [public_jwk]}
+
+    @classmethod
+    def tearDownClass(cls):
+        output = os.getenv('AUTH_BENCHMARK_OUTPUT')
+        if output and cls.results:
+            with open(output, 'w') as f:
+                json.dump(cls.results, f, indent=2, sort_keys=True)
+
+    def setUp(self):
+        cas_auth.clear_proxy_ticket_caches()
+        self.counters = _Counters()
+        with app.app_context():
+            initialize_sql(db.engine)
+            self._clear_tables()
+            for role_id, role_name in ((Role.ROLE_GUEST, 'guest'), (Role.ROLE_MEMBER, 'member'), (Role.ROLE_ADMIN, 'admin')):
+                db.session.add(Role(id=role_id, role_name=role_name))
+            member = Member(username='benchuser', email='bench@example.com', first_name='Bench', last_name='User',
+                            role_id=Role.ROLE_MEMBER, status='active', urs_token='edl-token',
+                            creation_date=datetime.utcnow())
+            db.session.add(member)
+            db.session.commit()
+            db.session.add(MemberSession(member_id=member.id, session_key=PROXY_TICKET, creation_date=datetime.utcnow()))
+            db.session.add(PersonalAccessToken(user_identifier=member.email, user_origin='benchmark',
+                                               token_hash=hashlib.sha256(PAT.encode("utf-8")).hexdigest()))
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            self._clear_tables()
+
+    def _clear_tables(self):
+        db.session.query(PersonalAccessToken).delete()
+        db.session.query(MemberSession).delete()
+        db.session.query(Member).delete()
+        db.session.query(Role).delete()
+        db.session.commit()
+
+    def _jwt(self):
+        now = datetime.now(timezone.utc)
+        claims = {"preferred_username": "benchuser", "email": "bench@example.com", "aud": JWT_AUDIENCE,
+                  "iat": now, "exp": now + timedelta(hours=1)}
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": KID})
+
+    @contextmanager
+    def _stand_ins(self):
+        """Local Keycloak, CAS and database instrumentation for one benchmark."""
+        counters = self.counters
+
+        def fetch_jwks(_client):
+            counters.outbound_calls += 1
+            return self.jwks
+
+        def cas_urlopen(url, timeout=None):
+            counters.outbound_calls += 1
+            return _FakeUrlopenResponse(CAS_PROXY_FAILURE)
+
+        def count_statement(*_args):
+            counters.db_queries += 1
+
+        def broker_token(_request):
+            counters.outbound_calls += 1
+            return 200, {}, json.dumps({"access_token": "edl-token", "expires_in": 3600})
+
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps, \
+                patch.object(PyJWKClient, 'fetch_data', fetch_jwks), \
+                patch('api.auth.cas_auth.urlopen', cas_urlopen), \
+                patch.object(settings, 'KEYCLOAK_SERVER_URL', KEYCLOAK_SERVER_URL), \
+                patch.object(settings, 'KEYCLOAK_REALM', KEYCLOAK_REALM), \
+                patch.object(settings, 'KEYCLOAK_JWKS_URL', KEYCLOAK_JWKS_URL), \
+                patch.object(settings, 'JWT_AUDIENCE', JWT_AUDIENCE), \
+                patch.object(settings, 'CAS_SECRET_KEY', CAS_SECRET_KEY), \
+                patch.object(settings, 'DPS_MACHINE_TOKEN', DPS_MACHINE_TOKEN):
+            rsps.add_callback(responses.GET, EDL_BROKER_URL, callback=broker_token)
+            event.listen(db.engine, "before_cursor_execute", count_statement)
+            try:
+                yield
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    def _run(self, name, headers, expected_status=200, expected_user='benchuser'):
+        @login_required()
+        def protected():
+            user = get_authorized_user()
+            return user.username if user is not None else None
+
+        def one_request():
+            with app.test_request_context('/api/benchmark', headers=headers):
+                username = None
+                try:
+                    username = protected()
+                    status_code = 200
+                except HTTPException as e:
+                    status_code = e.code
+                finally:
+                    db.session.remove()
+            self.assertEqual(status_code, expected_status)
+            if status_code == 200:
+                self.assertEqual(username, expected_user)
+
+        with self._stand_ins():
+            one_request()  # warm-up: first-use caches, lazily created sessions
+
+            self.counters.db_queries = 0
+            self.counters.outbound_calls = 0
+            timings = []
+            for _ in range(ITERATIONS):
+                start = time.perf_counter()
+                one_request()
+                timings.append(time.perf_counter() - start)
+
+        measured = {
+            'db_queries': self.counters.db_queries / ITERATIONS,
+            'outbound_calls': self.counters.outbound_calls / ITERATIONS,
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(sorted(timings)[int(len(timings) * 0.95) - 1] * 1000, 3),
+        }
+        TestAuthBenchmarks.results[name] = measured
+        print(f"\nauth benchmark {name}: {measured}")
+
+        budget = AUTH_BUDGETS[name]
+        for metric in ('db_queries', 'outbound_calls'):
+            self.assertLessEqual(measured[metric], budget[metric],
+                                 f"{name}: {metric} per request regressed to {measured[metric]} "
+                                 f"(budget {budget[metric]})")
+        return measured
+
+    def test_jwt_bearer(self):
+        self._run('jwt_bearer', {'Authorization': f'Bearer {self._jwt()}'})
+
+    def test_jwt_proxy_ticket(self):
+        self._run('jwt_proxy_ticket', {'proxy-ticket': f'jwt:{self._jwt()}'})
+
+    def test_pat_api_key(self):
+        self._run('pat_api_key', {'X-MAAP-API-Key': PAT})
+
+    def test_pat_bearer(self):
+        self._run('pat_bearer', {'Authorization': f'Bearer {PAT}'})
+
+    def test_cas_proxy_ticket(self):
+        self._run('cas_proxy_ticket', {'proxy-ticket': PROXY_TICKET})
+
+    def test_cas_proxy_ticket_rejected(self):
+        self._run('cas_proxy_ticket_rejected', {'proxy-ticket': REJECTED_PROXY_TICKET}, expected_status=401)
+
+    def test_dps_token(self):
+        # Service-to-service methods authorize the call but carry no member identity
+        self._run('dps_token', {'dps-token': DPS_MACHINE_TOKEN}, expected_user=None)
+
+    def test_cas_authorization(self):
+        self._run('cas_authorization', {'cas-authorization': CAS_SECRET_KEY}, expected_user=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
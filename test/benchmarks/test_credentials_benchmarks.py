@@ -0,0 +1,156 @@
+"""
+AWS credentials microbenchmarks.
+
+Measures the requester pays credentials path against a local STS stand-in (an
+HTTP server answering AssumeRole), comparing a client created per request (the
+previous behaviour), the shared client with a cold credentials cache and the
+warm cache. Records per-request latency and STS calls, and fails when the STS
+calls exceed their budget in ``STS_BUDGETS``.
+
+Set ``CREDENTIALS_BENCHMARK_OUTPUT`` to a file path to also write the
+measurements as JSON.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import boto3
+
+from api import settings
+import api.endpoints.members as members
+
+ITERATIONS = int(os.getenv('CREDENTIALS_BENCHMARK_ITERATIONS', 20))
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/benchmark-requester-pays"
+
+# STS calls per request after one warm-up request
+STS_BUDGETS = {
+    'client_per_request': 1,
+    'shared_client_cold': 1,
+    'shared_client_warm': 0,
+}
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ASIABENCHMARK</AccessKeyId>
+      <SecretAccessKey>benchmark-secret</SecretAccessKey>
+      <SessionToken>benchmark-token</SessionToken>
+      <Expiration>{expiration}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROABENCHMARK:{session}</AssumedRoleId>
+      <Arn>{role_arn}/{session}</Arn>
+    </AssumedRoleUser>
+  </AssumeRoleResult>
+  <ResponseMetadata><RequestId>benchmark</RequestId></ResponseMetadata>
+</AssumeRoleResponse>"""
+
+
+class _StsStandIn(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        _StsStandIn.calls += 1
+        expiration = datetime.now(timezone.utc) + timedelta(seconds=int(params['DurationSeconds'][0]))
+        body = ASSUME_ROLE_RESPONSE.format(expiration=expiration.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                           session=params['RoleSessionName'][0],
+                                           role_arn=params['RoleArn'][0]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+class TestCredentialsBenchmarks(unittest.TestCase):
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StsStandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        output = os.getenv('CREDENTIALS_BENCHMARK_OUTPUT')
+        if output and cls.results:
+            with open(output, 'w') as f:
+                json.dump(cls.results, f, indent=2, sort_keys=True)
+
+    def setUp(self):
+        members.requester_pays_credentials_cache.clear()
+
+    def _sts_client(self):
+        return boto3.client('sts', region_name='us-east-1', endpoint_url=self.endpoint_url,
+                            aws_access_key_id='benchmark', aws_secret_access_key='benchmark')
+
+    def _run(self, name, one_request, before_each=None):
+        one_request()  # warm-up: botocore loaders, connection pool
+
+        _StsStandIn.calls = 0
+        timings = []
+        for _ in range(ITERATIONS):
+            if before_each is not None:
+                before_each()
+            start = time.perf_counter()
+            credentials = one_request()
+            timings.append(time.perf_counter() - start)
+            self.assertEqual(credentials['aws_session_token'], 'benchmark-token')
+
+        measured = {
+            'sts_calls': _StsStandIn.calls / ITERATIONS,
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(sorted(timings)[int(len(timings) * 0.95) - 1] * 1000, 3),
+        }
+        TestCredentialsBenchmarks.results[name] = measured
+        print(f"\ncredentials benchmark {name}: {measured}")
+
+        self.assertLessEqual(measured['sts_calls'], STS_BUDGETS[name],
+                             f"{name}: STS calls per request regressed to {measured['sts_calls']} "
+                             f"(budget {STS_BUDGETS[name]})")
+        return measured
+
+    def _client_per_request(self):
+        credentials = self._sts_client().assume_role(DurationSeconds=3600, RoleArn=ROLE_ARN,
+                                                     RoleSessionName='MAAP-session-benchuser')['Credentials']
+        return {'aws_session_token': credentials['SessionToken']}
+
+    def _shared_client(self):
+        return members.get_requester_pays_credentials('benchuser', members.requester_pays_duration(3600))
+
+    def test_requester_pays_cold_path(self):
+        """Tests the shared client is no slower than a client per request when every call goes to STS."""
+        per_request = self._run('client_per_request', self._client_per_request)
+
+        with patch.object(members, 'sts_client', self._sts_client()), \
+                patch.object(settings, 'AWS_REQUESTER_PAYS_BUCKET_ARN', ROLE_ARN):
+            shared = self._run('shared_client_cold', self._shared_client,
+                               before_each=members.requester_pays_credentials_cache.clear)
+
+        self.assertLessEqual(shared['median_ms'], per_request['median_ms'])
+
+    def test_requester_pays_warm_path(self):
+        with patch.object(members, 'sts_client', self._sts_client()), \
+                patch.object(settings, 'AWS_REQUESTER_PAYS_BUCKET_ARN', ROLE_ARN):
+            # Cached credentials only serve later requests of the same user and duration
+            members.get_requester_pays_credentials('benchuser', members.requester_pays_duration(3600))
+            self._run('shared_client_warm', self._shared_client)
+
+
+if __name__ == '__main__':
+    unittest.main()